@@ -0,0 +1,121 @@
+"""
+Benchmark da preparação de imagens para o OCR.
+
+Compara, para uma pasta de PDFs locais:
+  - ANTIGO: 1ª página colorida no DPI padrão, JPEG padrão, página inteira.
+  - NOVO:   tons de cinza no OCR_DPI, recorte do cabeçalho primeiro e página
+            inteira só se o cabeçalho não tiver CNPJ/IE/IM.
+
+Uso:
+    python benchmark_ocr.py <pasta_com_pdfs>            (só renderização/bytes)
+    python benchmark_ocr.py <pasta_com_pdfs> --vision   (também chama o Vision e
+                                                         mede latência e taxa de acerto do cabeçalho)
+"""
+import io
+import os
+import sys
+import time
+
+from pdf2image import convert_from_bytes
+from google.oauth2 import service_account
+
+from content_extractor import (DETECTED_POPPLER_PATH, ContentExtractor, _has_identifier,
+                               render_ocr_images, set_known_identifiers)
+
+KEY_FILE = 'credentials.json'
+
+
+def render_antigo(pdf_bytes):
+    images = convert_from_bytes(pdf_bytes, first_page=1, last_page=1, poppler_path=DETECTED_POPPLER_PATH)
+    if not images:
+        return None
+    buf = io.BytesIO()
+    images[0].save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    pasta = sys.argv[1]
+    usar_vision = "--vision" in sys.argv
+
+    extractor = None
+    if usar_vision:
+        creds = service_account.Credentials.from_service_account_file(
+            KEY_FILE, scopes=['https://www.googleapis.com/auth/cloud-platform'])
+        extractor = ContentExtractor(None, creds)
+
+        # Carrega os identificadores da planilha para medir o acerto igual à produção
+        try:
+            from reference_data import ReferenceLoader
+            ref_loader = ReferenceLoader(creds)
+            ref_loader.load_data()
+            set_known_identifiers(ref_loader.id_index)
+        except Exception as e:
+            print(f"⚠️ Planilha indisponível ({e}). Acerto medido só por CNPJ.")
+
+    pdfs = sorted(f for f in os.listdir(pasta) if f.lower().endswith('.pdf'))
+    print(f"📊 {len(pdfs)} PDFs em {pasta}\n")
+
+    tot = {"t_antigo": 0.0, "t_novo": 0.0, "b_antigo": 0, "b_novo": 0,
+           "ocr_antigo": 0.0, "ocr_novo": 0.0, "tentativas": 0, "acertos": 0}
+
+    for nome in pdfs:
+        with open(os.path.join(pasta, nome), 'rb') as f:
+            pdf_bytes = f.read()
+
+        inicio = time.perf_counter()
+        img_antiga = render_antigo(pdf_bytes)
+        tot["t_antigo"] += time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        img_full, img_crop = render_ocr_images(pdf_bytes)
+        tot["t_novo"] += time.perf_counter() - inicio
+
+        if not img_antiga or not img_full:
+            print(f"⚠️ {nome}: não foi possível renderizar")
+            continue
+
+        tot["b_antigo"] += len(img_antiga)
+        enviados = len(img_crop) if img_crop else len(img_full)
+        linha = f"📄 {nome}: antigo {len(img_antiga) / 1024:.0f} KB | cabeçalho {len(img_crop or b'') / 1024:.0f} KB | página {len(img_full) / 1024:.0f} KB"
+
+        if usar_vision:
+            inicio = time.perf_counter()
+            extractor._perform_ocr_on_image(img_antiga)
+            tot["ocr_antigo"] += time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            acerto = False
+            if img_crop:
+                tot["tentativas"] += 1
+                texto = extractor._perform_ocr_on_image(img_crop)
+                acerto = bool(texto) and _has_identifier(texto)
+                if acerto:
+                    tot["acertos"] += 1
+            if not acerto:
+                extractor._perform_ocr_on_image(img_full)
+                enviados += len(img_full) if img_crop else 0
+            tot["ocr_novo"] += time.perf_counter() - inicio
+            linha += f" | cabeçalho {'✅' if acerto else '❌'}"
+
+        tot["b_novo"] += enviados
+        print(linha)
+
+    n = len(pdfs) or 1
+    print("\n" + "=" * 60)
+    print(f"Renderização: antigo {tot['t_antigo'] / n:.2f}s/PDF | novo {tot['t_novo'] / n:.2f}s/PDF")
+    rotulo = "novo" if usar_vision else "novo (melhor caso: só cabeçalho)"
+    print(f"Bytes enviados ao Vision: antigo {tot['b_antigo'] / 1024:.0f} KB | {rotulo} {tot['b_novo'] / 1024:.0f} KB")
+    if usar_vision:
+        taxa = (tot['acertos'] / tot['tentativas'] * 100) if tot['tentativas'] else 0.0
+        print(f"Latência OCR: antigo {tot['ocr_antigo'] / n:.2f}s/PDF | novo {tot['ocr_novo'] / n:.2f}s/PDF")
+        print(f"Cabeçalho primeiro: {tot['acertos']}/{tot['tentativas']} resolvidos ({taxa:.0f}%)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import google_auth_httplib2
+import httplib2
+from google.cloud import bigquery, vision
+from googleapiclient.discovery import build
+
+
+class ClientRegistry:
+    """
+    Registro de clientes Google reaproveitados entre os arquivos processados.
+
+    - Drive: um service por thread (httplib2 NÃO é thread-safe), com a conexão
+      HTTP mantida aberta entre downloads.
+    - Vision e BigQuery: um cliente único por processo (ambos são thread-safe).
+
+    Também mede o tempo gasto criando clientes, para mostrar no fim do job
+    quanto setup deixou de ser repetido por arquivo.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shared_clients = {}
+
+        # Instrumentação: {tipo: [qtd_criacoes, segundos_criando, qtd_reusos]}
+        self._stats = {
+            "drive": [0, 0.0, 0],
+            "vision": [0, 0.0, 0],
+            "bigquery": [0, 0.0, 0],
+        }
+
+    def _record(self, kind, elapsed=None):
+        with self._lock:
+            if elapsed is None:
+                self._stats[kind][2] += 1
+            else:
+                self._stats[kind][0] += 1
+                self._stats[kind][1] += elapsed
+
+    def drive(self):
+        """Service do Drive da thread atual (criado na primeira chamada)."""
+        service = getattr(self._local, "drive", None)
+        if service is not None:
+            self._record("drive")
+            return service
+
+        inicio = time.perf_counter()
+        http = google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=120))
+        service = build('drive', 'v3', http=http, cache_discovery=False)
+        self._record("drive", time.perf_counter() - inicio)
+
+        self._local.drive = service
+        return service
+
+    def _shared(self, kind, factory):
+        """Cria (uma única vez, sob lock) e devolve um cliente compartilhado."""
+        client = self._shared_clients.get(kind)
+        if client is not None:
+            self._record(kind)
+            return client
+
+        with self._lock:
+            client = self._shared_clients.get(kind)
+            if client is None:
+                inicio = time.perf_counter()
+                client = factory()
+                self._shared_clients[kind] = client
+                self._stats[kind][0] += 1
+                self._stats[kind][1] += time.perf_counter() - inicio
+                return client
+        self._record(kind)
+        return client
+
+    def vision(self):
+        """Cliente do Vision compartilhado por todas as threads."""
+        return self._shared("vision", lambda: vision.ImageAnnotatorClient(credentials=self.creds))
+
+    def bigquery(self):
+        """Cliente do BigQuery compartilhado por todas as threads."""
+        return self._shared("bigquery", lambda: bigquery.Client(credentials=self.creds))
+
+    def report(self):
+        """Resumo do setup de clientes: criações, custo médio e tempo economizado."""
+        linhas = ["⏱️ [CLIENTES] Setup de clientes Google:"]
+        total_economizado = 0.0
+        with self._lock:
+            for kind, (criados, segundos, reusos) in self._stats.items():
+                media = segundos / criados if criados else 0.0
+                economizado = media * reusos
+                total_economizado += economizado
+                linhas.append(
+                    f"   ∟ {kind}: {criados} criado(s) em {segundos:.2f}s "
+                    f"(média {media:.3f}s) | {reusos} reuso(s) ≈ {economizado:.2f}s evitados"
+                )
+        linhas.append(f"   ∟ Total de setup evitado: ≈ {total_economizado:.2f}s")
+        return "\n".join(linhas)
@@ -1,10 +1,17 @@
 # config.py
+import os
 
 # IDs do Google
 SPREADSHEET_ID = "19_zhLF-PEPflLtK1LCWsWUDsyUZxB_--VNKjRD2LpOE"
 ROOT_FOLDER_ID = "1T7bdlFVEc30gHzvCc42310fsRfMXPPW9"
 
 BQ_TABLE_ID = "auditor-processos.auditoria_fiscal.registros_auditoria"
+BQ_TABLE_DISCARDED = "auditor-processos.auditoria_fiscal.controle_descartados"
+BQ_TABLE_IGNORED = "auditor-processos.auditoria_fiscal.controle_ignorados"
+# Cópia da planilha mestre de empresas (master_sync.py), com flag de ativa/inativa
+BQ_TABLE_MASTER = "auditor-processos.auditoria_fiscal.empresas_obrigacoes"
+# Estado atual (descartes e alocações já aplicados), particionado por competência do painel
+BQ_TABLE_CURRENT = "auditor-processos.auditoria_fiscal.registros_atuais"
 
 # Configurações de Colunas (Baseado na sua descrição)
 # Índices (Começando do 0: A=0, B=1, ... D=3)
@@ -18,4 +25,39 @@ COL_IM = 12        # Coluna M
 CNPJ_TAXBASE = "49756007000127"
 
 # Pastas para ignorar
-IGNORE_FOLDERS = ["01 - ENTRADAS", "02 - SAÍDAS"]
\ No newline at end of file
+IGNORE_FOLDERS = ["01 - ENTRADAS", "02 - SAÍDAS"]
+
+# Extração de texto: máximo de páginas lidas pelo PDFMiner (para na 1ª com CNPJ/IE/IM).
+# 0 = lê o PDF inteiro com layout completo (modo antigo).
+EXTRACT_MAX_PAGES = 5
+
+# OCR (fallback): renderização da 1ª página em tons de cinza.
+OCR_DPI = 200            # pdf2image usa 200 por padrão; acima disso só aumenta bytes/latência
+OCR_HEADER_CROP = 0.35   # Fração do topo da página tentada primeiro (0 = desliga o recorte)
+OCR_JPEG_QUALITY = 80
+
+# Cache local de conteúdo (texto PDF/OCR + CNPJ por hash do arquivo)
+CONTENT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "conteudo.sqlite")
+CONTENT_CACHE_MAX_AGE_DAYS = 180
+CONTENT_CACHE_MAX_MB = 200
+
+# Árvore de pastas do Drive (prefetch do DriveWatcher), persistida entre execuções
+FOLDER_TREE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "drive_folders.json")
+FOLDER_TREE_FULL_REFRESH_DAYS = 7  # Releitura completa periódica (pega pastas movidas)
+
+# Modo incremental (main.py --incremental): token do feed de alterações do Drive
+CHANGES_TOKEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "drive_changes_token.json")
+
+# Anti-duplicata: índice local de arquivos já gravados (Bloom + SQLite), sincronizado
+# incrementalmente com o BigQuery pela data_processamento
+PROCESSED_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "processados.sqlite")
+# Pula também arquivos com ID novo mas conteúdo idêntico (mesmo md5) a um já gravado
+DEDUP_BY_CONTENT = False
+
+# main.py --intervalo: relê a planilha de clientes a cada N minutos (entre rodadas)
+PLANILHA_RECARGA_MIN = 60
+
+# Hub (Flask): ao fim de cada rodada o pipeline avisa quais competências do
+# painel mudaram, para o cache do painel ser invalidado. Vazio = não avisa.
+HUB_URL = os.environ.get("AUDIT_HUB_URL", "")
+HUB_INTERNAL_TOKEN = os.environ.get("HUB_INTERNAL_TOKEN", "")
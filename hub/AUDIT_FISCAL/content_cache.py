@@ -0,0 +1,127 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class ContentCache:
+    """
+    Cache persistente (SQLite) do resultado da extração de cada PDF, indexado
+    pelo conteúdo e não pelo ID do Drive:
+        - "md5:<md5Checksum do Drive>"  (dispensa até o download)
+        - "sha256:<hash dos bytes>"      (quando o Drive não informa o md5)
+
+    Guarda o texto do PDFMiner, o texto do OCR e o CNPJ detectado, então
+    reprocessar um arquivo já visto (re-upload, reexecução do dia, arquivo
+    fora da janela de 7 dias) não chama o Vision de novo.
+
+    Despejo: entradas mais velhas que max_age_days e, se o total de texto
+    passar de max_bytes, as menos usadas recentemente.
+    """
+
+    def __init__(self, path, max_age_days=180, max_bytes=200 * 1024 * 1024):
+        self.path = path
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conteudo (
+                chave TEXT PRIMARY KEY,
+                texto_pdf TEXT,
+                texto_ocr TEXT,
+                cnpj TEXT,
+                usou_ocr INTEGER NOT NULL,
+                tamanho INTEGER NOT NULL,
+                criado_em REAL NOT NULL,
+                usado_em REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conteudo_usado ON conteudo (usado_em)")
+        self._conn.commit()
+
+    @staticmethod
+    def key_for(file_meta, pdf_bytes=None):
+        """Chave de conteúdo: md5 do Drive se existir, senão SHA-256 dos bytes."""
+        md5 = (file_meta or {}).get('md5Checksum')
+        if md5:
+            return f"md5:{md5}"
+        if pdf_bytes:
+            return f"sha256:{hashlib.sha256(pdf_bytes).hexdigest()}"
+        return None
+
+    def get(self, chave):
+        """Retorna (texto_final, cnpj, usou_ocr) ou None."""
+        if not chave:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT texto_pdf, texto_ocr, cnpj, usou_ocr FROM conteudo WHERE chave = ?", (chave,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._conn.execute("UPDATE conteudo SET usado_em = ? WHERE chave = ?", (time.time(), chave))
+            self._conn.commit()
+
+        texto_pdf, texto_ocr, cnpj, usou_ocr = row
+        return (texto_ocr if usou_ocr else texto_pdf), cnpj, bool(usou_ocr)
+
+    def put(self, chave, texto_pdf, texto_ocr, cnpj, usou_ocr):
+        if not chave:
+            return
+
+        tamanho = len(texto_pdf or "") + len(texto_ocr or "")
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conteudo VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chave, texto_pdf, texto_ocr, cnpj, int(bool(usou_ocr)), tamanho, agora, agora)
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """Remove entradas velhas e, se preciso, as menos usadas até caber em max_bytes."""
+        limite = time.time() - self.max_age_days * 86400
+        with self._lock:
+            removidas = self._conn.execute("DELETE FROM conteudo WHERE usado_em < ?", (limite,)).rowcount
+
+            total = self._conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM conteudo").fetchone()[0]
+            if total > self.max_bytes:
+                excesso = total - self.max_bytes
+                acumulado = 0
+                chaves = []
+                for chave, tamanho in self._conn.execute("SELECT chave, tamanho FROM conteudo ORDER BY usado_em"):
+                    chaves.append((chave,))
+                    acumulado += tamanho
+                    if acumulado >= excesso:
+                        break
+                self._conn.executemany("DELETE FROM conteudo WHERE chave = ?", chaves)
+                removidas += len(chaves)
+
+            self._conn.commit()
+
+        if removidas:
+            print(f"🧹 [CACHE] {removidas} entrada(s) removidas do cache de conteúdo.")
+        return removidas
+
+    def report(self):
+        total = self.hits + self.misses
+        taxa = (self.hits / total * 100) if total else 0.0
+        return f"💾 [CACHE] Conteúdo: {self.hits} hit(s), {self.misses} miss(es) ({taxa:.0f}% reaproveitado)"
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
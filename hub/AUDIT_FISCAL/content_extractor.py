@@ -1,12 +1,15 @@
 import io
 import os
 import re
+import threading
 from googleapiclient.http import MediaIoBaseDownload
-from pdfminer.high_level import extract_text
-from pdfminer.layout import LAParams
+from pdfminer.high_level import extract_text, extract_pages
+from pdfminer.layout import LAParams, LTTextContainer
 from google.cloud import vision
 from pdf2image import convert_from_bytes
-from config import CNPJ_TAXBASE
+from config import CNPJ_TAXBASE, EXTRACT_MAX_PAGES, OCR_DPI, OCR_HEADER_CROP, OCR_JPEG_QUALITY
+from content_cache import ContentCache
+from id_scanner import IdentifierIndex, find_cnpjs
 
 
 # --- FUNÇÃO DE RASTREAMENTO INTELIGENTE DO POPPLER ---
@@ -29,77 +32,302 @@ def find_poppler_bin():
 DETECTED_POPPLER_PATH = find_poppler_bin()
 
 
+# Regex captura: XX.XXX.XXX/XXXX-XX ou apenas números (14 dígitos)
+# (a busca em si é feita pelo scanner único do id_scanner.py)
+CNPJ_PATTERN = re.compile(r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}')
+
+
+# --- ETAPAS DE CPU (funções de módulo para rodarem em ProcessPoolExecutor) ---
+def clean_cnpj(cnpj):
+    if not cnpj: return ""
+    return "".join(filter(str.isdigit, cnpj))
+
+
+def extract_best_cnpj(text):
+    if not text: return None
+
+    # Em ordem de aparição (o 1º CNPJ do documento costuma ser o do contribuinte)
+    found = find_cnpjs(text)
+
+    target_taxbase = clean_cnpj(CNPJ_TAXBASE)
+
+    # Regra: Se tiver Taxbase + Outro, remove Taxbase e fica com o Outro
+    if len(found) > 1 and target_taxbase in found:
+        found.remove(target_taxbase)
+
+    if found:
+        return found[0]
+
+    return None
+
+
+def needs_ocr(cnpj):
+    """Regra: Se CNPJ é None OU se o CNPJ encontrado for o da Taxbase (que ignoramos)"""
+    return (cnpj is None) or (cnpj == clean_cnpj(CNPJ_TAXBASE))
+
+
+def pdf_to_txt_layout(pdf_bytes):
+    try:
+        laparams = LAParams()
+        text = extract_text(io.BytesIO(pdf_bytes), laparams=laparams)
+        return text if text else ""
+    except Exception:
+        return ""
+
+
+# Identificadores (CNPJ/IE/IM) das empresas da planilha, para o acerto do recorte do OCR.
+# Preenchido por set_known_identifiers (no processo principal ou no initializer do ProcessPool).
+_KNOWN_INDEX = None
+
+
+def set_known_identifiers(ids):
+    """Recebe o IdentifierIndex do ReferenceLoader (ou só uma lista de identificadores)."""
+    global _KNOWN_INDEX
+    if ids is None or isinstance(ids, IdentifierIndex):
+        _KNOWN_INDEX = ids
+    else:
+        _KNOWN_INDEX = IdentifierIndex.from_ids(ids)
+
+
+def _has_identifier(page_text):
+    """True se a página tem um identificador de cliente (ignorando a Taxbase)."""
+    taxbase = clean_cnpj(CNPJ_TAXBASE)
+    if _KNOWN_INDEX:
+        return _KNOWN_INDEX.has_client(page_text)
+    # Sem a planilha carregada: basta um CNPJ que não seja o da Taxbase
+    return any(c != taxbase for c in find_cnpjs(page_text))
+
+
+def _has_client_cnpj(page_text):
+    """True se a página tem um CNPJ que não é o da Taxbase (parada antecipada)."""
+    taxbase = clean_cnpj(CNPJ_TAXBASE)
+    return any(c != taxbase for c in find_cnpjs(page_text))
+
+
+def pdf_to_txt_first_hit(pdf_bytes, max_pages=EXTRACT_MAX_PAGES):
+    """
+    Extração rápida: lê as páginas uma a uma (no máximo max_pages) e para na
+    primeira que tiver um CNPJ de cliente. Só IE/IM não basta: o texto cortado
+    ficaria sem CNPJ e o documento iria para o OCR à toa. Usa LAParams sem a
+    análise avançada de layout (boxes_flow=None), que é o que mais custa no PDFMiner.
+    Recibos SPED/EFD de centenas de páginas param na 1ª página.
+    Com max_pages=0, cai na extração completa (pdf_to_txt_layout).
+    """
+    if not max_pages:
+        return pdf_to_txt_layout(pdf_bytes)
+
+    try:
+        laparams = LAParams(boxes_flow=None, detect_vertical=False, all_texts=False)
+        pages_text = []
+        for page in extract_pages(io.BytesIO(pdf_bytes), laparams=laparams, maxpages=max_pages):
+            page_text = "".join(el.get_text() for el in page if isinstance(el, LTTextContainer))
+            pages_text.append(page_text)
+            if _has_client_cnpj(page_text):
+                break
+        return "\f".join(pages_text)
+    except Exception:
+        return ""
+
+
+def _encode_jpeg(image):
+    img_byte_arr = io.BytesIO()
+    image.save(img_byte_arr, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+    return img_byte_arr.getvalue()
+
+
+def render_ocr_images(pdf_bytes, dpi=OCR_DPI, header_crop=OCR_HEADER_CROP):
+    """
+    Prepara a 1ª página para o OCR: renderiza já em tons de cinza no DPI
+    configurado e gera também um recorte do cabeçalho (onde o CNPJ costuma
+    estar), que é mandado primeiro ao Vision.
+    Retorna (jpg_pagina, jpg_cabecalho) — qualquer um pode ser None.
+    """
+    images = convert_from_bytes(
+        pdf_bytes,
+        dpi=dpi,
+        first_page=1,
+        last_page=1,
+        grayscale=True,
+        poppler_path=DETECTED_POPPLER_PATH
+    )
+    if not images:
+        return None, None
+
+    page = images[0]
+    full = _encode_jpeg(page)
+
+    crop = None
+    if header_crop:
+        width, height = page.size
+        crop = _encode_jpeg(page.crop((0, 0, width, int(height * header_crop))))
+
+    page.close()
+    return full, crop
+
+
+# Estatísticas do OCR "cabeçalho primeiro" (compartilhadas entre as threads)
+_OCR_STATS_LOCK = threading.Lock()
+OCR_STATS = {"chamadas_vision": 0, "bytes_enviados": 0, "tentativas_cabecalho": 0, "acertos_cabecalho": 0}
+
+
+def _count_ocr(n_bytes, cabecalho=False, acerto=False):
+    with _OCR_STATS_LOCK:
+        OCR_STATS["chamadas_vision"] += 1
+        OCR_STATS["bytes_enviados"] += n_bytes
+        if cabecalho:
+            OCR_STATS["tentativas_cabecalho"] += 1
+            if acerto:
+                OCR_STATS["acertos_cabecalho"] += 1
+
+
+def ocr_stats_report():
+    with _OCR_STATS_LOCK:
+        st = dict(OCR_STATS)
+    tentativas = st["tentativas_cabecalho"]
+    taxa = (st["acertos_cabecalho"] / tentativas * 100) if tentativas else 0.0
+    return (f"👁️ [OCR] {st['chamadas_vision']} chamada(s) ao Vision | "
+            f"{st['bytes_enviados'] / 1024:.0f} KB enviados | "
+            f"cabeçalho resolveu {st['acertos_cabecalho']}/{tentativas} ({taxa:.0f}%)")
+
+
+class VisionError(Exception):
+    """Erro devolvido pela API do Google Vision na resposta."""
+
+
+def ocr_error_text(error):
+    """Traduz exceções do Poppler/OCR no texto de erro gravado no registro."""
+    error_msg = str(error)
+    if isinstance(error, VisionError):
+        return f"ERRO API VISION: {error_msg}"
+    if "Unable to get page count" in error_msg:
+        return f"ERRO_POPPLER: Falha ao executar binário em {DETECTED_POPPLER_PATH}."
+    return f"ERRO_OCR_GERAL: {error_msg}"
+
+
+def analyze_pdf(pdf_bytes):
+    """
+    Etapa de CPU completa de um PDF: PDFMiner + busca de CNPJ e, se precisar
+    de OCR, rasterização da 1ª página.
+    Retorna dict: text, cnpj, needs_ocr, image / image_crop (bytes JPG ou None), error.
+    """
+    text_soft = pdf_to_txt_first_hit(pdf_bytes)
+    cnpj = extract_best_cnpj(text_soft)
+    result = {"text": text_soft, "cnpj": cnpj, "needs_ocr": needs_ocr(cnpj),
+              "image": None, "image_crop": None, "error": None}
+
+    if result["needs_ocr"]:
+        try:
+            result["image"], result["image_crop"] = render_ocr_images(pdf_bytes)
+        except Exception as e:
+            result["error"] = ocr_error_text(e)
+
+    return result
+
+
 class ContentExtractor:
-    def __init__(self, drive_service, creds):
+    def __init__(self, drive_service, creds, vision_client=None, cache=None):
         self.drive_service = drive_service
         self.creds = creds  # <--- ARMAZENA AS CREDENCIAIS PARA O VISION
-        self.vision_client = None
-        # Regex captura: XX.XXX.XXX/XXXX-XX ou apenas números (14 dígitos)
-        self.cnpj_pattern = re.compile(r'\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}')
+        # Pode vir pronto do ClientRegistry (reaproveitado entre arquivos)
+        self.vision_client = vision_client
+        # Cache de conteúdo (opcional): evita download/OCR de PDFs já vistos
+        self.cache = cache
+        self.cnpj_pattern = CNPJ_PATTERN
 
-    def process_file(self, file_id, file_name):
+    def process_file(self, file_id, file_name, md5=None):
         """
         Fluxo Principal:
+        0. Se o conteúdo já está no cache (md5 do Drive), devolve direto.
         1. Baixa o PDF.
         2. Tenta ler texto direto (rápido).
         3. Se falhar ou for Taxbase -> Usa OCR com Poppler + Vision.
         Retorna: (texto_final, cnpj_encontrado, bool_usou_ocr)
         """
+        chave = ContentCache.key_for({'md5Checksum': md5})
+        cached = self.cached_result(chave)
+        if cached:
+            return cached
+
         pdf_bytes = self._download_file(file_id)
 
         if not pdf_bytes:
             return None, None, False
 
+        # Sem md5 do Drive: tenta de novo pelo SHA-256 dos bytes
+        if not chave:
+            chave = ContentCache.key_for(None, pdf_bytes)
+            cached = self.cached_result(chave)
+            if cached:
+                return cached
+
         # --- TENTATIVA 1: Extração via Software (PDFMiner) ---
-        text_soft = self._pdf_to_txt_layout(pdf_bytes)
-        cnpj = self._extract_best_cnpj(text_soft)
-
-        # --- VALIDAÇÃO: Precisa de OCR? ---
-        # Regra: Se CNPJ é None OU se o CNPJ encontrado for o da Taxbase (que ignoramos)
-        needs_ocr = (cnpj is None) or (cnpj == self._clean_cnpj(CNPJ_TAXBASE))
-
-        if needs_ocr:
-            # Verifica se o Poppler foi encontrado antes de tentar usar
-            # MODIFICADO: No Cloud Run (Linux), esperamos que o poppler esteja no PATH (instalado via apt-get).
-            # Então se DETECTED_POPPLER_PATH for None, permitimos tentar sem path explícito.
-            # if not DETECTED_POPPLER_PATH:
-            #    return "ERRO_POPPLER_FATAL: ...", cnpj, False
-            pass
-
-            # --- TENTATIVA 2: OCR (PDF -> Imagem -> Vision) ---
-            try:
-                # Converte a 1ª página do PDF em Imagem (JPG)
-                images = convert_from_bytes(
-                    pdf_bytes,
-                    first_page=1,
-                    last_page=1,
-                    poppler_path=DETECTED_POPPLER_PATH
-                )
-
-                if images:
-                    img_byte_arr = io.BytesIO()
-                    images[0].save(img_byte_arr, format='JPEG')
-                    image_content = img_byte_arr.getvalue()
-
-                    # Manda para o Google Vision
-                    text_ocr = self._perform_ocr_on_image(image_content)
-
-                    # Tenta achar CNPJ no texto do OCR
-                    cnpj_ocr = self._extract_best_cnpj(text_ocr)
-
-                    if cnpj_ocr:
-                        return text_ocr, cnpj_ocr, True
-                    else:
-                        return text_ocr, cnpj, True
-
-            except Exception as e:
-                error_msg = str(e)
-                if "Unable to get page count" in error_msg:
-                    return f"ERRO_POPPLER: Falha ao executar binário em {DETECTED_POPPLER_PATH}.", cnpj, False
-
-                return f"ERRO_OCR_GERAL: {error_msg}", cnpj, False
-
-        return text_soft, cnpj, False
+        # --- TENTATIVA 2 (se precisar): 1ª página rasterizada para OCR ---
+        analysis = analyze_pdf(pdf_bytes)
+        resultado = self.finish_with_ocr(analysis)
+        self.store_in_cache(chave, analysis, resultado)
+        return resultado
+
+    def cached_result(self, chave):
+        if self.cache is None or not chave:
+            return None
+        return self.cache.get(chave)
+
+    def store_in_cache(self, chave, analysis, resultado):
+        """Guarda o resultado no cache de conteúdo (erros de OCR/Poppler não são guardados)."""
+        if self.cache is None or not chave:
+            return
+        texto, cnpj, usou_ocr = resultado
+        if texto is None or analysis["error"]:
+            return
+        self.cache.put(chave, analysis["text"], texto if usou_ocr else None, cnpj, usou_ocr)
+
+    def finish_with_ocr(self, analysis):
+        """
+        Completa o resultado de analyze_pdf: manda a imagem para o Google
+        Vision quando a etapa de CPU pediu OCR. Erro no OCR fica também em
+        analysis["error"] (o resultado não vai para o cache).
+        Retorna: (texto_final, cnpj_encontrado, bool_usou_ocr)
+        """
+        cnpj = analysis["cnpj"]
+
+        if not analysis["needs_ocr"]:
+            return analysis["text"], cnpj, False
+
+        # MODIFICADO: No Cloud Run (Linux), esperamos que o poppler esteja no PATH (instalado via apt-get).
+        # Então se DETECTED_POPPLER_PATH for None, permitimos tentar sem path explícito.
+        if analysis["error"]:
+            return analysis["error"], cnpj, False
+
+        if not analysis["image"]:
+            return analysis["text"], cnpj, False
+
+        try:
+            text_ocr = None
+
+            # 1º: só o cabeçalho (imagem menor, mais rápida). Se achar um identificador, basta.
+            if analysis.get("image_crop"):
+                text_crop = self._perform_ocr_on_image(analysis["image_crop"])
+                acerto = bool(text_crop) and _has_identifier(text_crop)
+                _count_ocr(len(analysis["image_crop"]), cabecalho=True, acerto=acerto)
+                if acerto:
+                    text_ocr = text_crop
+
+            # 2º: página inteira
+            if text_ocr is None:
+                # Manda para o Google Vision
+                text_ocr = self._perform_ocr_on_image(analysis["image"])
+                _count_ocr(len(analysis["image"]))
+        except Exception as e:
+            analysis["error"] = ocr_error_text(e)
+            return analysis["error"], cnpj, False
+
+        # Tenta achar CNPJ no texto do OCR
+        cnpj_ocr = self._extract_best_cnpj(text_ocr)
+
+        if cnpj_ocr:
+            return text_ocr, cnpj_ocr, True
+        else:
+            return text_ocr, cnpj, True
 
     def _download_file(self, file_id):
         try:
@@ -114,33 +342,13 @@ class ContentExtractor:
             return None
 
     def _pdf_to_txt_layout(self, pdf_bytes):
-        try:
-            laparams = LAParams()
-            text = extract_text(io.BytesIO(pdf_bytes), laparams=laparams)
-            return text if text else ""
-        except Exception:
-            return ""
+        return pdf_to_txt_first_hit(pdf_bytes)
 
     def _clean_cnpj(self, cnpj):
-        if not cnpj: return ""
-        return "".join(filter(str.isdigit, cnpj))
+        return clean_cnpj(cnpj)
 
     def _extract_best_cnpj(self, text):
-        if not text: return None
-
-        found = self.cnpj_pattern.findall(text)
-        unique_cnpjs = set(self._clean_cnpj(c) for c in found)
-
-        target_taxbase = self._clean_cnpj(CNPJ_TAXBASE)
-
-        # Regra: Se tiver Taxbase + Outro, remove Taxbase e fica com o Outro
-        if len(unique_cnpjs) > 1 and target_taxbase in unique_cnpjs:
-            unique_cnpjs.remove(target_taxbase)
-
-        if unique_cnpjs:
-            return list(unique_cnpjs)[0]
-
-        return None
+        return extract_best_cnpj(text)
 
     def _perform_ocr_on_image(self, image_bytes):
         # CORREÇÃO: Passa as credenciais explicitamente para o cliente
@@ -152,7 +360,7 @@ class ContentExtractor:
             response = self.vision_client.document_text_detection(image=image)
 
             if response.error.message:
-                return f"ERRO API VISION: {response.error.message}"
+                raise VisionError(response.error.message)
 
             return response.full_text_annotation.text
         except Exception as e:
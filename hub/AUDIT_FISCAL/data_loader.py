@@ -4,11 +4,12 @@ from datetime import datetime
 
 class BigQueryLoader:
     # MUDANÇA AQUI: Adicionamos o parâmetro 'credentials'
-    def __init__(self, table_full_id, credentials):
+    def __init__(self, table_full_id, credentials, client=None):
         # Ex: "seu-projeto.auditoria_fiscal.registros_auditoria"
         self.table_id = table_full_id
         # MUDANÇA AQUI: Passamos as credentials para o Client
-        self.client = bigquery.Client(credentials=credentials)
+        # Se já houver um client compartilhado (ClientRegistry), reaproveita
+        self.client = client if client is not None else bigquery.Client(credentials=credentials)
 
     def insert_record(self, record_dict):
         """
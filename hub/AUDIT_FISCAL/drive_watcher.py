@@ -1,14 +1,249 @@
-from datetime import datetime, timedelta
+import json
+import os
+from datetime import datetime, timedelta, timezone
 from googleapiclient.discovery import build
-from config import ROOT_FOLDER_ID, IGNORE_FOLDERS
+from config import (ROOT_FOLDER_ID, IGNORE_FOLDERS, FOLDER_TREE_PATH, FOLDER_TREE_FULL_REFRESH_DAYS,
+                    CHANGES_TOKEN_PATH)
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
 
 
 class DriveWatcher:
-    def __init__(self, creds):
-        self.service = build('drive', 'v3', credentials=creds)
+    def __init__(self, creds, folder_tree_path=FOLDER_TREE_PATH, changes_token_path=CHANGES_TOKEN_PATH, service=None):
+        # service: permite injetar um Drive falso (fake_drive.FakeDriveService) nos testes offline
+        self.service = service if service is not None else build('drive', 'v3', credentials=creds)
         # Cache para não ficar batendo na API toda hora
         # True = Pasta Segura | False = Pasta Proibida
         self.folder_cache = {ROOT_FOLDER_ID: True}
+        # Árvore de pastas do Drive: {id: [nome, id_pai]} (persistida entre execuções)
+        self.folder_tree_path = folder_tree_path
+        self.folder_tree = {}
+        self.folder_tree_synced_at = None
+        self.changes_token_path = changes_token_path
+        self.ignore_list_upper = [f.upper() for f in IGNORE_FOLDERS]
+
+    # ------------------------------------------------------------------
+    # ÁRVORE DE PASTAS (prefetch em lote + persistência)
+    # ------------------------------------------------------------------
+    def prefetch_folder_tree(self):
+        """
+        Carrega o mapa de pastas do disco e atualiza com o Drive:
+        - sem mapa (ou mapa com mais de FOLDER_TREE_FULL_REFRESH_DAYS): lista TODAS as pastas;
+        - senão: só as pastas alteradas desde a última sincronização, e tira do
+          mapa as que foram para a lixeira.
+        Depois calcula o status (segura/proibida) de todas as pastas de uma vez,
+        então a validação de cada arquivo vira uma consulta em dicionário.
+        """
+        synced_at = self._load_folder_tree()
+
+        agora = datetime.now(timezone.utc)
+        full = synced_at is None or (agora - synced_at) > timedelta(days=FOLDER_TREE_FULL_REFRESH_DAYS)
+
+        query = f"mimeType='{FOLDER_MIME}' and trashed=false"
+        if not full:
+            query += f" and modifiedTime > '{synced_at.strftime('%Y-%m-%dT%H:%M:%S')}'"
+        else:
+            self.folder_tree = {}
+
+        try:
+            total = 0
+            for folder in self._list_folders(query):
+                parents = folder.get('parents', [])
+                self.folder_tree[folder['id']] = [folder.get('name', ''), parents[0] if parents else None]
+                total += 1
+
+            removidas = 0
+            if not full:
+                # Pasta na lixeira não aparece na busca acima: sai do mapa aqui
+                # (excluídas de vez chegam pelo feed de alterações ou pela releitura completa)
+                for folder in self._list_folders(f"mimeType='{FOLDER_MIME}' and trashed=true"):
+                    if self.folder_tree.pop(folder['id'], None) is not None:
+                        removidas += 1
+                if total or removidas:
+                    # Pasta renomeada/movida/removida muda o status das filhas: recalcula tudo
+                    self.folder_cache = {ROOT_FOLDER_ID: True}
+
+            modo = "completa" if full else "incremental"
+            print(f"🌳 [PASTAS] Sincronização {modo}: {total} pasta(s) lidas, {removidas} removida(s), "
+                  f"{len(self.folder_tree)} no mapa.")
+            self.folder_tree_synced_at = agora
+            self._save_folder_tree(agora)
+        except Exception as e:
+            print(f"⚠️ [PASTAS] Falha ao sincronizar árvore de pastas: {e}. Usando mapa em disco/validação individual.")
+
+        self._compute_folder_status()
+
+    def _list_folders(self, query):
+        page_token = None
+        while True:
+            response = self.service.files().list(
+                q=query,
+                spaces='drive',
+                corpora='allDrives',
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                pageSize=1000,
+                fields="nextPageToken, files(id, name, parents)",
+                pageToken=page_token
+            ).execute()
+            yield from response.get('files', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+
+    def _load_folder_tree(self):
+        if not os.path.exists(self.folder_tree_path):
+            return None
+        try:
+            with open(self.folder_tree_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.folder_tree = data.get('folders', {})
+            self.folder_tree_synced_at = datetime.fromisoformat(data['synced_at'])
+            return self.folder_tree_synced_at
+        except Exception as e:
+            print(f"⚠️ [PASTAS] Mapa de pastas em disco inválido ({e}). Refazendo do zero.")
+            self.folder_tree = {}
+            return None
+
+    def _save_folder_tree(self, synced_at):
+        pasta = os.path.dirname(self.folder_tree_path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        # Escrita atômica: grava em .tmp e renomeia
+        tmp_path = self.folder_tree_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'synced_at': synced_at.isoformat(), 'folders': self.folder_tree}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.folder_tree_path)
+
+    def _compute_folder_status(self):
+        """Preenche folder_cache para todas as pastas do mapa (mesmas regras de _check_folder_safety)."""
+        for folder_id in self.folder_tree:
+            if folder_id in self.folder_cache:
+                continue
+
+            # Sobe a cadeia até achar algo já resolvido, guardando o caminho
+            caminho = []
+            atual = folder_id
+            status = None
+            while atual is not None:
+                if atual in self.folder_cache:
+                    status = self.folder_cache[atual]
+                    break
+                if atual not in self.folder_tree or atual in caminho:
+                    break  # Fora do mapa (ou ciclo): deixa para a validação via API
+                nome = (self.folder_tree[atual][0] or '').upper()
+                caminho.append(atual)
+                if any(forbidden in nome for forbidden in self.ignore_list_upper):
+                    status = False
+                    break
+                atual = self.folder_tree[atual][1]
+                if atual is None:
+                    status = False  # Chegou no topo do Drive sem passar pela raiz
+
+            if status is None:
+                continue
+            for pasta_id in caminho:
+                self.folder_cache[pasta_id] = status
+
+        seguras = sum(1 for v in self.folder_cache.values() if v)
+        print(f"🌳 [PASTAS] {len(self.folder_cache)} pastas classificadas ({seguras} seguras).")
+
+    # ------------------------------------------------------------------
+    # MODO INCREMENTAL (Drive Changes API)
+    # ------------------------------------------------------------------
+    def get_changed_files(self):
+        """
+        Retorna (arquivos, novo_token): PDFs adicionados/alterados desde a última
+        execução, via Changes API. O token só deve ser gravado (commit_changes_token)
+        DEPOIS que os arquivos forem processados, para não perder nada se o job cair.
+
+        Sem token salvo (1ª execução): pega o token atual ANTES da varredura
+        completa de ontem, então nada criado durante a varredura se perde.
+        """
+        token = self._load_changes_token()
+        if token is None:
+            print("🆕 [CHANGES] Sem token salvo. Fazendo varredura completa de ontem...")
+            start = self.service.changes().getStartPageToken(supportsAllDrives=True).execute()
+            return self.get_files_from_yesterday(), start['startPageToken']
+
+        # Mapa de pastas em disco (as alterações de pastas chegam pelo próprio feed)
+        if not self.folder_tree and self._load_folder_tree() is None:
+            self.prefetch_folder_tree()
+        elif len(self.folder_cache) <= 1:
+            self._compute_folder_status()
+
+        pdfs = {}
+        pastas_alteradas = False
+        page_token = token
+        new_token = token
+        while page_token:
+            response = self.service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                includeItemsFromAllDrives=True,
+                supportsAllDrives=True,
+                includeRemoved=True,
+                pageSize=1000,
+                fields="nextPageToken, newStartPageToken, "
+                       "changes(fileId, removed, file(id, name, parents, webViewLink, md5Checksum, mimeType, trashed))"
+            ).execute()
+
+            for change in response.get('changes', []):
+                file = change.get('file')
+                if change.get('removed') or not file or file.get('trashed'):
+                    pdfs.pop(change.get('fileId'), None)
+                    # Pasta na lixeira/excluída sai do mapa (filhas voltam à validação via API)
+                    if self.folder_tree.pop(change.get('fileId'), None) is not None:
+                        pastas_alteradas = True
+                    continue
+
+                parents = file.get('parents', [])
+                if file.get('mimeType') == FOLDER_MIME:
+                    self.folder_tree[file['id']] = [file.get('name', ''), parents[0] if parents else None]
+                    pastas_alteradas = True
+                elif file.get('mimeType') == 'application/pdf' and parents:
+                    pdfs[file['id']] = file  # Última versão de cada arquivo
+
+            page_token = response.get('nextPageToken')
+            if response.get('newStartPageToken'):
+                new_token = response['newStartPageToken']
+
+        if pastas_alteradas:
+            # Pasta renomeada/movida muda o status das filhas: recalcula tudo em memória
+            self.folder_cache = {ROOT_FOLDER_ID: True}
+            self._compute_folder_status()
+            self._save_folder_tree(self.folder_tree_synced_at or datetime.now(timezone.utc))
+
+        files_found = []
+        for file in pdfs.values():
+            is_valid, motivo = self._check_folder_safety(file['parents'][0])
+            if is_valid:
+                files_found.append(file)
+            else:
+                print(f"⛔ [BLOQUEADO] {file.get('name')} | Motivo: {motivo}")
+
+        print(f"🔄 [CHANGES] {len(pdfs)} PDF(s) alterados desde a última execução, {len(files_found)} em pastas válidas.")
+        return files_found, new_token
+
+    def _load_changes_token(self):
+        if not os.path.exists(self.changes_token_path):
+            return None
+        try:
+            with open(self.changes_token_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('startPageToken')
+        except Exception as e:
+            print(f"⚠️ [CHANGES] Token salvo inválido ({e}). Voltando à varredura completa.")
+            return None
+
+    def commit_changes_token(self, token):
+        """Grava o token do feed de alterações (chamar só depois de processar os arquivos)."""
+        pasta = os.path.dirname(self.changes_token_path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        tmp_path = self.changes_token_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'startPageToken': token, 'saved_at': datetime.now(timezone.utc).isoformat()}, f)
+        os.replace(tmp_path, self.changes_token_path)
 
     def get_files_from_yesterday(self):
         print("📅 [DRIVE] Iniciando varredura com FILTRO DE PASTAS ATIVO...")
@@ -18,10 +253,10 @@ class DriveWatcher:
         start_date = today - timedelta(days=1)
         query_date = start_date.isoformat()
 
-        # Normaliza a lista de pastas proibidas para maiúsculo para comparar sem erro
-        self.ignore_list_upper = [f.upper() for f in IGNORE_FOLDERS]
-
         print(f"🚫 Lista Negra de Pastas: {self.ignore_list_upper}")
+
+        # Árvore de pastas em lote: a validação abaixo vira consulta em dicionário
+        self.prefetch_folder_tree()
         print(f"🔎 Buscando arquivos (Global) > {query_date}...")
 
         # 1. Busca Global (Rápida)
@@ -36,7 +271,7 @@ class DriveWatcher:
                 corpora='allDrives',
                 includeItemsFromAllDrives=True,
                 supportsAllDrives=True,
-                fields="nextPageToken, files(id, name, parents, webViewLink)",
+                fields="nextPageToken, files(id, name, parents, webViewLink, md5Checksum)",
                 pageToken=page_token
             ).execute()
 
@@ -72,7 +307,7 @@ class DriveWatcher:
                     spaces='drive',
                     includeItemsFromAllDrives=True,
                     supportsAllDrives=True,
-                    fields="files(id, name, parents, webViewLink)",
+                    fields="files(id, name, parents, webViewLink, md5Checksum)",
                 ).execute()
                 files_found = response.get('files', [])
                 if files_found:
@@ -108,6 +343,8 @@ class DriveWatcher:
             return False, f"Erro de Permissão na Pasta: {e}"
 
         folder_name = folder.get('name', '').upper()
+        folder_parents = folder.get('parents', [])
+        self.folder_tree[folder_id] = [folder.get('name', ''), folder_parents[0] if folder_parents else None]
 
         # 2. REGRA DE OURO: Verifica se o nome contém termo proibido
         for forbidden in self.ignore_list_upper:
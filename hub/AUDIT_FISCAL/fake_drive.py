@@ -0,0 +1,103 @@
+"""
+Drive falso em memória para testar o DriveWatcher sem rede.
+
+Imita só o pedaço da API v3 que o watcher usa:
+    files().list / files().get  e  changes().getStartPageToken / changes().list
+todos devolvendo objetos com .execute().
+
+Uso:
+    drive = FakeDriveService()
+    drive.add_folder('cli', 'Cliente A', parent=ROOT_FOLDER_ID)
+    drive.add_pdf('f1', 'DCTFWEB 01.2026.pdf', parent='cli')
+    watcher = DriveWatcher(None, service=drive, ...)
+"""
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+PDF_MIME = 'application/pdf'
+
+
+class _Request:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        return self._result
+
+
+class _Files:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q='', pageSize=100, pageToken=None, **kwargs):
+        # Filtro mínimo: pastas x PDFs, pelo mimeType pedido na query, e lixeira
+        mime = FOLDER_MIME if FOLDER_MIME in q else PDF_MIME
+        lixeira = 'trashed=true' in q.replace(' ', '')
+        items = [dict(f) for f in self._drive.items.values()
+                 if f['mimeType'] == mime and bool(f.get('trashed')) == lixeira]
+        inicio = int(pageToken or 0)
+        pagina = items[inicio:inicio + pageSize]
+        result = {'files': pagina}
+        if inicio + pageSize < len(items):
+            result['nextPageToken'] = str(inicio + pageSize)
+        self._drive.calls['files.list'] += 1
+        return _Request(result)
+
+    def get(self, fileId, **kwargs):
+        self._drive.calls['files.get'] += 1
+        if fileId not in self._drive.items:
+            raise Exception(f"File not found: {fileId}")
+        return _Request(dict(self._drive.items[fileId]))
+
+
+class _Changes:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return _Request({'startPageToken': str(len(self._drive.change_log))})
+
+    def list(self, pageToken, pageSize=100, **kwargs):
+        self._drive.calls['changes.list'] += 1
+        inicio = int(pageToken)
+        fim = min(inicio + pageSize, len(self._drive.change_log))
+        result = {'changes': [dict(c) for c in self._drive.change_log[inicio:fim]]}
+        if fim < len(self._drive.change_log):
+            result['nextPageToken'] = str(fim)
+        else:
+            result['newStartPageToken'] = str(fim)
+        return _Request(result)
+
+
+class FakeDriveService:
+    def __init__(self):
+        self.items = {}
+        self.change_log = []
+        self.calls = {'files.list': 0, 'files.get': 0, 'changes.list': 0}
+
+    def _put(self, item):
+        self.items[item['id']] = item
+        self.change_log.append({'fileId': item['id'], 'removed': False, 'file': dict(item)})
+
+    def add_folder(self, folder_id, name, parent=None):
+        self._put({'id': folder_id, 'name': name, 'mimeType': FOLDER_MIME,
+                   'parents': [parent] if parent else []})
+
+    def add_pdf(self, file_id, name, parent, md5=None):
+        self._put({'id': file_id, 'name': name, 'mimeType': PDF_MIME, 'parents': [parent],
+                   'webViewLink': f"https://drive.google.com/file/d/{file_id}/view",
+                   'md5Checksum': md5 or f"md5-{file_id}"})
+
+    def trash(self, file_id):
+        item = dict(self.items[file_id], trashed=True)
+        self._put(item)
+
+    def delete(self, file_id):
+        """Exclusão definitiva: some da listagem e o feed só traz removed=True."""
+        del self.items[file_id]
+        self.change_log.append({'fileId': file_id, 'removed': True})
+
+    def files(self):
+        return _Files(self)
+
+    def changes(self):
+        return _Changes(self)
@@ -0,0 +1,176 @@
+"""
+Scanner único de identificadores (CNPJ / I.E. / I.M.) em texto de PDF ou OCR.
+
+Uma passada de regex pré-compilada acha os "blocos numéricos" do texto. Pontos,
+traços e barras entre dígitos são juntados (12.345.678/0001-90), e partes
+separadas por espaço ou por uma quebra de linha também viram candidatos
+unidos (OCR costuma quebrar "12.345.678/ 0001-90").
+
+Os candidatos são buscados em um índice de chave inteira (IdentifierIndex),
+e o resultado vem ranqueado e com o motivo do match. Usado pelo
+ContentExtractor (CNPJ / parada antecipada) e pelo ReferenceLoader
+(identificação da empresa).
+"""
+import re
+
+from config import CNPJ_TAXBASE
+
+TAXBASE = "".join(filter(str.isdigit, CNPJ_TAXBASE))
+
+# Bloco: grupos de dígitos ligados por . - /, ou separados por espaços/tab
+# ou por no máximo uma quebra de linha (com . - / opcional em volta).
+_BLOCK_PATTERN = re.compile(
+    r'\d+(?:(?:[./\-]?(?:[ \t]+|[ \t]*\r?\n[ \t]*)[./\-]?|[./\-])\d+)*'
+)
+_SPLIT_PATTERN = re.compile(r'\s+')
+_STRIP_SEPARATORS = str.maketrans('', '', './-')
+
+MIN_DIGITS = 5        # Abaixo disso é lixo (datas, páginas, valores)
+MAX_DIGITS = 14       # CNPJ é o maior identificador
+MAX_JOINED_PARTS = 5  # Máximo de partes unidas num mesmo candidato
+
+KINDS = ("CNPJ", "IE", "IM", "ID")
+
+
+def scan_identifiers(text):
+    """
+    Gera (digitos, posicao, unido) para cada candidato do texto, na ordem em
+    que aparecem. unido=True quando o número estava quebrado por espaço ou
+    quebra de linha.
+    """
+    if not text:
+        return
+    for m in _BLOCK_PATTERN.finditer(text):
+        parts = [p.translate(_STRIP_SEPARATORS) for p in _SPLIT_PATTERN.split(m.group())]
+        pos = m.start()
+        for i, part in enumerate(parts):
+            if MIN_DIGITS <= len(part) <= MAX_DIGITS:
+                yield part, pos, False
+            joined = part
+            for nxt in parts[i + 1:i + MAX_JOINED_PARTS]:
+                joined += nxt
+                if len(joined) > MAX_DIGITS:
+                    break
+                if len(joined) >= MIN_DIGITS:
+                    yield joined, pos, True
+
+
+def is_valid_cnpj(digits):
+    """Confere os dígitos verificadores do CNPJ."""
+    if len(digits) != 14 or digits == digits[0] * 14:
+        return False
+    nums = [int(d) for d in digits]
+    for size in (12, 13):
+        weights = list(range(size - 7, 1, -1)) + list(range(9, 1, -1))
+        total = sum(n * w for n, w in zip(nums[:size], weights))
+        check = 0 if total % 11 < 2 else 11 - total % 11
+        if nums[size] != check:
+            return False
+    return True
+
+
+def find_cnpjs(text):
+    """
+    CNPJs do texto, na ordem em que aparecem e sem repetição (sem consultar a
+    planilha). Números quebrados por espaço/linha só contam se o dígito
+    verificador bater, para não inventar CNPJ juntando números soltos.
+    """
+    seen = set()
+    found = []
+    for digits, _, joined in scan_identifiers(text):
+        if len(digits) != 14 or digits in seen:
+            continue
+        if joined and not is_valid_cnpj(digits):
+            continue
+        seen.add(digits)
+        found.append(digits)
+    return found
+
+
+def _key(digits):
+    # O tamanho entra na chave para "0123456" e "123456" não colidirem
+    return int(digits) * 16 + len(digits)
+
+
+class IdentifierIndex:
+    """
+    Índice compacto identificador -> empresa: chave inteira (número + tamanho)
+    apontando para a posição do registro e o tipo do identificador.
+    Pode ser enviado aos processos do ProcessPool (só dicts/listas).
+    """
+
+    def __init__(self):
+        self._keys = {}     # chave int -> (posição em records, índice em KINDS)
+        self.records = []
+
+    @classmethod
+    def from_ids(cls, ids):
+        """Índice só de identificadores, sem dados de empresa (tipo "ID")."""
+        index = cls()
+        for digits in ids:
+            index.add(digits, None, "ID")
+        return index
+
+    def add(self, digits, record, kind):
+        if not digits or not digits.isdigit() or len(digits) > MAX_DIGITS:
+            return
+        self.records.append(record)
+        self._keys[_key(digits)] = (len(self.records) - 1, KINDS.index(kind))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, digits):
+        return digits.isdigit() and len(digits) <= MAX_DIGITS and _key(digits) in self._keys
+
+    def get(self, digits):
+        entry = self._keys.get(_key(digits)) if digits in self else None
+        return self.records[entry[0]] if entry else None
+
+    def match(self, text):
+        """
+        Todos os identificadores do texto que estão no índice, ranqueados:
+        clientes antes da Taxbase, número inteiro antes de número unido,
+        CNPJ > I.E. > I.M., e por fim a posição no texto. Número unido só
+        vale se for CNPJ com dígito verificador certo (dois números vizinhos
+        colados não podem bater com a I.E./I.M. de alguém).
+        Cada item: {identificador, tipo, unido, posicao, registro, cnpj, taxbase, motivo}.
+        Uma entrada por empresa (a melhor).
+        """
+        best = {}
+        for digits, pos, joined in scan_identifiers(text):
+            if joined and not is_valid_cnpj(digits):
+                continue
+            entry = self._keys.get(_key(digits))
+            if entry is None:
+                continue
+            record_pos, kind_idx = entry
+            record = self.records[record_pos]
+            cnpj = record['cnpj'] if record else (digits if len(digits) == 14 else None)
+            taxbase = (cnpj or digits) == TAXBASE
+            rank = (taxbase, joined, kind_idx, pos)
+
+            dono = cnpj or digits
+            if dono in best and best[dono][0] <= rank:
+                continue
+            kind = KINDS[kind_idx]
+            motivo = f"{kind} {digits}" + (" (unido: espaço/quebra de linha)" if joined else "")
+            best[dono] = (rank, {
+                "identificador": digits, "tipo": kind, "unido": joined, "posicao": pos,
+                "registro": record, "cnpj": cnpj, "taxbase": taxbase, "motivo": motivo,
+            })
+
+        return [m for _, m in sorted(best.values(), key=lambda item: item[0])]
+
+    def has_client(self, text):
+        """True se o texto tem algum identificador do índice que não seja da Taxbase."""
+        for digits, _, joined in scan_identifiers(text):
+            if joined and not is_valid_cnpj(digits):
+                continue
+            entry = self._keys.get(_key(digits))
+            if entry is None:
+                continue
+            record = self.records[entry[0]]
+            if (record['cnpj'] if record else digits) != TAXBASE:
+                return True
+        return False
@@ -1,18 +1,36 @@
 import os
+import re
+import sys
+import json
+import time
+import urllib.request
 import concurrent.futures
+from functools import partial
 from datetime import datetime
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
 
-from config import BQ_TABLE_ID
+from config import (BQ_TABLE_ID, CONTENT_CACHE_PATH, CONTENT_CACHE_MAX_AGE_DAYS, CONTENT_CACHE_MAX_MB,
+                    PROCESSED_INDEX_PATH, DEDUP_BY_CONTENT, HUB_URL, HUB_INTERNAL_TOKEN, PLANILHA_RECARGA_MIN)
 from drive_watcher import DriveWatcher
-from content_extractor import ContentExtractor
+from content_extractor import ContentExtractor, set_known_identifiers, ocr_stats_report
 from reference_data import ReferenceLoader
 from data_loader import BigQueryLoader
 from auditor_logic import AuditorClassifier
+from client_registry import ClientRegistry
+from content_cache import ContentCache
+from pipeline import AuditPipeline
+from processed_index import ProcessedIndex
+from registros_atuais import atualizar_registros_atuais
+from master_sync import sincronizar_master
 
 KEY_FILE = 'credentials.json'
-MAX_WORKERS = 6  # Reduzi um pouco para evitar crash de memória no Windows
+MAX_WORKERS = 6  # Reduzi um pouco para evitar crash de memória no Windows (modo --sequencial)
+
+# Pipeline em estágios: cada um tem seu próprio limite de concorrência
+DOWNLOAD_WORKERS = 6             # I/O (Drive)
+CPU_WORKERS = os.cpu_count() or 2  # PDFMiner + Poppler (ProcessPool)
+OCR_WORKERS = 4                  # I/O (Vision)
+QUEUE_SIZE = 12                  # Backpressure: PDFs em memória entre estágios
 
 
 def get_credentials():
@@ -23,141 +41,275 @@ def get_credentials():
     )
 
 
-def processar_arquivo_individual(file_meta, creds, ref_loader, classifier, ids_existentes):
+def motivo_para_pular(file_meta, classifier, ids_existentes):
+    """Retorna a linha de log se o arquivo deve ser pulado, ou None se deve ser processado."""
+    file_name = file_meta['name']
+
+    # 0. BLACKLIST: Pula arquivos irrelevantes ANTES de qualquer processamento
+    if classifier.is_blacklisted(file_name):
+        return f"⛔ [BLACKLIST] Ignorado: {file_name}"
+
+    # 0.5. DUPLICADOS: Pula se já existe no BigQuery (todo o histórico, via índice local)
+    if file_meta['id'] in ids_existentes:
+        return f"🔁 [DUPLICADO] Já processado: {file_name}"
+
+    # 0.6. Mesmo conteúdo (md5) com outro ID: reenvio do mesmo arquivo
+    if DEDUP_BY_CONTENT and ids_existentes.has_content(ContentCache.key_for(file_meta)):
+        return f"🔁 [DUPLICADO] Conteúdo idêntico já processado: {file_name}"
+
+    return None
+
+
+def gravar_resultado(file_meta, texto, cnpj, usou_ocr, ref_loader, classifier, bq_loader, index=None, gravados=None):
+    """Aplica as regras de negócio sobre o texto extraído e grava o registro no BigQuery."""
     # Buffer de log para imprimir tudo de uma vez e não misturar as threads
     log_buffer = []
     file_name = file_meta['name']
     file_id = file_meta['id']
 
-    # 0. BLACKLIST: Pula arquivos irrelevantes ANTES de qualquer processamento
-    if classifier.is_blacklisted(file_name):
-        log_buffer.append(f"⛔ [BLACKLIST] Ignorado: {file_name}")
-        print("\n".join(log_buffer))
-        print("-" * 40)
-        return True  # Não é erro, apenas ignorado
+    if texto and "ERRO_OCR" in texto:
+        log_buffer.append(f"❌ [ERRO GRAVE] Falha no Poppler/OCR: {texto}")
+
+    # 2. Regras de Negócio
+    categoria = classifier.identify_category(file_name)
+    periodo = classifier.calculate_period(file_name, categoria)
+
+    # FIX #1: Auditoria da Regra de Data (corrigida)
+    # Verifica se o período realmente veio do nome do arquivo
+    # O calculate_period retorna MM/YYYY — se esse padrão existe no nome, veio de lá
+    match_data_nome = re.search(r'(0[1-9]|1[0-2])[.\-_](20[2-9][0-9])', file_name)
+    origem_data = "NOME ARQUIVO" if match_data_nome else "CALCULADA (M-1/M-2)"
+
+    # 3. Empresa (BUSCA INTELIGENTE: CNPJ + IE + IM)
+    # Passamos o texto completo. Ele procura IE, IM e aplica a regra anti-Taxbase.
+    match = ref_loader.identify_with_reason(texto)
+
+    if match:
+        nome_empresa = match['registro'].get('empresa', 'N/A')
+        # Se achamos a empresa pelo IM, atualizamos o CNPJ do registro para o correto da empresa
+        cnpj = match['cnpj']
+        metodo_identificacao = "CNPJ/IE/IM"
+    else:
+        nome_empresa = 'DESCONHECIDA'
+        metodo_identificacao = "NAO_IDENTIFICADO"
+
+    # 4. BigQuery
+    registro = {
+        "data_processamento": datetime.now().isoformat(),
+        "id_arquivo": file_id,
+        "nome_arquivo": file_name,
+        "link_arquivo": file_meta.get('webViewLink', ''),
+        "cnpj": cnpj if cnpj else "NAO_DETECTADO",
+        "periodo": periodo,
+        "categoria": categoria,
+        "status_auditoria": "OCR" if usou_ocr else "TXT",
+        "observacao": f"{origem_data} | Empresa: {nome_empresa} ({metodo_identificacao})",
+        "pagina": "1"
+    }
+
+    sucesso = bq_loader.insert_record(registro)
+
+    # Índice anti-duplicata já sabe deste arquivo (sem esperar a próxima sincronização)
+    if sucesso and index is not None:
+        index.add(file_id, ContentCache.key_for(file_meta))
+    if sucesso and gravados is not None:
+        gravados.append(file_id)
+
+    # MONTAGEM DO RELATÓRIO FINAL LIMPO
+    status = "✅ SUCESSO" if sucesso else "❌ FALHA BQ"
+    log_buffer.append(f"{status} | Arq: {file_name}")
+    log_buffer.append(f"   ∟ Cat: {categoria} | Período: {periodo} ({origem_data})")
+    log_buffer.append(f"   ∟ CNPJ: {cnpj} | Empresa: {nome_empresa}")
+    if match:
+        log_buffer.append(f"   ∟ Identificado por: {match['motivo']}")
+    if usou_ocr:
+        log_buffer.append(f"   ∟ 👁️ Usou OCR Vision")
+
+    print("\n".join(log_buffer))
+    print("-" * 40)
+    return True
+
+
+def processar_arquivo_individual(file_meta, creds, ref_loader, classifier, ids_existentes, registry, cache=None, gravados=None):
+    """Modo sequencial (um arquivo inteiro por thread). Usado com --sequencial."""
+    file_name = file_meta['name']
 
-    # 0.5. DUPLICADOS: Pula se já existe no BigQuery
-    if file_id in ids_existentes:
-        log_buffer.append(f"🔁 [DUPLICADO] Já processado: {file_name}")
-        print("\n".join(log_buffer))
+    motivo = motivo_para_pular(file_meta, classifier, ids_existentes)
+    if motivo:
+        print(motivo)
         print("-" * 40)
-        return True
+        return True  # Não é erro, apenas ignorado
 
     try:
-        service_drive = build('drive', 'v3', credentials=creds, cache_discovery=False)
-        extractor = ContentExtractor(service_drive, creds)
-        bq_loader = BigQueryLoader(BQ_TABLE_ID, creds)
+        # Clientes reaproveitados: Drive por thread, Vision/BQ por processo
+        extractor = ContentExtractor(registry.drive(), creds, vision_client=registry.vision(), cache=cache)
+        bq_loader = BigQueryLoader(BQ_TABLE_ID, creds, client=registry.bigquery())
 
         # 1. Extração
-        texto, cnpj, usou_ocr = extractor.process_file(file_id, file_name)
-
-        if texto and "ERRO_OCR" in texto:
-            log_buffer.append(f"❌ [ERRO GRAVE] Falha no Poppler/OCR: {texto}")
-
-        # 2. Regras de Negócio
-        categoria = classifier.identify_category(file_name)
-        periodo = classifier.calculate_period(file_name, categoria)
-
-        # FIX #1: Auditoria da Regra de Data (corrigida)
-        # Verifica se o período realmente veio do nome do arquivo
-        # O calculate_period retorna MM/YYYY — se esse padrão existe no nome, veio de lá
-        import re
-        match_data_nome = re.search(r'(0[1-9]|1[0-2])[.\-_](20[2-9][0-9])', file_name)
-        origem_data = "NOME ARQUIVO" if match_data_nome else "CALCULADA (M-1/M-2)"
-
-        # 3. Empresa (BUSCA INTELIGENTE: CNPJ + IE + IM)
-        # Passamos o texto completo. Ele procura IE, IM e aplica a regra anti-Taxbase.
-        empresa_info, cnpj_final = ref_loader.smart_identify_company(texto)
-
-        if empresa_info:
-            nome_empresa = empresa_info.get('empresa', 'N/A')
-            # Se achamos a empresa pelo IM, atualizamos o CNPJ do registro para o correto da empresa
-            cnpj = cnpj_final
-            metodo_identificacao = "CNPJ/IE/IM"
-        else:
-            nome_empresa = 'DESCONHECIDA'
-            metodo_identificacao = "NAO_IDENTIFICADO"
-
-        # 4. BigQuery
-        registro = {
-            "data_processamento": datetime.now().isoformat(),
-            "id_arquivo": file_id,
-            "nome_arquivo": file_name,
-            "link_arquivo": file_meta.get('webViewLink', ''),
-            "cnpj": cnpj if cnpj else "NAO_DETECTADO",
-            "periodo": periodo,
-            "categoria": categoria,
-            "status_auditoria": "OCR" if usou_ocr else "TXT",
-            "observacao": f"{origem_data} | Empresa: {nome_empresa} ({metodo_identificacao})",
-            "pagina": "1"
-        }
-
-        sucesso = bq_loader.insert_record(registro)
-
-        # MONTAGEM DO RELATÓRIO FINAL LIMPO
-        status = "✅ SUCESSO" if sucesso else "❌ FALHA BQ"
-        log_buffer.append(f"{status} | Arq: {file_name}")
-        log_buffer.append(f"   ∟ Cat: {categoria} | Período: {periodo} ({origem_data})")
-        log_buffer.append(f"   ∟ CNPJ: {cnpj} | Empresa: {nome_empresa}")
-        if usou_ocr:
-            log_buffer.append(f"   ∟ 👁️ Usou OCR Vision")
-
-        print("\n".join(log_buffer))
-        print("-" * 40)
-        return True
+        texto, cnpj, usou_ocr = extractor.process_file(file_meta['id'], file_name, md5=file_meta.get('md5Checksum'))
+
+        return gravar_resultado(file_meta, texto, cnpj, usou_ocr, ref_loader, classifier, bq_loader,
+                                index=ids_existentes, gravados=gravados)
 
     except Exception as e:
         print(f"💀 [CRASH] {file_name}: {str(e)}")
         return False
 
 
-def carregar_ids_existentes(creds):
-    """Busca IDs de arquivos já processados no BigQuery para evitar duplicatas."""
+def carregar_ids_existentes(registry, index):
+    """
+    Sincroniza o índice local de arquivos já processados com o BigQuery.
+    Só busca o que entrou desde a última sincronização (marca d'água), e a
+    checagem de duplicata cobre todo o histórico, não só os últimos 7 dias.
+    """
     try:
-        from google.cloud import bigquery
-        client = bigquery.Client(credentials=creds)
-        query = f"""
-            SELECT DISTINCT id_arquivo 
-            FROM `{BQ_TABLE_ID}` 
-            WHERE DATE(data_processamento) >= DATE_SUB(CURRENT_DATE(), INTERVAL 7 DAY)
-        """
-        df = client.query(query).to_dataframe()
-        ids = set(df['id_arquivo'].tolist()) if not df.empty else set()
-        print(f"🛡️ [ANTI-DUPLICATA] {len(ids)} arquivos já processados nos últimos 7 dias.")
-        return ids
+        index.sync_from_bigquery(registry.bigquery(), BQ_TABLE_ID)
     except Exception as e:
-        print(f"⚠️ [ANTI-DUPLICATA] Falha ao carregar IDs existentes: {e}. Continuando sem proteção.")
-        return set()
+        print(f"⚠️ [ANTI-DUPLICATA] Falha ao sincronizar com o BigQuery: {e}. Usando o índice local ({len(index)} arquivos).")
+    return index
 
 
-def main():
-    print(f"🚀 [AUDITORIA] Iniciando correção... Poppler deve estar na pasta do projeto.")
-    creds = get_credentials()
+def notificar_hub(competencias):
+    """Avisa o hub para invalidar o cache do painel das competências alteradas."""
+    if not HUB_URL or not HUB_INTERNAL_TOKEN:
+        return
+    try:
+        req = urllib.request.Request(
+            HUB_URL.rstrip('/') + '/api/auditor/painel/invalidar',
+            data=json.dumps({'competencias': sorted(competencias)}).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-Hub-Token': HUB_INTERNAL_TOKEN},
+            method='POST',
+        )
+        urllib.request.urlopen(req, timeout=10).read()
+        print(f"📣 [HUB] Cache do painel invalidado: {', '.join(sorted(competencias)) or 'todas'}")
+    except Exception as e:
+        print(f"⚠️ [HUB] Não foi possível avisar o hub: {e}")
 
-    watcher = DriveWatcher(creds)
-    ref_loader = ReferenceLoader(creds)
-    classifier = AuditorClassifier()
 
+def executar_rodada(creds, watcher, ref_loader, classifier, registry, cache, index, incremental=False):
+    """Uma execução completa: busca arquivos, processa e (no modo incremental) avança o token."""
+    print("🛡️ Carregando IDs já processados...")
+    ids_existentes = carregar_ids_existentes(registry, index)
+
+    print("🔎 Buscando arquivos (Isso pode demorar uns segundos)...")
+    changes_token = None
+    if incremental:
+        files_to_process, changes_token = watcher.get_changed_files()
+    else:
+        files_to_process = watcher.get_files_from_yesterday()
+
+    gravados = []  # IDs inseridos nesta rodada (para a tabela de registros atuais)
+
+    if "--sequencial" in sys.argv:
+        print(f"📋 Fila: {len(files_to_process)} arquivos. Processando em paralelo (modo sequencial)...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = []
+            for file_meta in files_to_process:
+                future = executor.submit(processar_arquivo_individual, file_meta, creds, ref_loader, classifier, ids_existentes, registry, cache, gravados)
+                futures.append(future)
+            concurrent.futures.wait(futures)
+    else:
+        print(f"📋 Fila: {len(files_to_process)} arquivos. Processando em pipeline...")
+        pipeline = AuditPipeline(
+            creds, registry,
+            skip=partial(motivo_para_pular, classifier=classifier, ids_existentes=ids_existentes),
+            writer=partial(gravar_resultado, ref_loader=ref_loader, classifier=classifier, index=index,
+                           gravados=gravados),
+            download_workers=DOWNLOAD_WORKERS,
+            cpu_workers=CPU_WORKERS,
+            ocr_workers=OCR_WORKERS,
+            queue_size=QUEUE_SIZE,
+            cache=cache,
+            known_ids=ref_loader.id_index,
+        )
+        pipeline.run(files_to_process)
+
+    # Painel lê da tabela de registros atuais: entra só o que foi gravado agora
+    if gravados:
+        try:
+            competencias = atualizar_registros_atuais(registry.bigquery(), gravados)
+        except Exception as e:
+            print(f"⚠️ [REGISTROS ATUAIS] Falha ao atualizar: {e}. Rode 'python registros_atuais.py' para reconstruir.")
+            competencias = set()
+        # Sem a lista de competências, o hub limpa o cache inteiro
+        notificar_hub(competencias)
+
+    # Só avança o feed depois que tudo foi processado
+    if changes_token:
+        watcher.commit_changes_token(changes_token)
+
+
+def _intervalo_minutos():
+    """--intervalo=N: repete a rodada a cada N minutos (0 = roda uma vez só)."""
+    for arg in sys.argv:
+        if arg.startswith("--intervalo="):
+            return float(arg.split("=", 1)[1])
+    return 0
+
+
+def carregar_planilha(ref_loader, registry):
     print("📚 Carregando Planilha...")
     ref_loader.load_data()
 
-    print("🛡️ Carregando IDs já processados...")
-    ids_existentes = carregar_ids_existentes(creds)
+    # Cópia da planilha no BigQuery (o painel do hub faz o join por lá)
+    try:
+        sincronizar_master(ref_loader, registry.bigquery())
+    except Exception as e:
+        print(f"⚠️ [MASTER] Falha ao sincronizar a planilha mestre: {e}")
 
-    print("🔎 Buscando arquivos (Isso pode demorar uns segundos)...")
-    files_to_process = watcher.get_files_from_yesterday()
+    # CNPJ/IE/IM conhecidos: decidem se o recorte do cabeçalho no OCR já identificou o cliente
+    set_known_identifiers(ref_loader.id_index)
 
-    print(f"📋 Fila: {len(files_to_process)} arquivos. Processando em paralelo...")
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
-        for file_meta in files_to_process:
-            future = executor.submit(processar_arquivo_individual, file_meta, creds, ref_loader, classifier, ids_existentes)
-            futures.append(future)
-        concurrent.futures.wait(futures)
+def main():
+    print(f"🚀 [AUDITORIA] Iniciando correção... Poppler deve estar na pasta do projeto.")
+    creds = get_credentials()
+
+    # --incremental: usa o feed de alterações do Drive em vez da varredura de ontem
+    incremental = "--incremental" in sys.argv
+    intervalo = _intervalo_minutos()
 
+    watcher = DriveWatcher(creds)
+    ref_loader = ReferenceLoader(creds)
+    classifier = AuditorClassifier()
+    registry = ClientRegistry(creds)
+    cache = ContentCache(CONTENT_CACHE_PATH, max_age_days=CONTENT_CACHE_MAX_AGE_DAYS,
+                         max_bytes=CONTENT_CACHE_MAX_MB * 1024 * 1024)
+    cache.evict()
+    index = ProcessedIndex(PROCESSED_INDEX_PATH)
+
+    carregar_planilha(ref_loader, registry)
+    planilha_carregada_em = time.time()
+
+    while True:
+        if intervalo and time.time() - planilha_carregada_em >= PLANILHA_RECARGA_MIN * 60:
+            try:
+                carregar_planilha(ref_loader, registry)
+            except Exception as e:
+                print(f"⚠️ [PLANILHA] Falha ao recarregar: {e}. Seguindo com a versão anterior.")
+            planilha_carregada_em = time.time()
+
+        try:
+            executar_rodada(creds, watcher, ref_loader, classifier, registry, cache, index, incremental=incremental)
+        except Exception as e:
+            if not intervalo:
+                raise
+            # Erro passageiro (Drive/BigQuery) não derruba o modo contínuo
+            print(f"⚠️ [RODADA] Falha na rodada: {e}. Tentando de novo na próxima.")
+
+        print(registry.report())
+        print(cache.report())
+        print(ocr_stats_report())
+
+        if not intervalo:
+            break
+        print(f"💤 Próxima rodada em {intervalo:g} min...")
+        time.sleep(intervalo * 60)
+
+    cache.close()
+    index.close()
     print("🏁 FIM.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,255 @@
+"""
+Sincroniza a planilha mestre de empresas (ReferenceLoader) com BQ_TABLE_MASTER
+e monta o painel do auditor numa única query.
+
+Sincronização (sincronizar_master):
+  - Cada empresa vira uma linha com hash do conteúdo (empresa, grupo, IE, IM, ativa).
+  - Só as linhas novas ou alteradas vão para o MERGE; empresas que sumiram da
+    planilha ficam ativa = FALSE (não são apagadas).
+  - Empresas de fonte vermelha entram como ativa = FALSE.
+
+Painel (query_painel / PAINEL_SQL): master ativo x metas x entregas da
+competência (registros atuais) x ignorados, com progresso e status calculados
+no BigQuery. O hub só formata o resultado.
+
+Uso manual: python master_sync.py
+"""
+import hashlib
+import json
+
+from config import BQ_TABLE_MASTER, BQ_TABLE_CURRENT, BQ_TABLE_IGNORED
+
+_CAMPOS = ('cnpj', 'empresa', 'grupo', 'ie', 'im')
+
+
+def _hash_linha(linha):
+    conteudo = json.dumps([linha[c] for c in _CAMPOS] + [linha['ativa']], ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()
+
+
+def linhas_master(ref_loader):
+    """Empresas da planilha (ativas e inativas), uma por CNPJ (a ativa ganha)."""
+    linhas = {}
+    ativas = ref_loader.df_empresas.to_dict('records') if ref_loader.df_empresas is not None else []
+    for record, ativa in [(r, False) for r in ref_loader.inactive_records] + [(r, True) for r in ativas]:
+        linha = {c: str(record.get(c) or '').strip() for c in _CAMPOS}
+        linha['ativa'] = ativa
+        if linha['cnpj']:
+            linhas[linha['cnpj']] = linha
+    for linha in linhas.values():
+        linha['hash_linha'] = _hash_linha(linha)
+    return list(linhas.values())
+
+
+def criar_tabela_master(client):
+    client.query(f"""
+        CREATE TABLE IF NOT EXISTS `{BQ_TABLE_MASTER}` (
+            cnpj STRING NOT NULL,
+            empresa STRING,
+            grupo STRING,
+            ie STRING,
+            im STRING,
+            ativa BOOL,
+            hash_linha STRING,
+            atualizado_em TIMESTAMP
+        )
+        CLUSTER BY cnpj
+    """).result()
+
+
+def sincronizar_master(ref_loader, client):
+    """Envia para o BigQuery só o que mudou na planilha. Retorna (alteradas, desativadas)."""
+    from google.cloud import bigquery
+
+    criar_tabela_master(client)
+
+    linhas = linhas_master(ref_loader)
+    if not linhas:
+        print("⚠️ [MASTER] Planilha vazia — nada sincronizado.")
+        return 0, 0
+
+    atuais = {row['cnpj']: (row['hash_linha'], row['ativa'])
+              for row in client.query(f"SELECT cnpj, hash_linha, ativa FROM `{BQ_TABLE_MASTER}`").result()}
+
+    alteradas = [l for l in linhas if atuais.get(l['cnpj'], (None,))[0] != l['hash_linha']]
+    na_planilha = {l['cnpj'] for l in linhas}
+    removidas = [cnpj for cnpj, (_, ativa) in atuais.items() if cnpj not in na_planilha and ativa]
+
+    if not alteradas and not removidas:
+        print(f"✅ [MASTER] {len(linhas)} empresas — nenhuma alteração.")
+        return 0, 0
+
+    campos = _CAMPOS + ('hash_linha',)
+    linhas_param = bigquery.ArrayQueryParameter("linhas", "STRUCT", [
+        bigquery.StructQueryParameter(
+            None,
+            *[bigquery.ScalarQueryParameter(c, "STRING", l[c]) for c in campos],
+            bigquery.ScalarQueryParameter("ativa", "BOOL", l['ativa']),
+        )
+        for l in alteradas
+    ]) if alteradas else bigquery.ArrayQueryParameter("linhas", "STRING", [])
+
+    script = ""
+    if alteradas:
+        script += f"""
+            MERGE `{BQ_TABLE_MASTER}` m
+            USING UNNEST(@linhas) l
+            ON m.cnpj = l.cnpj
+            WHEN MATCHED THEN UPDATE SET
+                empresa = l.empresa, grupo = l.grupo, ie = l.ie, im = l.im,
+                ativa = l.ativa, hash_linha = l.hash_linha, atualizado_em = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT (cnpj, empresa, grupo, ie, im, ativa, hash_linha, atualizado_em)
+                VALUES (l.cnpj, l.empresa, l.grupo, l.ie, l.im, l.ativa, l.hash_linha, CURRENT_TIMESTAMP());
+        """
+    if removidas:
+        script += f"""
+            UPDATE `{BQ_TABLE_MASTER}`
+            SET ativa = FALSE, hash_linha = NULL, atualizado_em = CURRENT_TIMESTAMP()
+            WHERE cnpj IN UNNEST(@removidas);
+        """
+    params = [bigquery.ArrayQueryParameter("removidas", "STRING", removidas)]
+    if alteradas:
+        params.append(linhas_param)
+    client.query(script, job_config=bigquery.QueryJobConfig(query_parameters=params)).result()
+
+    print(f"✅ [MASTER] {len(alteradas)} empresa(s) novas/alteradas, {len(removidas)} desativada(s) (de {len(linhas)}).")
+    return len(alteradas), len(removidas)
+
+
+# Grupo vazio/nan/None da planilha vira "Sem Grupo"
+GRUPO_SQL = "IF(TRIM(IFNULL(m.grupo, '')) IN ('', 'nan', 'None'), 'Sem Grupo', TRIM(m.grupo))"
+
+# Painel completo de uma competência: uma linha por empresa ativa
+PAINEL_SQL = f"""
+    WITH entregas AS (
+        SELECT REGEXP_REPLACE(cnpj, r'\\D', '') AS cnpj,
+               ARRAY_AGG(DISTINCT categoria IGNORE NULLS ORDER BY categoria) AS entregues
+        FROM `{BQ_TABLE_CURRENT}`
+        WHERE competencia_painel = DATE(@competencia_painel)
+        GROUP BY 1
+    ),
+    ignorados AS (
+        SELECT cnpj, ARRAY_AGG(DISTINCT obrigacao IGNORE NULLS) AS ignoradas
+        FROM `{BQ_TABLE_IGNORED}`
+        GROUP BY cnpj
+    ),
+    base AS (
+        SELECT
+            m.cnpj,
+            IF(IFNULL(m.empresa, '') = '', 'N/A', m.empresa) AS empresa,
+            {GRUPO_SQL} AS grupo,
+            IFNULL(e.entregues, ARRAY<STRING>[]) AS entregues,
+            IFNULL(i.ignoradas, ARRAY<STRING>[]) AS ignoradas
+        FROM `{BQ_TABLE_MASTER}` m
+        LEFT JOIN entregas e ON e.cnpj = m.cnpj
+        LEFT JOIN ignorados i ON i.cnpj = m.cnpj
+        WHERE m.ativa
+    ),
+    calculado AS (
+        SELECT
+            cnpj, empresa, grupo, entregues,
+            ARRAY(SELECT meta FROM UNNEST(@metas) meta WITH OFFSET o
+                  WHERE meta NOT IN UNNEST(entregues) AND meta NOT IN UNNEST(ignoradas) ORDER BY o) AS faltantes_ativos,
+            ARRAY(SELECT meta FROM UNNEST(@metas) meta WITH OFFSET o
+                  WHERE meta NOT IN UNNEST(entregues) AND meta IN UNNEST(ignoradas) ORDER BY o) AS faltantes_ignorados,
+            LEAST(1.0, ARRAY_LENGTH(entregues) / GREATEST(1, ARRAY_LENGTH(@metas) - ARRAY_LENGTH(ignoradas))) AS progresso
+        FROM base
+    )
+    SELECT
+        cnpj, empresa, grupo, entregues, faltantes_ativos, faltantes_ignorados,
+        ARRAY_LENGTH(faltantes_ativos) AS qtd_pendentes,
+        progresso,
+        IF(progresso = 1, 'OK', 'PENDENTE') AS status,
+        ARRAY_LENGTH(entregues) > 0 AS has_delivery
+    FROM calculado
+    ORDER BY grupo, empresa
+"""
+
+
+def query_painel(client, competencia_painel, metas):
+    """Executa PAINEL_SQL e devolve a lista de dicts pronta para o JSON do painel."""
+    from google.cloud import bigquery
+
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("competencia_painel", "STRING", competencia_painel),
+        bigquery.ArrayQueryParameter("metas", "STRING", list(metas)),
+    ])
+    return [dict(row.items()) for row in client.query(PAINEL_SQL, job_config=job_config).result()]
+
+
+# Histórico: entregas de cada empresa ativa em várias competências, numa query agrupada.
+# A regra EFD (+1 mês) já vem aplicada na competencia_painel (registros_atuais.COMPETENCIA_PAINEL_SQL).
+HISTORICO_SQL = f"""
+    WITH entregas AS (
+        SELECT REGEXP_REPLACE(cnpj, r'\\D', '') AS cnpj,
+               competencia_painel,
+               ARRAY_AGG(DISTINCT categoria IGNORE NULLS ORDER BY categoria) AS entregues
+        FROM `{BQ_TABLE_CURRENT}`
+        WHERE competencia_painel BETWEEN DATE(@inicio) AND DATE(@fim)
+        GROUP BY 1, 2
+    ),
+    ignorados AS (
+        SELECT cnpj, ARRAY_AGG(DISTINCT obrigacao IGNORE NULLS) AS ignoradas
+        FROM `{BQ_TABLE_IGNORED}`
+        GROUP BY cnpj
+    )
+    SELECT
+        m.cnpj,
+        IF(IFNULL(m.empresa, '') = '', 'N/A', m.empresa) AS empresa,
+        {GRUPO_SQL} AS grupo,
+        IFNULL(ANY_VALUE(i.ignoradas), ARRAY<STRING>[]) AS ignoradas,
+        ARRAY_AGG(
+            IF(e.cnpj IS NULL, NULL,
+               STRUCT(FORMAT_DATE('%m/%Y', e.competencia_painel) AS competencia, e.entregues AS entregues))
+            IGNORE NULLS ORDER BY e.competencia_painel DESC
+        ) AS periodos
+    FROM `{BQ_TABLE_MASTER}` m
+    LEFT JOIN entregas e ON e.cnpj = m.cnpj
+    LEFT JOIN ignorados i ON i.cnpj = m.cnpj
+    WHERE m.ativa
+    GROUP BY m.cnpj, m.empresa, m.grupo
+    ORDER BY grupo, empresa
+"""
+
+
+def query_historico(client, competencias, metas):
+    """
+    Matriz empresa x obrigação x competência para as competências ("MM/YYYY")
+    informadas. Cada empresa: {cnpj, empresa, grupo, ignoradas,
+    periodos: {competencia: {entregues, progresso}}} — competência sem entrega
+    aparece com lista vazia.
+    """
+    from google.cloud import bigquery
+    from registros_atuais import competencia_para_data
+
+    datas = sorted(competencia_para_data(c) for c in competencias)
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("inicio", "STRING", datas[0]),
+        bigquery.ScalarQueryParameter("fim", "STRING", datas[-1]),
+    ])
+
+    empresas = []
+    for row in client.query(HISTORICO_SQL, job_config=job_config).result():
+        ignoradas = list(row['ignoradas'])
+        meta_ajustada = max(1, len(metas) - len(ignoradas))
+        entregas = {p['competencia']: list(p['entregues']) for p in row['periodos']}
+        periodos = {}
+        for comp in competencias:
+            entregues = entregas.get(comp, [])
+            periodos[comp] = {'entregues': entregues, 'progresso': min(1.0, len(entregues) / meta_ajustada)}
+        empresas.append({'cnpj': row['cnpj'], 'empresa': row['empresa'], 'grupo': row['grupo'],
+                         'ignoradas': ignoradas, 'periodos': periodos})
+    return empresas
+
+
+if __name__ == "__main__":
+    from google.oauth2 import service_account
+    from google.cloud import bigquery
+    from reference_data import ReferenceLoader
+
+    creds = service_account.Credentials.from_service_account_file(
+        'credentials.json', scopes=['https://www.googleapis.com/auth/spreadsheets',
+                                    'https://www.googleapis.com/auth/cloud-platform'])
+    loader = ReferenceLoader(creds)
+    loader.load_data()
+    sincronizar_master(loader, bigquery.Client(credentials=creds))
@@ -0,0 +1,152 @@
+"""
+Consulta do painel do auditor no servidor: filtros, ordenação e paginação por
+cursor sobre o painel já calculado de uma competência (master_sync.query_painel).
+
+O PainelIndex é montado uma vez por competência (e fica no cache do hub junto
+com o painel): texto de busca normalizado, resumo para KPIs/gráficos e as
+ordenações, calculadas na primeira vez que são pedidas. Cada página custa
+O(tamanho da página) a partir do cursor.
+
+Cursor: base64 da chave de ordenação do último item entregue (keyset), então
+continua válido mesmo se o painel for recalculado entre uma página e outra.
+"""
+import base64
+import bisect
+import json
+import unicodedata
+
+# ordem -> (campos da chave, pode ser decrescente)
+ORDENS = {
+    'grupo': (('grupo', 'empresa'), False),
+    'empresa': (('empresa',), False),
+    'progresso': (('progresso', 'empresa'), True),
+    'pendentes': (('qtd_pendentes', 'empresa'), True),
+    'entregas': (('qtd_entregues', 'empresa'), True),
+}
+ORDEM_PADRAO = 'grupo'
+STATUS = ('OK', 'PENDENTE')
+TOP_PENDENTES = 15
+
+
+def normalizar(texto):
+    """Minúsculo e sem acento, para a busca."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return ''.join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def _codificar_cursor(chave):
+    return base64.urlsafe_b64encode(json.dumps(chave).encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return tuple(json.loads(bruto))
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+class PainelIndex:
+    def __init__(self, empresas, base=None):
+        self.empresas = empresas
+        self.base = base or {}  # Campos do payload além da lista (metas, last_update, ...)
+        self._busca = [normalizar(f"{e['empresa']} {e['cnpj']} {e['grupo']}") for e in empresas]
+        self._ordens = {}
+        self.resumo = self._resumir()
+
+    def _resumir(self):
+        entregas = sum(len(e['entregues']) for e in self.empresas)
+        pendencias = sum(e['qtd_pendentes'] for e in self.empresas)
+        obrigacoes, grupos = {}, {}
+        for e in self.empresas:
+            for obr in e['entregues']:
+                obrigacoes[obr] = obrigacoes.get(obr, 0) + 1
+            g = grupos.setdefault(e['grupo'], {'grupo': e['grupo'], 'empresas': 0, 'pendencias': 0})
+            g['empresas'] += 1
+            g['pendencias'] += e['qtd_pendentes']
+        top = sorted((e for e in self.empresas if e['qtd_pendentes'] > 0),
+                     key=lambda e: -e['qtd_pendentes'])[:TOP_PENDENTES]
+        return {
+            'empresas': len(self.empresas),
+            'entregas': entregas,
+            'pendencias': pendencias,
+            'status_ok': sum(1 for e in self.empresas if e['status'] == 'OK'),
+            'com_entrega': sum(1 for e in self.empresas if e['has_delivery']),
+            'obrigacoes': dict(sorted(obrigacoes.items(), key=lambda kv: -kv[1])),
+            'top_pendentes': [{'cnpj': e['cnpj'], 'empresa': e['empresa'], 'qtd_pendentes': e['qtd_pendentes']} for e in top],
+            'grupos': [grupos[g] for g in sorted(grupos)],
+        }
+
+    def lista(self):
+        """cnpj/empresa de todas as empresas, por nome (select da alocação)."""
+        chaves, posicoes = self._ordem('empresa')
+        return [{'cnpj': self.empresas[i]['cnpj'], 'empresa': self.empresas[i]['empresa']} for i in posicoes]
+
+    def _chave(self, empresa, campos, decrescente):
+        valores = []
+        for campo in campos:
+            if campo == 'qtd_entregues':
+                valor = len(empresa['entregues'])
+            else:
+                valor = empresa[campo]
+            if isinstance(valor, str):
+                valor = normalizar(valor)
+            elif decrescente and campo == campos[0]:
+                valor = -valor
+            valores.append(valor)
+        return tuple(valores) + (empresa['cnpj'],)  # CNPJ desempata: chave única por empresa
+
+    def _ordem(self, ordem):
+        """(chaves, posições) na ordem pedida — calculado uma vez por ordem."""
+        if ordem not in self._ordens:
+            decrescente = ordem.startswith('-')
+            campos, _ = ORDENS[ordem.lstrip('-')]
+            chaves = sorted((self._chave(e, campos, decrescente), i) for i, e in enumerate(self.empresas))
+            self._ordens[ordem] = ([c for c, _ in chaves], [i for _, i in chaves])
+        return self._ordens[ordem]
+
+    def consultar(self, grupo=None, status=None, pendentes=False, com_entrega=False,
+                  busca=None, ordem=ORDEM_PADRAO, cursor=None, limite=50):
+        """
+        Uma página do painel. Retorna {painel, proximo_cursor, total} — total
+        (quantas empresas passam no filtro) só vem na primeira página.
+        """
+        ordem = ordem or ORDEM_PADRAO
+        if ordem.lstrip('-') not in ORDENS or (ordem.startswith('-') and not ORDENS[ordem.lstrip('-')][1]):
+            raise ValueError(f"Ordem inválida: {ordem}")
+        if status and status not in STATUS:
+            raise ValueError(f"Status inválido: {status}")
+        if limite < 1:
+            raise ValueError(f"Limite inválido: {limite}")
+        termo = normalizar(busca).strip() if busca else ''
+
+        def passa(i):
+            e = self.empresas[i]
+            return ((not grupo or e['grupo'] == grupo)
+                    and (not status or e['status'] == status)
+                    and (not pendentes or e['qtd_pendentes'] > 0)
+                    and (not com_entrega or e['has_delivery'])
+                    and (not termo or termo in self._busca[i]))
+
+        chaves, posicoes = self._ordem(ordem)
+        try:
+            inicio = bisect.bisect_right(chaves, _decodificar_cursor(cursor)) if cursor else 0
+        except TypeError:
+            raise ValueError("Cursor não corresponde à ordem pedida")
+
+        # Busca limite + 1 para saber se existe próxima página
+        achados = []
+        for k in range(inicio, len(posicoes)):
+            if passa(posicoes[k]):
+                achados.append(k)
+                if len(achados) > limite:
+                    break
+
+        pagina = achados[:limite]
+        resultado = {
+            'painel': [self.empresas[posicoes[k]] for k in pagina],
+            'proximo_cursor': _codificar_cursor(list(chaves[pagina[-1]])) if len(achados) > limite else None,
+        }
+        if not cursor:
+            resultado['total'] = sum(1 for i in range(len(self.empresas)) if passa(i))
+        return resultado
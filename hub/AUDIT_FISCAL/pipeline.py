@@ -0,0 +1,213 @@
+import queue
+import threading
+import time
+import concurrent.futures
+
+from config import BQ_TABLE_ID
+from content_cache import ContentCache
+from content_extractor import ContentExtractor, analyze_pdf, set_known_identifiers
+from data_loader import BigQueryLoader
+
+# Marca de fim de fila (um por worker do estágio seguinte)
+_FIM = object()
+
+
+class _Stage:
+    """
+    Um estágio do pipeline: N threads consumindo de uma fila limitada.
+    A função do estágio recebe um item e devolve (fila_destino, item) ou None.
+    Quando todas as threads recebem _FIM, o estágio chama on_done() para
+    encerrar o estágio seguinte.
+    """
+
+    def __init__(self, nome, workers, func, fila_entrada, on_done):
+        self.nome = nome
+        self.workers = workers
+        self.func = func
+        self.fila_entrada = fila_entrada
+        self.on_done = on_done
+        self.processados = 0
+        self.segundos_ocupado = 0.0
+        self._restantes = workers
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"{self.nome}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def join(self):
+        for t in self._threads:
+            t.join()
+
+    def _loop(self):
+        while True:
+            item = self.fila_entrada.get()
+            if item is _FIM:
+                break
+
+            inicio = time.perf_counter()
+            try:
+                saida = self.func(item)
+            except Exception as e:
+                print(f"💀 [CRASH] {item['meta'].get('name')} no estágio {self.nome}: {e}")
+                saida = None
+            elapsed = time.perf_counter() - inicio
+
+            with self._lock:
+                self.processados += 1
+                self.segundos_ocupado += elapsed
+
+            if saida:
+                fila_destino, novo_item = saida
+                # put() bloqueia se a fila seguinte estiver cheia (backpressure)
+                fila_destino.put(novo_item)
+
+        with self._lock:
+            self._restantes -= 1
+            ultimo = self._restantes == 0
+        if ultimo:
+            self.on_done()
+
+
+class AuditPipeline:
+    """
+    Pipeline em estágios para os PDFs do dia:
+
+        download (threads, I/O) -> extração (processos, CPU) -> OCR Vision (threads, I/O) -> gravação (1 thread)
+                                                 \\______________ sem OCR _______________/
+
+    Cada estágio tem seu limite de concorrência e as filas entre eles são
+    limitadas, então um estágio lento segura os anteriores em vez de acumular
+    PDFs na memória. O tempo total fica limitado pelo estágio mais lento, não
+    pela soma de todos.
+    """
+
+    def __init__(self, creds, registry, skip, writer,
+                 download_workers=6, cpu_workers=2, ocr_workers=4, queue_size=12, cache=None,
+                 known_ids=None):
+        self.creds = creds
+        self.registry = registry
+        self.cache = cache
+        self.skip = skip
+        self.writer = writer
+        self.download_workers = download_workers
+        self.cpu_workers = cpu_workers
+        self.ocr_workers = ocr_workers
+        self.queue_size = queue_size
+        # IdentifierIndex da planilha: cada processo de extração recebe uma cópia (acerto do recorte do OCR)
+        self.known_ids = known_ids
+
+    def _extractor(self):
+        return ContentExtractor(self.registry.drive(), self.creds,
+                                vision_client=self.registry.vision(), cache=self.cache)
+
+    def run(self, files):
+        inicio_total = time.perf_counter()
+
+        q_download = queue.Queue(maxsize=self.queue_size)
+        q_extract = queue.Queue(maxsize=self.queue_size)
+        q_ocr = queue.Queue(maxsize=self.queue_size)
+        q_write = queue.Queue(maxsize=self.queue_size)
+
+        process_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.cpu_workers,
+            initializer=set_known_identifiers,
+            initargs=(self.known_ids,),
+        )
+
+        # --- FUNÇÕES DE CADA ESTÁGIO ---
+        def baixar(item):
+            extractor = self._extractor()
+
+            # Conteúdo já conhecido (md5 do Drive): nem baixa
+            chave = ContentCache.key_for(item['meta'])
+            cached = extractor.cached_result(chave)
+            if cached:
+                item['resultado'] = cached
+                return q_write, item
+
+            pdf_bytes = extractor._download_file(item['meta']['id'])
+            if not pdf_bytes:
+                item['resultado'] = (None, None, False)
+                return q_write, item
+
+            if not chave:
+                chave = ContentCache.key_for(None, pdf_bytes)
+                cached = extractor.cached_result(chave)
+                if cached:
+                    item['resultado'] = cached
+                    return q_write, item
+
+            item['cache_key'] = chave
+            item['pdf_bytes'] = pdf_bytes
+            return q_extract, item
+
+        def extrair(item):
+            # A thread só espera: o trabalho pesado roda no ProcessPool
+            analysis = process_pool.submit(analyze_pdf, item.pop('pdf_bytes')).result()
+            item['analysis'] = analysis
+            if analysis['needs_ocr'] and analysis['image'] and not analysis['error']:
+                return q_ocr, item
+            item['resultado'] = self._extractor().finish_with_ocr(analysis)
+            return q_write, item
+
+        def ocr(item):
+            analysis = item['analysis']
+            item['resultado'] = self._extractor().finish_with_ocr(analysis)
+            # Libera as imagens antes da fila de gravação
+            analysis['image'] = None
+            analysis['image_crop'] = None
+            return q_write, item
+
+        def gravar(item):
+            if 'cache_key' in item:
+                self._extractor().store_in_cache(item['cache_key'], item['analysis'], item['resultado'])
+            texto, cnpj, usou_ocr = item['resultado']
+            bq_loader = BigQueryLoader(BQ_TABLE_ID, self.creds, client=self.registry.bigquery())
+            self.writer(item['meta'], texto, cnpj, usou_ocr, bq_loader=bq_loader)
+            return None
+
+        def encerrar(fila, n):
+            return lambda: [fila.put(_FIM) for _ in range(n)]
+
+        st_write = _Stage("gravacao", 1, gravar, q_write, lambda: None)
+        st_ocr = _Stage("ocr", self.ocr_workers, ocr, q_ocr, encerrar(q_write, st_write.workers))
+        st_extract = _Stage("extracao", self.cpu_workers, extrair, q_extract, encerrar(q_ocr, st_ocr.workers))
+        st_download = _Stage("download", self.download_workers, baixar, q_download, encerrar(q_extract, st_extract.workers))
+        stages = [st_download, st_extract, st_ocr, st_write]
+
+        for st in stages:
+            st.start()
+
+        # Alimentador: blacklist/duplicados saem antes de ocupar qualquer estágio
+        pulados = 0
+        for file_meta in files:
+            motivo = self.skip(file_meta)
+            if motivo:
+                pulados += 1
+                print(motivo)
+                print("-" * 40)
+                continue
+            q_download.put({'meta': file_meta})
+        for _ in range(st_download.workers):
+            q_download.put(_FIM)
+
+        for st in stages:
+            st.join()
+        process_pool.shutdown()
+
+        self._print_report(stages, pulados, time.perf_counter() - inicio_total)
+
+    def _print_report(self, stages, pulados, wall):
+        print(f"⏱️ [PIPELINE] Tempo total: {wall:.1f}s | {pulados} arquivo(s) pulados antes do download")
+        soma = 0.0
+        for st in stages:
+            # Tempo "de relógio" do estágio = tempo ocupado / nº de workers
+            por_worker = st.segundos_ocupado / st.workers if st.workers else 0.0
+            soma += por_worker
+            print(f"   ∟ {st.nome}: {st.processados} item(ns) | {st.workers} worker(s) | "
+                  f"{st.segundos_ocupado:.1f}s ocupados (~{por_worker:.1f}s por worker)")
+        print(f"   ∟ Soma dos estágios: ~{soma:.1f}s vs. total real {wall:.1f}s")
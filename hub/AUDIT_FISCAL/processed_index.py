@@ -0,0 +1,185 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+
+class BloomFilter:
+    """Bloom filter simples (bytearray + hash duplo) — sem falsos negativos."""
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01, bits=None):
+        self.capacity = capacity
+        self.n_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None and len(bits) == (self.n_bits + 7) // 8 else bytearray((self.n_bits + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class ProcessedIndex:
+    """
+    Índice local (SQLite) de todos os arquivos já gravados no BigQuery, com um
+    Bloom filter na frente. Substitui o "SELECT DISTINCT id_arquivo dos últimos
+    7 dias": cobre todo o histórico e cada checagem custa O(1) — a maioria dos
+    arquivos novos é descartada pelo Bloom sem nem consultar o SQLite.
+
+    Sincroniza com o BigQuery de forma incremental, pela marca d'água de
+    data_processamento (só busca o que entrou desde a última sincronização).
+    Também guarda o hash de conteúdo (md5 do Drive) de cada arquivo processado.
+    """
+
+    # Margem para linhas do streaming buffer que chegam atrasadas
+    WATERMARK_OVERLAP = timedelta(hours=1)
+
+    def __init__(self, path, capacity=1_000_000):
+        self.path = path
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS processados (id_arquivo TEXT PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS conteudos (chave TEXT PRIMARY KEY, id_arquivo TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v)")
+        self._conn.commit()
+
+        self._load_bloom(capacity)
+
+    # ------------------------------------------------------------------
+    # Bloom filter (persistido no próprio SQLite)
+    # ------------------------------------------------------------------
+    def _meta(self, k, default=None):
+        row = self._conn.execute("SELECT v FROM meta WHERE k = ?", (k,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, k, v):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (k, v))
+
+    def _load_bloom(self, capacity):
+        total = self._conn.execute("SELECT COUNT(*) FROM processados").fetchone()[0]
+        # Cresce em potências de 2 para não reconstruir o filtro a cada execução
+        while capacity < total * 2:
+            capacity *= 2
+        blob = self._meta('bloom_bits')
+
+        # O Bloom salvo só vale se cobrir exatamente o que está no SQLite
+        # (se o processo caiu antes do flush, reconstrói — nunca pode faltar ID)
+        if blob is not None and self._meta('bloom_count') == total and self._meta('bloom_capacity') == capacity:
+            self.bloom = BloomFilter(capacity, bits=bytearray(blob))
+            return
+
+        self.bloom = BloomFilter(capacity)
+        for (id_arquivo,) in self._conn.execute("SELECT id_arquivo FROM processados"):
+            self.bloom.add(id_arquivo)
+        self._flush_bloom(total)
+
+    def _flush_bloom(self, total=None):
+        if total is None:
+            total = self._conn.execute("SELECT COUNT(*) FROM processados").fetchone()[0]
+        self._set_meta('bloom_bits', bytes(self.bloom.bits))
+        self._set_meta('bloom_count', total)
+        self._set_meta('bloom_capacity', self.bloom.capacity)
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Consulta / gravação
+    # ------------------------------------------------------------------
+    def __contains__(self, id_arquivo):
+        if id_arquivo not in self.bloom:
+            return False  # Certeza: nunca processado
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM processados WHERE id_arquivo = ?", (id_arquivo,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM processados").fetchone()[0]
+
+    def has_content(self, chave):
+        if not chave:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM conteudos WHERE chave = ?", (chave,)).fetchone()
+        return row is not None
+
+    def add(self, id_arquivo, chave_conteudo=None):
+        """Marca um arquivo como processado (chamado depois do insert no BigQuery)."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO processados VALUES (?)", (id_arquivo,))
+            if chave_conteudo:
+                self._conn.execute("INSERT OR IGNORE INTO conteudos VALUES (?, ?)", (chave_conteudo, id_arquivo))
+            self._conn.commit()
+            self.bloom.add(id_arquivo)
+
+    def sync_from_bigquery(self, client, table_id):
+        """
+        Traz do BigQuery só os IDs gravados depois da marca d'água.
+        Na 1ª vez (sem marca) lê o histórico inteiro — uma única vez.
+
+        A marca é o MAX(data_processamento) devolvido pelo próprio BigQuery,
+        guardada no tipo da coluna (TIMESTAMP vem com fuso, DATETIME sem) e
+        comparada com um parâmetro desse mesmo tipo — nada de relógio local.
+        """
+        from google.cloud import bigquery
+
+        watermark = self._meta('watermark_bq')
+        job_config = None
+        filtro = ""
+        if watermark:
+            desde = datetime.fromisoformat(watermark) - self.WATERMARK_OVERLAP
+            tipo = "TIMESTAMP" if desde.tzinfo else "DATETIME"
+            filtro = "WHERE data_processamento > @desde"
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("desde", tipo, desde)
+            ])
+
+        query = f"""
+            SELECT id_arquivo, MAX(data_processamento) AS ultima
+            FROM `{table_id}`
+            {filtro}
+            GROUP BY id_arquivo
+        """
+        rows = list(client.query(query, job_config=job_config).result())
+
+        nova_marca = datetime.fromisoformat(watermark) if watermark else None
+        with self._lock:
+            novos = 0
+            for row in rows:
+                if row['id_arquivo'] is None:
+                    continue
+                cur = self._conn.execute("INSERT OR IGNORE INTO processados VALUES (?)", (row['id_arquivo'],))
+                if cur.rowcount:
+                    novos += 1
+                    self.bloom.add(row['id_arquivo'])
+                ultima = row['ultima']
+                if ultima is not None and (nova_marca is None or ultima > nova_marca):
+                    nova_marca = ultima
+
+            if nova_marca is not None:
+                self._set_meta('watermark_bq', nova_marca.isoformat())
+            self._flush_bloom()
+
+        modo = "incremental" if watermark else "completa"
+        print(f"🛡️ [ANTI-DUPLICATA] Sincronização {modo}: +{novos} ID(s). Índice local com {len(self)} arquivos.")
+        return novos
+
+    def close(self):
+        with self._lock:
+            self._flush_bloom()
+            self._conn.close()
@@ -1,14 +1,16 @@
-import re
 import pandas as pd
 from googleapiclient.discovery import build
 from config import SPREADSHEET_ID, CNPJ_TAXBASE
+from id_scanner import IdentifierIndex
 
 
 class ReferenceLoader:
     def __init__(self, creds):
         self.service = build('sheets', 'v4', credentials=creds)
         self.df_empresas = None
+        self.inactive_records = []  # Empresas de fonte vermelha (fora da busca, mas sincronizadas como inativas)
         self.fast_lookup = {}  # Dicionário de busca rápida
+        self.id_index = IdentifierIndex()  # Mesmo conteúdo, chave inteira (usado pelo scanner)
         self.taxbase_clean = self._clean_number(CNPJ_TAXBASE)
 
     def _clean_number(self, value):
@@ -82,6 +84,10 @@ class ReferenceLoader:
             return
 
         data = []
+        self.inactive_records = []
+        # Recarga (main.py --intervalo): reconstrói os índices do zero, sem sobras de empresas removidas
+        self.fast_lookup = {}
+        self.id_index = IdentifierIndex()
         count_im_ie = 0
         count_skipped_red = 0
 
@@ -91,6 +97,13 @@ class ReferenceLoader:
             # Verificar se esta linha é vermelha (empresa inativa)
             if idx in red_rows:
                 count_skipped_red += 1
+                row_padded = row + [""] * (10 - len(row))
+                cnpj = self._clean_number(row_padded[2])
+                if cnpj:
+                    self.inactive_records.append({
+                        "grupo": row_padded[0], "empresa": row_padded[1], "cnpj": cnpj,
+                        "ie": self._clean_number(row_padded[8]), "im": self._clean_number(row_padded[9])
+                    })
                 continue
 
             # Garante tamanho 10 para não dar erro de indice
@@ -115,12 +128,16 @@ class ReferenceLoader:
 
                     # --- INDEXAÇÃO PODEROSA ---
                     # Adiciona no dicionário de busca rápida por todos os campos
-                    if cnpj: self.fast_lookup[cnpj] = record
+                    if cnpj:
+                        self.fast_lookup[cnpj] = record
+                        self.id_index.add(cnpj, record, "CNPJ")
                     if ie:
                         self.fast_lookup[ie] = record
+                        self.id_index.add(ie, record, "IE")
                         count_im_ie += 1
                     if im:
                         self.fast_lookup[im] = record
+                        self.id_index.add(im, record, "IM")
                         count_im_ie += 1
 
             except Exception as e:
@@ -136,48 +153,21 @@ class ReferenceLoader:
         Recebe o TEXTO COMPLETO do PDF e procura qualquer vestígio da empresa
         (CNPJ, IE ou IM). Aplica a regra de exclusão da Taxbase.
         """
-        if not text: return None, None
-
-        # 1. Limpa o texto do PDF para deixar apenas sequências numéricas
-        # Remove pontos, traços e barras para bater com o banco de dados
-        text_clean = text.replace('.', '').replace('-', '').replace('/', '')
-
-        # Encontra todas as sequências numéricas de 5 dígitos ou mais (para ignorar lixo)
-        # Ex: Pega 12345678000199 (CNPJ), pega 123456 (IM)
-        found_tokens = re.findall(r'\d{5,}', text_clean)
-
-        matches = []
-        seen_cnpjs = set()
-
-        # 2. Verifica cada número achado no PDF contra nosso banco de dados
-        for token in found_tokens:
-            if token in self.fast_lookup:
-                empresa_match = self.fast_lookup[token]
-                cnpj_match = empresa_match['cnpj']
-
-                # Evita duplicatas na lista de candidatos
-                if cnpj_match not in seen_cnpjs:
-                    matches.append(empresa_match)
-                    seen_cnpjs.add(cnpj_match)
-
-        if not matches:
+        best = self.identify_with_reason(text)
+        if not best:
             return None, None
+        # Retorna o CNPJ correto do cliente (mesmo que o PDF só tivesse o IM)
+        return best['registro'], best['cnpj']
 
-        # 3. REGRA DE OURO: Filtragem da Taxbase
-        # Se houver qualquer empresa que NÃO seja a Taxbase, usamos ela.
-        non_taxbase = [m for m in matches if m['cnpj'] != self.taxbase_clean]
-
-        if non_taxbase:
-            # SUCESSO: Achamos um cliente (pelo CNPJ, IE ou IM)
-            # Retorna o CNPJ correto do cliente (mesmo que o PDF só tivesse o IM)
-            best_match = non_taxbase[0]
-            return best_match, best_match['cnpj']
-
-        # Se só sobrou a Taxbase na lista, paciência, é um documento da Taxbase mesmo
-        if matches:
-            return matches[0], matches[0]['cnpj']
-
-        return None, None
+    def identify_with_reason(self, text):
+        """
+        Melhor match do texto, com o motivo (ex.: "IM 123456"), ou None.
+        O ranking já aplica a REGRA DE OURO: qualquer empresa que NÃO seja a
+        Taxbase vem antes dela; a Taxbase só sai se for a única no documento.
+        """
+        if not text: return None
+        matches = self.id_index.match(text)
+        return matches[0] if matches else None
 
     # Mantemos esse para compatibilidade se precisar buscar só por CNPJ direto
     def find_company(self, search_term):
@@ -0,0 +1,101 @@
+"""
+Tabela "registros atuais" do auditor (BQ_TABLE_CURRENT).
+
+É a registros_auditoria já sem os descartados (controle_descartados) e com as
+alocações manuais (que são UPDATE na própria tabela de origem), mais a coluna
+competencia_painel: a competência em que o registro aparece no painel (EFD
+Contribuições entra um mês depois do seu período).
+
+Particionada por mês de competencia_painel e clusterizada por cnpj e
+categoria, então o painel lê uma única partição, sem o NOT EXISTS com
+TIMESTAMP_TRUNC a cada requisição.
+
+Manutenção:
+  - recriar_registros_atuais(client): reconstrução completa (python registros_atuais.py)
+  - atualizar_registros_atuais(client, ids): só os arquivos alterados (pipeline e
+    ações do painel). Retorna as competências afetadas ("MM/YYYY").
+"""
+from datetime import datetime
+
+from config import BQ_TABLE_ID, BQ_TABLE_DISCARDED, BQ_TABLE_CURRENT
+
+# Competência do painel a partir do período do registro (NULL se o período for inválido)
+COMPETENCIA_PAINEL_SQL = """
+    IF(t.categoria = 'EFD_CONTRIBUICOES',
+       DATE_ADD(SAFE.PARSE_DATE('%m/%Y', t.periodo), INTERVAL 1 MONTH),
+       SAFE.PARSE_DATE('%m/%Y', t.periodo))
+"""
+
+_SELECT_ATUAIS = f"""
+    SELECT t.*, {COMPETENCIA_PAINEL_SQL} AS competencia_painel
+    FROM `{BQ_TABLE_ID}` t
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM `{BQ_TABLE_DISCARDED}` d
+        WHERE d.id_arquivo = t.id_arquivo
+        AND TIMESTAMP_TRUNC(d.data_processamento, SECOND) = TIMESTAMP_TRUNC(t.data_processamento, SECOND)
+    )
+"""
+
+
+def competencia_para_data(competencia):
+    """'MM/YYYY' -> 'YYYY-MM-01' (valor da coluna competencia_painel)."""
+    return datetime.strptime(competencia, "%m/%Y").strftime("%Y-%m-01")
+
+
+def recriar_registros_atuais(client):
+    """Reconstrói a tabela inteira a partir da registros_auditoria."""
+    query = f"""
+        CREATE OR REPLACE TABLE `{BQ_TABLE_CURRENT}`
+        PARTITION BY DATE_TRUNC(competencia_painel, MONTH)
+        CLUSTER BY cnpj, categoria
+        AS {_SELECT_ATUAIS}
+    """
+    client.query(query).result()
+    print(f"✅ [REGISTROS ATUAIS] {BQ_TABLE_CURRENT} recriada.")
+
+
+def atualizar_registros_atuais(client, ids):
+    """
+    Atualização incremental: reescreve só as linhas dos arquivos informados
+    (novos, alocados ou descartados). Um único job (script).
+    Retorna o set de competências ("MM/YYYY") que mudaram.
+    """
+    from google.cloud import bigquery
+
+    ids = sorted({i for i in ids if i})
+    if not ids:
+        return set()
+
+    script = f"""
+        DECLARE competencias ARRAY<DATE> DEFAULT (
+            SELECT ARRAY_AGG(DISTINCT c IGNORE NULLS) FROM (
+                SELECT competencia_painel AS c FROM `{BQ_TABLE_CURRENT}` WHERE id_arquivo IN UNNEST(@ids)
+                UNION ALL
+                SELECT {COMPETENCIA_PAINEL_SQL} AS c FROM `{BQ_TABLE_ID}` t WHERE t.id_arquivo IN UNNEST(@ids)
+            )
+        );
+
+        DELETE FROM `{BQ_TABLE_CURRENT}` WHERE id_arquivo IN UNNEST(@ids);
+
+        INSERT INTO `{BQ_TABLE_CURRENT}`
+        {_SELECT_ATUAIS}
+        AND t.id_arquivo IN UNNEST(@ids);
+
+        SELECT FORMAT_DATE('%m/%Y', c) AS competencia FROM UNNEST(competencias) c;
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("ids", "STRING", ids)
+    ])
+    competencias = {row['competencia'] for row in client.query(script, job_config=job_config).result()}
+    print(f"🔄 [REGISTROS ATUAIS] {len(ids)} arquivo(s) atualizados | competências: {', '.join(sorted(competencias)) or '-'}")
+    return competencias
+
+
+if __name__ == "__main__":
+    from google.oauth2 import service_account
+    from google.cloud import bigquery
+
+    creds = service_account.Credentials.from_service_account_file(
+        'credentials.json', scopes=['https://www.googleapis.com/auth/cloud-platform'])
+    recriar_registros_atuais(bigquery.Client(credentials=creds))
@@ -0,0 +1,116 @@
+"""
+Teste offline do DriveWatcher com o Drive falso (fake_drive.py).
+Valida: feed incremental (Changes API), token persistido e filtro de pastas.
+"""
+import sys
+import os
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import ROOT_FOLDER_ID
+from fake_drive import FakeDriveService
+from drive_watcher import DriveWatcher
+
+
+def _watcher(drive, pasta_tmp):
+    return DriveWatcher(
+        None,
+        folder_tree_path=os.path.join(pasta_tmp, 'folders.json'),
+        changes_token_path=os.path.join(pasta_tmp, 'token.json'),
+        service=drive,
+    )
+
+
+def test_feed_incremental():
+    drive = FakeDriveService()
+    drive.add_folder('cli_a', 'Cliente A', parent=ROOT_FOLDER_ID)
+    drive.add_folder('entradas', '01 - ENTRADAS', parent='cli_a')
+    drive.add_folder('fora', 'Outra Pasta', parent=None)
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        # Já existe um token salvo (execução anterior)
+        watcher = _watcher(drive, pasta_tmp)
+        watcher.commit_changes_token(drive.changes().getStartPageToken().execute()['startPageToken'])
+
+        drive.add_pdf('f1', 'DCTFWEB 01.2026.pdf', parent='cli_a')
+        drive.add_pdf('f2', 'Nota entrada.pdf', parent='entradas')
+        drive.add_pdf('f3', 'ISS 01.2026.pdf', parent='fora')
+
+        files, token = watcher.get_changed_files()
+        assert [f['id'] for f in files] == ['f1'], files
+        watcher.commit_changes_token(token)
+
+        # Próxima rodada (novo processo): só vê o que mudou depois do token
+        drive.add_pdf('f4', 'REINF 01.2026.pdf', parent='cli_a')
+        drive.trash('f1')
+        watcher = _watcher(drive, pasta_tmp)
+        files, token = watcher.get_changed_files()
+        assert [f['id'] for f in files] == ['f4'], files
+
+        # Validação de pastas saiu do mapa em disco, sem files().get
+        assert drive.calls['files.get'] == 0, drive.calls
+
+
+def test_pasta_renomeada_no_feed():
+    drive = FakeDriveService()
+    drive.add_folder('cli_a', 'Cliente A', parent=ROOT_FOLDER_ID)
+    drive.add_folder('sub', 'Documentos', parent='cli_a')
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        watcher = _watcher(drive, pasta_tmp)
+        watcher.prefetch_folder_tree()
+        watcher.commit_changes_token(drive.changes().getStartPageToken().execute()['startPageToken'])
+
+        # Pasta passa a ser proibida e recebe um PDF na mesma rodada
+        drive.add_folder('sub', '02 - SAÍDAS', parent='cli_a')
+        drive.add_pdf('f1', 'Recibo SPED.pdf', parent='sub')
+
+        files, _ = watcher.get_changed_files()
+        assert files == [], files
+
+
+def test_pasta_removida_sai_do_mapa():
+    drive = FakeDriveService()
+    drive.add_folder('cli_a', 'Cliente A', parent=ROOT_FOLDER_ID)
+    drive.add_folder('velha', 'Arquivo Morto', parent='cli_a')
+    drive.add_folder('antiga', 'Antiga', parent='cli_a')
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        watcher = _watcher(drive, pasta_tmp)
+        watcher.prefetch_folder_tree()
+        watcher.commit_changes_token(drive.changes().getStartPageToken().execute()['startPageToken'])
+
+        # Sincronização incremental da árvore: pasta na lixeira sai do mapa
+        drive.trash('velha')
+        watcher = _watcher(drive, pasta_tmp)
+        watcher.prefetch_folder_tree()
+        assert 'velha' not in watcher.folder_tree and 'velha' not in watcher.folder_cache
+
+        # Feed de alterações: pasta excluída de vez também sai
+        drive.delete('antiga')
+        watcher.get_changed_files()
+        assert 'antiga' not in watcher.folder_tree and 'antiga' not in watcher.folder_cache
+        assert 'cli_a' in watcher.folder_tree
+
+
+def test_pasta_renomeada_no_prefetch():
+    drive = FakeDriveService()
+    drive.add_folder('cli_a', 'Cliente A', parent=ROOT_FOLDER_ID)
+    drive.add_folder('sub', 'Documentos', parent='cli_a')
+
+    with tempfile.TemporaryDirectory() as pasta_tmp:
+        watcher = _watcher(drive, pasta_tmp)
+        watcher.prefetch_folder_tree()
+        assert watcher._check_folder_safety('sub')[0] is True
+
+        # Mesmo watcher (main.py --intervalo): a releitura incremental pega o novo nome
+        drive.add_folder('sub', '02 - SAÍDAS', parent='cli_a')
+        watcher.prefetch_folder_tree()
+        assert watcher._check_folder_safety('sub')[0] is False
+
+
+if __name__ == "__main__":
+    for teste in (test_feed_incremental, test_pasta_renomeada_no_feed, test_pasta_removida_sai_do_mapa,
+                  test_pasta_renomeada_no_prefetch):
+        teste()
+        print(f"✅ {teste.__name__}")
@@ -0,0 +1,64 @@
+"""
+Teste rápido do scanner de identificadores (id_scanner.py).
+Valida: CNPJ formatado, número quebrado pelo OCR, I.E./I.M. e regra da Taxbase.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from id_scanner import IdentifierIndex, TAXBASE, find_cnpjs
+
+CLIENTE = {"empresa": "Cliente A", "cnpj": "11222333000181"}
+OUTRO = {"empresa": "Cliente B", "cnpj": "45997418000153"}
+TAXBASE_REC = {"empresa": "Taxbase", "cnpj": TAXBASE}
+
+
+def _index():
+    index = IdentifierIndex()
+    index.add(CLIENTE["cnpj"], CLIENTE, "CNPJ")
+    index.add("0123456", CLIENTE, "IE")
+    index.add("987654", OUTRO, "IM")
+    index.add(TAXBASE, TAXBASE_REC, "CNPJ")
+    return index
+
+
+def test_cnpj_formatado_e_quebrado():
+    assert find_cnpjs("CNPJ: 11.222.333/0001-81") == ["11222333000181"]
+    # OCR quebrou o número em duas linhas: só vale se o dígito verificador bater
+    assert find_cnpjs("CNPJ 11.222.333/\n0001-81") == ["11222333000181"]
+    assert find_cnpjs("Competência 01/2026 1234567890") == []
+
+
+def test_ranking_e_motivo():
+    index = _index()
+    index.add(OUTRO["cnpj"], OUTRO, "CNPJ")
+    texto = f"Escritório 49.756.007/0001-27\nCNPJ 45.997.418/\n0001-53\nIE 0123456"
+    matches = index.match(texto)
+    # Clientes antes da Taxbase; número inteiro antes de número unido
+    assert [m["registro"]["empresa"] for m in matches] == ["Cliente A", "Cliente B", "Taxbase"], matches
+    assert matches[0]["motivo"] == "IE 0123456"
+    assert matches[1]["unido"] is True
+
+    # Zeros à esquerda fazem parte da chave
+    assert "123456" not in index and "0123456" in index
+
+
+def test_ie_im_unido_nao_vale():
+    index = _index()
+    # Dois números vizinhos colados formam a I.M. de um cliente: não pode identificar
+    texto = "Página 987 654\nValor 0123 456"
+    assert index.match(texto) == []
+    assert not index.has_client(texto)
+
+
+def test_so_taxbase():
+    index = _index()
+    assert index.match("CNPJ 49756007000127")[0]["taxbase"] is True
+    assert not index.has_client("CNPJ 49756007000127")
+    assert index.has_client("I.M. 987654")
+
+
+if __name__ == "__main__":
+    for teste in (test_cnpj_formatado_e_quebrado, test_ranking_e_motivo, test_ie_im_unido_nao_vale, test_so_taxbase):
+        teste()
+        print(f"✅ {teste.__name__}")
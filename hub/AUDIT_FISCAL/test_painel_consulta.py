@@ -0,0 +1,76 @@
+"""
+Teste offline do PainelIndex (filtros, ordenação e cursor do painel do hub).
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from painel_consulta import PainelIndex
+
+
+def _empresa(cnpj, empresa, grupo, entregues, pendentes):
+    total = len(entregues) + pendentes
+    progresso = len(entregues) / total if total else 1.0
+    return {
+        'cnpj': cnpj, 'empresa': empresa, 'grupo': grupo, 'entregues': entregues,
+        'faltantes_ativos': ['X'] * pendentes, 'faltantes_ignorados': [],
+        'qtd_pendentes': pendentes, 'progresso': progresso,
+        'status': 'OK' if progresso == 1 else 'PENDENTE', 'has_delivery': bool(entregues),
+    }
+
+
+def _painel():
+    return PainelIndex([
+        _empresa('1', 'Padaria São João', 'Grupo B', ['DCTFWEB'], 1),
+        _empresa('2', 'Alfa Comércio', 'Grupo A', ['DCTFWEB', 'REINF'], 0),
+        _empresa('3', 'Beta Serviços', 'Grupo A', [], 2),
+        _empresa('4', 'Gama Indústria', 'Grupo B', ['REINF'], 0),
+        _empresa('5', 'Delta Transportes', 'Sem Grupo', [], 3),
+    ])
+
+
+def test_paginacao_por_cursor():
+    painel = _painel()
+    vistos, cursor = [], None
+    while True:
+        pagina = painel.consultar(limite=2, cursor=cursor)
+        vistos += [e['cnpj'] for e in pagina['painel']]
+        cursor = pagina['proximo_cursor']
+        if not cursor:
+            break
+    # Ordem padrão: grupo, empresa
+    assert vistos == ['2', '3', '4', '1', '5'], vistos
+    assert painel.consultar(limite=2)['total'] == 5
+
+
+def test_filtros_e_ordem():
+    painel = _painel()
+    r = painel.consultar(busca='sao joao')
+    assert [e['cnpj'] for e in r['painel']] == ['1'], r
+
+    r = painel.consultar(pendentes=True, ordem='-pendentes')
+    assert [e['cnpj'] for e in r['painel']] == ['5', '3', '1'], r
+
+    r = painel.consultar(grupo='Grupo A', status='OK')
+    assert [e['cnpj'] for e in r['painel']] == ['2'] and r['total'] == 1, r
+
+    r = painel.consultar(com_entrega=True, ordem='-progresso', limite=2)
+    assert [e['cnpj'] for e in r['painel']] == ['2', '4'] and r['proximo_cursor'], r
+    r = painel.consultar(com_entrega=True, ordem='-progresso', limite=2, cursor=r['proximo_cursor'])
+    assert [e['cnpj'] for e in r['painel']] == ['1'] and r['proximo_cursor'] is None, r
+
+    assert painel.resumo['pendencias'] == 6 and painel.resumo['status_ok'] == 2
+
+
+def test_cursor_sobrevive_recalculo():
+    pagina = _painel().consultar(limite=2)
+    # Painel recalculado com uma empresa nova antes da 2ª página
+    empresas = _painel().empresas + [_empresa('6', 'Aaa Nova', 'Grupo B', [], 1)]
+    r = PainelIndex(empresas).consultar(limite=10, cursor=pagina['proximo_cursor'])
+    assert [e['cnpj'] for e in r['painel']] == ['6', '4', '1', '5'], r
+
+
+if __name__ == "__main__":
+    for teste in (test_paginacao_por_cursor, test_filtros_e_ordem, test_cursor_sobrevive_recalculo):
+        teste()
+        print(f"✅ {teste.__name__}")
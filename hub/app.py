@@ -7,6 +7,7 @@ import sys
 import json
 import hashlib
 import time
+import threading
 import requests
 from datetime import datetime, timedelta
 from functools import wraps
@@ -43,6 +44,8 @@ BQ_TABLE_ID = 'auditor-processos.auditoria_fiscal.registros_auditoria'
 BQ_TABLE_MASTER = 'auditor-processos.auditoria_fiscal.empresas_obrigacoes'
 BQ_TABLE_IGNORED = 'auditor-processos.auditoria_fiscal.controle_ignorados'
 BQ_TABLE_DISCARDED = 'auditor-processos.auditoria_fiscal.controle_descartados'
+# Estado atual (sem descartados, com alocações), mantido por AUDIT_FISCAL/registros_atuais.py
+BQ_TABLE_CURRENT = 'auditor-processos.auditoria_fiscal.registros_atuais'
 
 
 # ==============================================================================
@@ -52,27 +55,71 @@ BQ_TABLE_DISCARDED = 'auditor-processos.auditoria_fiscal.controle_descartados'
 def hash_senha(senha):
     return hashlib.sha256(senha.encode()).hexdigest()
 
-def get_bq_client():
-    from google.cloud import bigquery
-    # Tenta carregar do arquivo local (Dev)
-    if os.path.exists(KEY_FILE):
-        from google.oauth2 import service_account
-        creds = service_account.Credentials.from_service_account_file(
-            KEY_FILE,
-            scopes=["https://www.googleapis.com/auth/bigquery",
-                    "https://www.googleapis.com/auth/spreadsheets.readonly",
-                    "https://www.googleapis.com/auth/drive.readonly"]
-        )
-        return bigquery.Client(credentials=creds, project=BQ_PROJECT_ID)
-    
-    # Fallback para credenciais padrão (Cloud Run)
-    import google.auth
-    creds, project = google.auth.default(
-        scopes=["https://www.googleapis.com/auth/bigquery",
-                "https://www.googleapis.com/auth/spreadsheets.readonly",
-                "https://www.googleapis.com/auth/drive.readonly"]
-    )
-    return bigquery.Client(credentials=creds, project=BQ_PROJECT_ID)
+# Credenciais e clientes BigQuery são criados uma vez por processo e
+# compartilhados por todas as rotas (ler o JSON da service account e montar o
+# Client a cada query custava centenas de ms por requisição).
+BQ_SCOPES = ["https://www.googleapis.com/auth/bigquery",
+             "https://www.googleapis.com/auth/spreadsheets.readonly",
+             "https://www.googleapis.com/auth/drive.readonly"]
+BQ_HTTP_POOL_SIZE = 32
+
+_bq_lock = threading.Lock()
+_bq_credentials = None
+_bq_clients = {}  # projeto -> bigquery.Client
+
+
+def get_bq_credentials():
+    """Retorna credenciais do BigQuery (Arquivo local ou Default/Cloud), em cache"""
+    global _bq_credentials
+    if _bq_credentials is not None:
+        return _bq_credentials
+
+    with _bq_lock:
+        if _bq_credentials is not None:
+            return _bq_credentials
+        try:
+            # Tenta carregar do arquivo local (Dev)
+            if os.path.exists(KEY_FILE):
+                from google.oauth2 import service_account
+                _bq_credentials = service_account.Credentials.from_service_account_file(KEY_FILE, scopes=BQ_SCOPES)
+            else:
+                # Fallback para credenciais padrão do ambiente (Cloud Run)
+                import google.auth
+                _bq_credentials, _ = google.auth.default(scopes=BQ_SCOPES)
+        except Exception as e:
+            print(f"Erro ao obter credenciais: {e}")
+            return None
+    return _bq_credentials
+
+
+def get_bq_client(project=BQ_PROJECT_ID):
+    """
+    Client BigQuery compartilhado (um por projeto, criado na 1ª chamada).
+    project=None usa o projeto das credenciais (tabelas do Auditor Fiscal).
+    A sessão HTTP tem pool de conexões para as threads do servidor.
+    """
+    client = _bq_clients.get(project)
+    if client is not None:
+        return client
+
+    creds = get_bq_credentials()
+    if creds is None:
+        raise RuntimeError("Credenciais BigQuery não configuradas")
+
+    with _bq_lock:
+        client = _bq_clients.get(project)
+        if client is None:
+            from google.cloud import bigquery
+            from google.auth.transport.requests import AuthorizedSession
+            from requests.adapters import HTTPAdapter
+
+            session = AuthorizedSession(creds)
+            adapter = HTTPAdapter(pool_connections=BQ_HTTP_POOL_SIZE, pool_maxsize=BQ_HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+
+            client = bigquery.Client(credentials=creds, project=project, _http=session)
+            _bq_clients[project] = client
+    return client
 
 def run_query(query):
     """Executa query SQL e retorna lista de dicts"""
@@ -106,12 +153,127 @@ def run_command(query):
         print(f"Erro Command: {e}")
         return False
 
+# ------------------------------------------------------------------------------
+# CACHE DAS TABELAS DO HUB (usuarios, funcoes, sistemas)
+# Mudam raramente: ficam em memória com TTL. Vencido o TTL, a leitura devolve o
+# conteúdo atual e recarrega em segundo plano (login/home não esperam o job do
+# BigQuery). Os endpoints de criar/editar/excluir invalidam a tabela na hora.
+# Warm start: snapshot local salvo a cada carga (cache/<tabela>.json) ou, na
+# falta dele, o <tabela>_taxbase.json do repositório.
+# ------------------------------------------------------------------------------
+CACHE_TABELAS_TTL = int(os.environ.get('CACHE_TABELAS_TTL', 300))  # segundos
+CACHE_TABELAS_DIR = os.path.join(os.path.dirname(__file__), 'cache')
+TABELAS_HUB = {
+    'usuarios': TABLE_USUARIOS,
+    'funcoes': TABLE_FUNCOES,
+    'sistemas': TABLE_SISTEMAS,
+}
+
+_tabelas = {}  # nome -> {'linhas': [...], 'expira_em': epoch, 'do_bigquery': bool, 'invalidada': bool}
+_tabelas_lock = threading.Lock()
+_tabelas_warm_start = set()  # Snapshot local só vale uma vez, na subida do processo
+_tabelas_recarregando = set()
+_tabelas_geracao = {}  # nome -> nº de invalidações (recarga iniciada antes de uma edição não grava)
+
+
+def _ler_snapshot(nome):
+    for caminho in (os.path.join(CACHE_TABELAS_DIR, f'{nome}.json'),
+                    os.path.join(os.path.dirname(__file__), f'{nome}_taxbase.json')):
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def _salvar_snapshot(nome, linhas):
+    try:
+        os.makedirs(CACHE_TABELAS_DIR, exist_ok=True)
+        tmp = os.path.join(CACHE_TABELAS_DIR, f'{nome}.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(linhas, f, ensure_ascii=False, default=str)
+        os.replace(tmp, os.path.join(CACHE_TABELAS_DIR, f'{nome}.json'))
+    except Exception as e:
+        print(f"DEBUG: Não foi possível salvar snapshot de {nome}: {e}")
+
+
+def _recarregar_tabela(nome):
+    """Lê a tabela do BigQuery. Resultado vazio (erro/BQ fora) não sobrescreve o que já temos."""
+    with _tabelas_lock:
+        geracao = _tabelas_geracao.get(nome, 0)
+    linhas = run_query(f"SELECT * FROM `{TABELAS_HUB[nome]}`")
+    with _tabelas_lock:
+        _tabelas_recarregando.discard(nome)
+        if _tabelas_geracao.get(nome, 0) != geracao:
+            return linhas  # Tabela editada durante a leitura: a próxima chamada lê de novo
+        if not linhas:
+            entrada = _tabelas.get(nome)
+            if entrada:
+                entrada['expira_em'] = time.time() + CACHE_TABELAS_TTL
+                entrada['invalidada'] = False
+            return entrada['linhas'] if entrada else []
+        _tabelas[nome] = {'linhas': linhas, 'expira_em': time.time() + CACHE_TABELAS_TTL,
+                          'do_bigquery': True, 'invalidada': False}
+    _salvar_snapshot(nome, linhas)
+    return linhas
+
+
+def carregar_tabela(nome, forcar=False):
+    """Linhas da tabela (cópias rasas — pode alterar os dicts à vontade)."""
+    with _tabelas_lock:
+        entrada = _tabelas.get(nome)
+        if entrada is None and not forcar and nome not in _tabelas_warm_start:
+            _tabelas_warm_start.add(nome)
+            snapshot = _ler_snapshot(nome)
+            if snapshot:
+                # Warm start: usa o snapshot já e confirma no BigQuery em segundo plano
+                entrada = {'linhas': snapshot, 'expira_em': 0, 'do_bigquery': False, 'invalidada': False}
+                _tabelas[nome] = entrada
+        # Editada aqui: relê na hora (o cache e o snapshot são de antes da edição)
+        forcar = forcar or bool(entrada and entrada['invalidada'])
+        vencida = entrada is not None and entrada['expira_em'] < time.time()
+        recarregar_em_background = vencida and not forcar and nome not in _tabelas_recarregando
+        if recarregar_em_background:
+            _tabelas_recarregando.add(nome)
+
+    if entrada is None or forcar:
+        linhas = _recarregar_tabela(nome)
+    else:
+        if recarregar_em_background:
+            threading.Thread(target=_recarregar_tabela, args=(nome,), daemon=True).start()
+        linhas = entrada['linhas']
+    return [dict(linha) for linha in linhas]
+
+
+def tabela_confirmada(nome):
+    """True se o cache da tabela veio do BigQuery (e não só do snapshot local)."""
+    with _tabelas_lock:
+        entrada = _tabelas.get(nome)
+        return bool(entrada and entrada['do_bigquery'])
+
+
+def invalidar_tabela(*nomes):
+    """
+    Marca as tabelas como editadas: a próxima leitura vai ao BigQuery na hora.
+    As linhas antigas ficam só como fallback se o BigQuery não responder.
+    """
+    with _tabelas_lock:
+        for nome in nomes:
+            _tabelas_warm_start.add(nome)
+            entrada = _tabelas.get(nome)
+            if entrada:
+                entrada['invalidada'] = True
+                entrada['expira_em'] = 0
+            _tabelas_geracao[nome] = _tabelas_geracao.get(nome, 0) + 1
+
+
 # ==============================================================================
 # FUNÇÕES DE PERMISSÕES
 # ==============================================================================
 
 def carregar_funcoes():
-    return run_query(f"SELECT * FROM `{TABLE_FUNCOES}`")
+    return carregar_tabela('funcoes')
 
 def obter_funcao_por_id(funcao_id):
     # Fallback local para dev
@@ -120,7 +282,7 @@ def obter_funcao_por_id(funcao_id):
         "admin": {"id": "admin", "nome": "Administrador", "permissao": "admin", "sistemas": ["*"]},
     }
     
-    res = run_query(f"SELECT * FROM `{TABLE_FUNCOES}` WHERE id = '{funcao_id}'")
+    res = [f for f in carregar_funcoes() if f.get('id') == funcao_id]
     if res:
         return res[0]
     
@@ -132,7 +294,7 @@ def obter_funcao_por_id(funcao_id):
 
 def obter_funcao_usuario(email):
     # Join manual para evitar complexidade na query agora
-    res_user = run_query(f"SELECT * FROM `{TABLE_USUARIOS}` WHERE email = '{email}'")
+    res_user = [u for u in carregar_tabela('usuarios') if u.get('email') == email]
     if not res_user: return None
     
     user = res_user[0]
@@ -185,9 +347,14 @@ def verificar_login(email, senha):
         }
     }
     
-    # Tenta BigQuery primeiro
-    query = f"SELECT * FROM `{TABLE_USUARIOS}` WHERE email = '{safe_email}' AND senha = '{senha_hash}'"
-    res = run_query(query)
+    # Tenta a tabela de usuários (cache em memória do BigQuery)
+    def buscar(usuarios):
+        return [u for u in usuarios if u.get('email') == safe_email and u.get('senha') == senha_hash]
+
+    res = buscar(carregar_tabela('usuarios'))
+    if not res and not tabela_confirmada('usuarios'):
+        # Cache ainda é só o snapshot local (usuário/senha podem ser novos): confirma no BigQuery
+        res = buscar(carregar_tabela('usuarios', forcar=True))
     
     if res:
         return res[0]
@@ -217,6 +384,7 @@ def criar_novo_usuario(email, nome, funcao_id, senha):
         VALUES ('{safe_email}', '{nome.replace("'", "")}', '{funcao_id}', '{senha_hash}')
     """
     if run_command(query):
+        invalidar_tabela('usuarios')
         return True, "Usuário criado com sucesso!"
     return False, "Erro ao criar usuário no banco."
 
@@ -290,6 +458,57 @@ def check_ping(url):
         return False
 
 
+# ------------------------------------------------------------------------------
+# HEALTH CHECK EM SEGUNDO PLANO
+# Uma thread verifica todas as URLs em paralelo a cada HEALTH_INTERVAL segundos
+# e guarda o resultado; /api/sistemas só lê essa tabela (sem N x 3s na request).
+# ------------------------------------------------------------------------------
+HEALTH_INTERVAL = int(os.environ.get('HEALTH_INTERVAL', 60))  # segundos
+HEALTH_WORKERS = 16
+
+_saude = {}          # url -> {'online': bool, 'verificado_em': epoch}
+_saude_urls = set()  # URLs conhecidas (vindas de /api/sistemas)
+_saude_lock = threading.Lock()
+_saude_thread = None
+
+
+def verificar_urls(urls):
+    """Pinga todas as URLs em paralelo (tempo total ~ o do ping mais lento) e grava o resultado."""
+    urls = list(urls)
+    if not urls:
+        return
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(HEALTH_WORKERS, len(urls))) as executor:
+        resultados = list(executor.map(check_ping, urls))
+    agora = time.time()
+    with _saude_lock:
+        for url, online in zip(urls, resultados):
+            _saude[url] = {'online': online, 'verificado_em': agora}
+
+
+def _loop_saude():
+    while True:
+        with _saude_lock:
+            urls = list(_saude_urls)
+        try:
+            verificar_urls(urls)
+        except Exception as e:
+            print(f"Erro no health check: {e}")
+        time.sleep(HEALTH_INTERVAL)
+
+
+def registrar_urls_saude(urls):
+    """Passa a monitorar as URLs (sobe a thread na 1ª chamada). Retorna as que nunca foram verificadas."""
+    global _saude_thread
+    with _saude_lock:
+        _saude_urls.update(urls)
+        pendentes = [u for u in urls if u not in _saude]
+        if _saude_thread is None:
+            _saude_thread = threading.Thread(target=_loop_saude, name="health-check", daemon=True)
+            _saude_thread.start()
+    return pendentes
+
+
 def obter_status_sistema(sistema):
     modo = sistema.get("status_manual", "Automático")
     if modo == "Manutenção":
@@ -299,8 +518,11 @@ def obter_status_sistema(sistema):
     elif modo == "Forçar Online":
         return "online", "Online"
     else:
-        online = check_ping(sistema['url'])
-        return ("online", "Online") if online else ("offline", "Offline")
+        with _saude_lock:
+            saude = _saude.get(sistema.get('url'))
+        if saude is None:
+            return "desconhecido", "Verificando..."
+        return ("online", "Online") if saude['online'] else ("offline", "Offline")
 
 
 # ==============================================================================
@@ -381,7 +603,7 @@ def api_me():
 @app.route('/api/sistemas', methods=['GET'])
 @auth_required
 def api_listar_sistemas():
-    sistemas = run_query(f"SELECT * FROM `{TABLE_SISTEMAS}`")
+    sistemas = carregar_tabela('sistemas')
 
     # Fallback: quando BigQuery está inacessível, usa sistemas_taxbase.json local
     if not sistemas:
@@ -403,10 +625,20 @@ def api_listar_sistemas():
     funcao = obter_funcao_por_id(request.user.get('funcao_id', ''))
     sistemas_filtrados = filtrar_sistemas_por_funcao(sistemas, funcao)
 
+    # Status vem do health check em segundo plano. URLs nunca verificadas são
+    # pingadas agora, em paralelo — ou ficam "desconhecido" com ?imediato=1.
+    urls_auto = [sis['url'] for sis in sistemas_filtrados
+                 if sis.get('url') and sis.get('status_manual', 'Automático') not in ('Manutenção', 'Forçar Offline', 'Forçar Online')]
+    pendentes = registrar_urls_saude(urls_auto)
+    if pendentes and request.args.get('imediato') != '1':
+        verificar_urls(pendentes)
+
     # Adicionar status
     resultado = []
     for sis in sistemas_filtrados:
         status_class, status_texto = obter_status_sistema(sis)
+        with _saude_lock:
+            saude = _saude.get(sis.get('url'))
         
         # Correção de bugs de None na url
         if not sis.get('url'): sis['url'] = '#'
@@ -415,6 +647,7 @@ def api_listar_sistemas():
             **sis,
             'status_class': status_class,
             'status_texto': status_texto,
+            'status_verificado_em': datetime.fromtimestamp(saude['verificado_em']).isoformat() if saude else None,
             'is_internal': sis.get('sistema_id') in ['AUDIT_FISCAL', 'METRICAS_ONVIO']
         })
 
@@ -443,6 +676,7 @@ def api_criar_sistema():
         VALUES ('{novo['sistema_id']}', '{novo['nome']}', '{novo['url']}', '{novo['categoria']}', '{novo['desc']}', '{novo['status_manual']}')
     """
     if run_command(query):
+        invalidar_tabela('sistemas')
         return jsonify({'message': 'Sistema criado!', 'sistema': novo}), 201
     return jsonify({'error': 'Erro ao criar sistema'}), 500
 
@@ -468,6 +702,7 @@ def api_editar_sistema(sistema_id):
     query = f"UPDATE `{TABLE_SISTEMAS}` SET {', '.join(updates)} WHERE sistema_id = '{sistema_id}'"
     
     if run_command(query):
+         invalidar_tabela('sistemas')
          return jsonify({'message': 'Atualizado!'})
 
     return jsonify({'error': 'Erro ao atualizar'}), 500
@@ -478,6 +713,7 @@ def api_editar_sistema(sistema_id):
 def api_excluir_sistema(sistema_id):
     query = f"DELETE FROM `{TABLE_SISTEMAS}` WHERE sistema_id = '{sistema_id}'"
     run_command(query)
+    invalidar_tabela('sistemas')
     return jsonify({'message': 'Excluído!'})
 
 
@@ -492,7 +728,7 @@ def api_excluir_sistema(sistema_id):
 @app.route('/api/usuarios', methods=['GET'])
 @admin_required
 def api_listar_usuarios():
-    usuarios = run_query(f"SELECT * FROM `{TABLE_USUARIOS}`")
+    usuarios = carregar_tabela('usuarios')
     
     resultado = []
     for u in usuarios:
@@ -546,6 +782,7 @@ def api_editar_usuario(email):
 
     query = f"UPDATE `{TABLE_USUARIOS}` SET {', '.join(updates)} WHERE email = '{email}'"
     run_command(query)
+    invalidar_tabela('usuarios')
     
     return jsonify({'message': 'Atualizado!'})
 
@@ -557,6 +794,7 @@ def api_excluir_usuario(email):
         return jsonify({'error': 'Não é possível excluir o admin master'}), 403
     
     run_command(f"DELETE FROM `{TABLE_USUARIOS}` WHERE email = '{email}'")
+    invalidar_tabela('usuarios')
     return jsonify({'message': 'Excluído!'})
 
 
@@ -604,6 +842,7 @@ def api_criar_funcao():
     """
 
     if run_command(query):
+        invalidar_tabela('funcoes')
         return jsonify({'message': f"Função '{data['nome']}' criada!"}), 201
     return jsonify({'error': 'Erro ao criar função'}), 500
 
@@ -626,6 +865,7 @@ def api_editar_funcao(funcao_id):
 
     query = f"UPDATE `{TABLE_FUNCOES}` SET {', '.join(updates)} WHERE id = '{funcao_id}'"
     run_command(query)
+    invalidar_tabela('funcoes')
     
     return jsonify({'message': 'Atualizado!'})
 
@@ -637,6 +877,7 @@ def api_excluir_funcao(funcao_id):
         return jsonify({'error': 'Não é possível excluir admin_master'}), 403
     
     run_command(f"DELETE FROM `{TABLE_FUNCOES}` WHERE id = '{funcao_id}'")
+    invalidar_tabela('funcoes')
     return jsonify({'message': 'Excluído!'})
 
 
@@ -644,208 +885,428 @@ def api_excluir_funcao(funcao_id):
 # API - AUDITOR FISCAL
 # ==============================================================================
 
-def get_bq_credentials():
-    """Retorna credenciais do BigQuery (Arquivo local ou Default/Cloud)"""
+AVISO_REGISTROS_ATUAIS = 'Ação gravada, mas o painel pode demorar a refletir (falha ao atualizar os registros atuais).'
+
+
+def atualizar_registros_atuais(client, ids, tentativas=3):
+    """
+    Reflete alocações/descartes na tabela de registros atuais.
+    Retorna (competências afetadas, ok). Conflito de DML concorrente é
+    repetido; se ainda falhar, ok=False e as competências vêm None.
+    """
+    from registros_atuais import atualizar_registros_atuais as _atualizar
+    for tentativa in range(1, tentativas + 1):
+        try:
+            return _atualizar(client, ids), True
+        except Exception as e:
+            concorrente = 'concurrent' in str(e).lower()
+            if tentativa < tentativas and concorrente:
+                print(f"⚠️ Registros atuais: conflito de atualização concorrente (tentativa {tentativa}), repetindo...")
+                time.sleep(tentativa)
+                continue
+            print(f"Erro ao atualizar registros atuais: {e}")
+            return None, False
+
+
+def _refletir_acao(client, ids):
+    """Atualiza os registros atuais e o cache do painel. Retorna um aviso se a atualização falhou."""
+    competencias, ok = atualizar_registros_atuais(client, ids)
+    _invalidar_apos_acao(competencias)
+    return None if ok else AVISO_REGISTROS_ATUAIS
+
+
+def calc_competencia():
+    """Competência padrão do painel: mês anterior (MM/YYYY)."""
+    hoje = datetime.now()
+    primeiro_dia = hoje.replace(day=1)
+    mes_anterior = primeiro_dia - timedelta(days=1)
+    return mes_anterior.strftime("%m/%Y")
+
+
+def gerar_opcoes_periodo(n_meses=12):
+    opcoes = []
+    hoje = datetime.now()
+    for i in range(1, n_meses + 1):
+        primeiro_dia = hoje.replace(day=1)
+        data_alvo = primeiro_dia - timedelta(days=1)
+        for _ in range(i - 1):
+            data_alvo = data_alvo.replace(day=1) - timedelta(days=1)
+        opcoes.append(data_alvo.strftime("%m/%Y"))
+    return opcoes
+
+
+# ------------------------------------------------------------------------------
+# CACHE DO PAINEL (JSON pronto por competência + ETag)
+# Invalidado pelas ações (só as competências afetadas) e pelo fim de cada
+# rodada do pipeline (POST /api/auditor/painel/invalidar). O TTL é a rede de
+# segurança para o que muda fora daqui (planilha mestre, outras instâncias).
+# ------------------------------------------------------------------------------
+PAINEL_CACHE_TTL = int(os.environ.get('PAINEL_CACHE_TTL', 600))  # segundos
+_painel_cache = {}     # competencia -> (expira_em, etag, corpo_json, PainelIndex)
+_painel_geracao = {}   # competencia -> nº de invalidações (evita gravar resultado velho)
+_painel_geracao_global = 0
+_painel_cache_lock = threading.Lock()
+_arquivos_cache = {}   # competencia -> (expira_em, {cnpj: {obrigacao: [arquivos]}}) — modal da empresa
+_historico_cache = {}  # (competencias...) -> (expira_em, geração, etag, payload) — /api/auditor/historico
+
+
+def normalizar_competencia(competencia):
+    """ "1/2026" -> "01/2026" (chave única no cache). ValueError se não for MM/YYYY."""
+    return datetime.strptime(str(competencia).strip(), "%m/%Y").strftime("%m/%Y")
+
+
+def _competencia_da_requisicao():
+    """?periodo= normalizado (padrão: mês anterior). ValueError se inválido."""
+    periodo = request.args.get('periodo', '').strip()
+    return normalizar_competencia(periodo) if periodo else calc_competencia()
+
+
+def _painel_geracao_atual(competencia):
+    return (_painel_geracao_global, _painel_geracao.get(competencia, 0))
+
+
+def invalidar_cache_painel(competencias=None):
+    """Remove do cache as competências informadas (None = todas)."""
+    global _painel_geracao_global
+    with _painel_cache_lock:
+        if competencias is None:
+            _painel_cache.clear()
+            _arquivos_cache.clear()
+            _historico_cache.clear()
+            _painel_geracao_global += 1
+        else:
+            normalizadas = []
+            for comp in competencias:
+                try:
+                    normalizadas.append(normalizar_competencia(comp))
+                except ValueError:
+                    normalizadas.append(comp)
+            competencias = normalizadas
+            for comp in competencias:
+                _painel_cache.pop(comp, None)
+                _arquivos_cache.pop(comp, None)
+                _painel_geracao[comp] = _painel_geracao.get(comp, 0) + 1
+            for faixa in [f for f in _historico_cache if set(f) & set(competencias)]:
+                del _historico_cache[faixa]
+    print(f"DEBUG: cache do painel invalidado: {'todas' if competencias is None else sorted(competencias)}")
+
+
+def _metas_auditor():
     try:
-        # Tenta carregar do arquivo local (Dev)
-        if os.path.exists(KEY_FILE):
-            from google.oauth2 import service_account
-            return service_account.Credentials.from_service_account_file(
-                KEY_FILE,
-                scopes=["https://www.googleapis.com/auth/bigquery",
-                        "https://www.googleapis.com/auth/spreadsheets.readonly",
-                        "https://www.googleapis.com/auth/drive.readonly"]
-            )
-        
-        # Fallback para credenciais padrão do ambiente (Cloud Run)
-        import google.auth
-        credentials, project = google.auth.default(
-            scopes=["https://www.googleapis.com/auth/bigquery",
-                    "https://www.googleapis.com/auth/spreadsheets.readonly",
-                    "https://www.googleapis.com/auth/drive.readonly"]
-        )
-        return credentials
-    except Exception as e:
-        print(f"Erro ao obter credenciais: {e}")
-        return None
+        from file_classifier import AuditorClassifier
+        return list(AuditorClassifier().CATEGORIES.keys())
+    except Exception:
+        return []
+
+
+def _invalidar_apos_acao(competencias):
+    # Se a atualização da tabela não disse quais competências mudaram, limpa tudo
+    invalidar_cache_painel(competencias if competencias else None)
+
+
+PAINEL_LIMITE_MAX = 500
+_PAINEL_PARAMS_CONSULTA = ('limite', 'cursor', 'grupo', 'status', 'pendentes', 'com_entrega', 'q', 'ordem')
+
+
+def _painel_em_cache(competencia):
+    """(etag, corpo_json, indice) do painel da competência, calculando se preciso. Retorna (entrada, x_cache, erro)."""
+    with _painel_cache_lock:
+        entrada = _painel_cache.get(competencia)
+        geracao = _painel_geracao_atual(competencia)
+    if entrada and entrada[0] >= time.time():
+        return entrada[1:], 'HIT', None
+
+    payload, status, cacheavel = _calcular_painel(competencia)
+    if status != 200:
+        return None, 'MISS', (payload, status)
+    corpo = json.dumps(payload, default=str)
+    etag = hashlib.sha1(corpo.encode()).hexdigest()
+    from painel_consulta import PainelIndex
+    # Estrutura pré-calculada para filtros/ordenação/cursor (sem o 'painel' completo no resto)
+    indice = PainelIndex(payload.get('painel', []), base={k: v for k, v in payload.items() if k != 'painel'})
+    if cacheavel:
+        with _painel_cache_lock:
+            # Só guarda se ninguém invalidou esta competência durante o cálculo
+            if _painel_geracao_atual(competencia) == geracao:
+                _painel_cache[competencia] = (time.time() + PAINEL_CACHE_TTL, etag, corpo, indice)
+    return (etag, corpo, indice), 'MISS', None
 
 
 @app.route('/api/auditor/painel', methods=['GET'])
 @auth_required
 def api_auditor_painel():
-    """Retorna dados do painel fiscal processados"""
+    """
+    Retorna dados do painel fiscal processados (cache por competência, com ETag).
+    Sem parâmetros de consulta devolve o painel inteiro; com limite/cursor/grupo/
+    status/pendentes/com_entrega/q/ordem devolve uma página filtrada + resumo.
+    """
+    print(f"DEBUG: api_auditor_painel param='{request.args.get('periodo', '')}'")
     try:
-        from google.cloud import bigquery
-        creds = get_bq_credentials()
-        if not creds:
-            return jsonify({'error': 'Credenciais BigQuery não configuradas'}), 500
-
-        client = bigquery.Client(credentials=creds)
-
-        # Período de apuração (query param ou auto-calculado)
-        from datetime import datetime, timedelta
-        def calc_competencia():
-            hoje = datetime.now()
-            primeiro_dia = hoje.replace(day=1)
-            mes_anterior = primeiro_dia - timedelta(days=1)
-            return mes_anterior.strftime("%m/%Y")
-
-        def gerar_opcoes_periodo(n_meses=12):
-            opcoes = []
-            hoje = datetime.now()
-            for i in range(1, n_meses + 1):
-                primeiro_dia = hoje.replace(day=1)
-                data_alvo = primeiro_dia - timedelta(days=1)
-                for _ in range(i - 1):
-                    data_alvo = data_alvo.replace(day=1) - timedelta(days=1)
-                opcoes.append(data_alvo.strftime("%m/%Y"))
-            return opcoes
-
-        periodo_param = request.args.get('periodo', '').strip()
-        print(f"DEBUG: api_auditor_painel param='{periodo_param}'")
-        competencia = periodo_param if periodo_param else calc_competencia()
-
-        # Calcular período EFD (1 mês antes do selecionado)
+        competencia = _competencia_da_requisicao()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro inválido (periodo=MM/YYYY)'}), 400
+
+    entrada, x_cache, erro = _painel_em_cache(competencia)
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    etag, corpo, indice = entrada
+
+    if any(p in request.args for p in _PAINEL_PARAMS_CONSULTA):
         try:
-            dt_selecionada = datetime.strptime(competencia, "%m/%Y")
-            # Subtrair 1 mês
-            dt_efd = dt_selecionada.replace(day=1) - timedelta(days=1)
-            # Ir para o primeiro dia do mês anterior para formatar
-            dt_efd = dt_efd.replace(day=1)
-            periodo_efd = dt_efd.strftime("%m/%Y")
-        except Exception:
-            periodo_efd = competencia # Fallback
-
-        print(f"DEBUG: periodo_padrao='{competencia}', periodo_efd='{periodo_efd}'")
-
-        # Carregar dados BQ - filtrar por período (Regra EFD vs Geral)
-        # Regra:
-        # - Geral: periodo = competencia
-        # - EFD: periodo = periodo_efd
-        query_bq = f"""
-            SELECT 
-                cnpj, 
-                categoria as obrigacao, 
-                periodo, 
-                status_auditoria, 
-                id_arquivo, 
-                nome_arquivo, 
-                link_arquivo,
-                data_processamento as data_proc_full,
-                DATE(data_processamento) as data_proc
-            FROM `{BQ_TABLE_ID}` t
-            WHERE (
-                (t.periodo = '{competencia}' AND t.categoria != 'EFD_CONTRIBUICOES')
-                OR
-                (t.periodo = '{periodo_efd}' AND t.categoria = 'EFD_CONTRIBUICOES')
-            )
-            AND NOT EXISTS (
-                SELECT 1 
-                FROM `{BQ_TABLE_DISCARDED}` d
-                WHERE d.id_arquivo = t.id_arquivo
-                AND TIMESTAMP_TRUNC(d.data_processamento, SECOND) = TIMESTAMP_TRUNC(t.data_processamento, SECOND)
+            limite = min(PAINEL_LIMITE_MAX, int(request.args.get('limite', 50)))
+            pagina = indice.consultar(
+                grupo=request.args.get('grupo', '').strip() or None,
+                status=request.args.get('status', '').strip().upper() or None,
+                pendentes=request.args.get('pendentes') in ('1', 'true'),
+                com_entrega=request.args.get('com_entrega') in ('1', 'true'),
+                busca=request.args.get('q', ''),
+                ordem=request.args.get('ordem', '').strip() or None,
+                cursor=request.args.get('cursor') or None,
+                limite=limite,
             )
-        """
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        pagina.update(indice.base)
+        pagina['resumo'] = indice.resumo
+        corpo = json.dumps(pagina, default=str)
+        etag = hashlib.sha1((etag + request.query_string.decode()).encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(corpo, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'  # Navegador sempre revalida com If-None-Match
+    resp.headers['X-Cache'] = x_cache
+    return resp
+
+
+@app.route('/api/auditor/empresas', methods=['GET'])
+@auth_required
+def api_auditor_empresas():
+    """Lista cnpj/empresa da competência (select da alocação), a partir do painel em cache"""
+    try:
+        competencia = _competencia_da_requisicao()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro inválido (periodo=MM/YYYY)'}), 400
+    entrada, _, erro = _painel_em_cache(competencia)
+    if erro:
+        return jsonify(erro[0]), erro[1]
+    return jsonify({'competencia': competencia, 'empresas': entrada[2].lista()})
+
+
+HISTORICO_MAX_PERIODOS = 24
+
 
-        import pandas as pd
-        df_bq = client.query(query_bq).to_dataframe()
-        if not df_bq.empty and 'data_proc_full' in df_bq.columns:
-            df_bq['data_proc_full'] = df_bq['data_proc_full'].astype(str)
-        last_update = str(df_bq['data_proc_full'].max()) if not df_bq.empty else None
+def _competencias_ate(ate, n):
+    """As n competências ("MM/YYYY") terminando em `ate`, da mais recente para a mais antiga."""
+    data = datetime.strptime(ate, "%m/%Y")
+    competencias = []
+    for _ in range(n):
+        competencias.append(data.strftime("%m/%Y"))
+        data = data.replace(day=1) - timedelta(days=1)
+    return competencias
 
-        # Carregar master
+
+@app.route('/api/auditor/historico', methods=['GET'])
+@auth_required
+def api_auditor_historico():
+    """
+    Histórico de entregas: empresa x obrigação x competência para as últimas N
+    competências (?periodos=12&ate=MM/YYYY&cnpj=). Uma query agrupada por faixa,
+    em cache (invalidado junto com o painel das competências da faixa).
+    """
+    try:
+        n = max(1, min(HISTORICO_MAX_PERIODOS, int(request.args.get('periodos', 12))))
+        competencias = tuple(_competencias_ate(request.args.get('ate', '').strip() or calc_competencia(), n))
+    except ValueError:
+        return jsonify({'error': 'Parâmetros inválidos (periodos=N, ate=MM/YYYY)'}), 400
+
+    with _painel_cache_lock:
+        entrada = _historico_cache.get(competencias)
+        geracao = [_painel_geracao_atual(c) for c in competencias]
+    x_cache = 'HIT'
+    if not entrada or entrada[0] < time.time():
+        x_cache = 'MISS'
         try:
-            from reference_data import ReferenceLoader
-            loader = ReferenceLoader(creds)
-            loader.load_data()
-            df_master = loader.df_empresas if loader.df_empresas is not None else pd.DataFrame()
+            from master_sync import query_historico
+            metas = _metas_auditor()
+            payload = {
+                'competencias': list(competencias),
+                'metas': metas,
+                'empresas': query_historico(get_bq_client(project=None), competencias, metas),
+            }
         except Exception as e:
-            print(f"ERRO CRITICO AO CARREGAR REFERENCE DATA: {e}")
-            import traceback
-            traceback.print_exc()
-            df_master = pd.DataFrame()
+            return jsonify({'error': str(e)}), 500
+        etag = hashlib.sha1(json.dumps(payload, default=str).encode()).hexdigest()
+        entrada = (time.time() + PAINEL_CACHE_TTL, geracao, etag, payload)
+        with _painel_cache_lock:
+            # Só guarda se nenhuma competência da faixa foi invalidada durante a query
+            if [_painel_geracao_atual(c) for c in competencias] == geracao:
+                _historico_cache[competencias] = entrada
+
+    _, _, etag, payload = entrada
+    cnpj = ''.join(filter(str.isdigit, request.args.get('cnpj', '')))
+    if cnpj:
+        payload = dict(payload, empresas=[e for e in payload['empresas'] if e['cnpj'] == cnpj])
+        etag = hashlib.sha1((etag + cnpj).encode()).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(json.dumps(payload, default=str), mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    resp.headers['X-Cache'] = x_cache
+    return resp
+
+
+@app.route('/api/auditor/painel/invalidar', methods=['POST'])
+def api_auditor_painel_invalidar():
+    """Chamado pelo pipeline ao fim de cada rodada (header X-Hub-Token = HUB_INTERNAL_TOKEN)."""
+    token_esperado = os.environ.get('HUB_INTERNAL_TOKEN', '')
+    if not token_esperado or request.headers.get('X-Hub-Token', '') != token_esperado:
+        return jsonify({'error': 'Token interno inválido'}), 401
+    data = request.get_json(silent=True) or {}
+    competencias = data.get('competencias')
+    invalidar_cache_painel(competencias if isinstance(competencias, list) and competencias else None)
+    return jsonify({'message': 'Cache do painel invalidado'})
+
+
+def _indexar_arquivos(competencia):
+    """Arquivos entregues na competência, indexados por CNPJ e obrigação (período mais recente primeiro)."""
+    from google.cloud import bigquery
+    from registros_atuais import competencia_para_data
+
+    query = f"""
+        SELECT
+            REGEXP_REPLACE(cnpj, r'\\D', '') AS cnpj,
+            categoria AS obrigacao,
+            periodo,
+            nome_arquivo,
+            link_arquivo,
+            id_arquivo,
+            data_processamento AS data_proc_full
+        FROM `{BQ_TABLE_CURRENT}`
+        WHERE competencia_painel = DATE(@competencia_painel)
+        ORDER BY cnpj, obrigacao, periodo DESC
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("competencia_painel", "STRING", competencia_para_data(competencia))
+    ])
+    indice = {}
+    for row in get_bq_client(project=None).query(query, job_config=job_config).result():
+        arquivo = {
+            'periodo': row['periodo'],
+            'nome_arquivo': row['nome_arquivo'],
+            'link_arquivo': row['link_arquivo'],
+            'id_arquivo': row['id_arquivo'],
+            'data_proc_full': str(row['data_proc_full']) if row['data_proc_full'] else None,
+        }
+        indice.setdefault(row['cnpj'], {}).setdefault(row['obrigacao'], []).append(arquivo)
+    return indice
+
+
+@app.route('/api/auditor/empresa/<cnpj>', methods=['GET'])
+@auth_required
+def api_auditor_empresa(cnpj):
+    """Arquivos entregues por uma empresa na competência (carregado ao abrir o modal)"""
+    try:
+        competencia = _competencia_da_requisicao()
+    except ValueError:
+        return jsonify({'error': 'Parâmetro inválido (periodo=MM/YYYY)'}), 400
+    cnpj = ''.join(filter(str.isdigit, cnpj))
 
-        if df_master.empty:
-            return jsonify({'painel': [], 'last_update': last_update, 'competencia': competencia, 'periodos_disponiveis': gerar_opcoes_periodo(12)})
+    with _painel_cache_lock:
+        entrada = _arquivos_cache.get(competencia)
+        geracao = _painel_geracao_atual(competencia)
 
-        # Carregar ignorados
+    if entrada and entrada[0] >= time.time():
+        indice = entrada[1]
+    else:
         try:
-            query_ign = f"SELECT cnpj, obrigacao FROM `{BQ_TABLE_IGNORED}`"
-            df_ign = client.query(query_ign).to_dataframe()
-            ignored = {}
-            for _, row in df_ign.iterrows():
-                cnpj = str(row['cnpj'])
-                if cnpj not in ignored:
-                    ignored[cnpj] = []
-                ignored[cnpj].append(row['obrigacao'])
-        except Exception:
-            ignored = {}
-
-        # Processar painel
-        if 'cnpj' in df_master.columns:
-            df_master['clean_cnpj'] = df_master['cnpj'].astype(str).str.replace(r'\D', '', regex=True)
-
-        # Tratar Grupos Vazios
-        if 'grupo' in df_master.columns:
-             df_master['grupo'] = df_master['grupo'].fillna('')
-             df_master['grupo'] = df_master['grupo'].astype(str).str.strip()
-             df_master['grupo'] = df_master['grupo'].replace(['', 'nan', 'None'], 'Sem Grupo')
-        else:
-             df_master['grupo'] = 'Sem Grupo'
+            indice = _indexar_arquivos(competencia)
+        except ValueError:
+            return jsonify({'error': f"Competência inválida: {competencia}"}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        with _painel_cache_lock:
+            if _painel_geracao_atual(competencia) == geracao:
+                _arquivos_cache[competencia] = (time.time() + PAINEL_CACHE_TTL, indice)
+
+    return jsonify({'cnpj': cnpj, 'competencia': competencia, 'arquivos': indice.get(cnpj, {})})
+
+
+def _sincronizar_master(client):
+    """Planilha mestre -> BQ_TABLE_MASTER (só as linhas alteradas)."""
+    from reference_data import ReferenceLoader
+    from master_sync import sincronizar_master
+    loader = ReferenceLoader(get_bq_credentials())
+    loader.load_data()
+    return sincronizar_master(loader, client)
+
+
+@app.route('/api/auditor/master/sync', methods=['POST'])
+@admin_required
+def api_auditor_master_sync():
+    """Sincroniza a planilha mestre com o BigQuery e invalida o painel."""
+    try:
+        alteradas, desativadas = _sincronizar_master(get_bq_client(project=None))
+        invalidar_cache_painel()
+        return jsonify({'message': 'Planilha mestre sincronizada', 'alteradas': alteradas, 'desativadas': desativadas})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _calcular_painel(competencia):
+    """Monta o JSON do painel. Retorna (payload, status_http, pode_ir_para_o_cache)."""
+    try:
+        from google.cloud import bigquery
+        from google.api_core.exceptions import NotFound
+        creds = get_bq_credentials()
+        if not creds:
+            return {'error': 'Credenciais BigQuery não configuradas'}, 500, False
 
+        client = get_bq_client(project=None)
+
+        # A regra EFD (competência + 1 mês) já está na competencia_painel da tabela de registros atuais
+        try:
+            from registros_atuais import competencia_para_data
+            competencia_painel = competencia_para_data(competencia)
+        except ValueError:
+            return {'error': f"Competência inválida: {competencia}"}, 400, False
+        job_config_painel = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("competencia_painel", "STRING", competencia_painel)
+        ])
+
+        metas = _metas_auditor()
+
+        # Master x metas x entregas x ignorados, com progresso/status, numa query só
+        from master_sync import query_painel
         try:
-            from file_classifier import AuditorClassifier
-            metas = list(AuditorClassifier().CATEGORIES.keys())
-        except Exception:
-            metas = []
-
-        painel_data = []
-        for _, row in df_master.iterrows():
-            cnpj = row['clean_cnpj']
-            nome = row.get('empresa', 'N/A')
-            grupo = row.get('grupo', 'Sem Grupo')
-
-            entregas = []
-            if not df_bq.empty and 'cnpj' in df_bq.columns:
-                df_bq['cnpj_clean'] = df_bq['cnpj'].astype(str).str.replace(r'\D', '', regex=True)
-                entregas = df_bq[df_bq['cnpj_clean'] == cnpj]['obrigacao'].unique().tolist()
-
-            lista_ignorados = ignored.get(cnpj, [])
-            faltantes_ativos = [m for m in metas if m not in entregas and m not in lista_ignorados]
-            faltantes_ignorados = [m for m in metas if m not in entregas and m in lista_ignorados]
-
-            meta_ajustada = max(1, len(metas) - len(lista_ignorados))
-            progresso = min(1.0, len(entregas) / meta_ajustada)
-            status = "OK" if progresso == 1 else "PENDENTE"
-
-            # Arquivos para cada entrega
-            arquivos_entregues = {}
-            if not df_bq.empty:
-                for obr in entregas:
-                    files = df_bq[(df_bq['cnpj_clean'] == cnpj) & (df_bq['obrigacao'] == obr)].sort_values('periodo', ascending=False)
-                    arquivos_entregues[obr] = files[['periodo', 'nome_arquivo', 'link_arquivo', 'id_arquivo', 'data_proc_full']].to_dict('records')
-
-            painel_data.append({
-                "cnpj": cnpj,
-                "empresa": nome,
-                "grupo": grupo,
-                "entregues": entregas,
-                "faltantes_ativos": faltantes_ativos,
-                "faltantes_ignorados": faltantes_ignorados,
-                "qtd_pendentes": len(faltantes_ativos),
-                "progresso": progresso,
-                "status": status,
-                "has_delivery": len(entregas) > 0,
-                "arquivos": arquivos_entregues
-            })
-
-        # Processar Daily Stats
-        daily_stats = []
-        if not df_bq.empty and 'data_proc' in df_bq.columns:
-             counts = df_bq['data_proc'].value_counts().sort_index()
-             daily_stats = [{'date': str(d), 'count': int(c)} for d, c in counts.items()]
+            painel_data = query_painel(client, competencia_painel, metas)
+        except NotFound:
+            # Primeira execução: a tabela master ainda não existe
+            _sincronizar_master(client)
+            painel_data = query_painel(client, competencia_painel, metas)
+
+        if not painel_data:
+            # Master vazio: responde vazio, mas não guarda no cache
+            return {'painel': [], 'last_update': None, 'competencia': competencia, 'periodos_disponiveis': gerar_opcoes_periodo(12)}, 200, False
+
+        # Só o resumo da partição (arquivos de cada empresa: /api/auditor/empresa/<cnpj>)
+        query_stats = f"""
+            SELECT DATE(data_processamento) AS data_proc, COUNT(*) AS qtd, MAX(data_processamento) AS ultima
+            FROM `{BQ_TABLE_CURRENT}`
+            WHERE competencia_painel = DATE(@competencia_painel)
+            GROUP BY data_proc
+            ORDER BY data_proc
+        """
+        stats = list(client.query(query_stats, job_config=job_config_painel).result())
+        daily_stats = [{'date': str(row['data_proc']), 'count': int(row['qtd'])} for row in stats]
+        last_update = str(max(row['ultima'] for row in stats)) if stats else None
 
-        return jsonify({
+        return {
             'painel': painel_data,
             'last_update': last_update,
             'competencia': competencia,
@@ -853,10 +1314,10 @@ def api_auditor_painel():
             'metas': metas,
             'daily_stats': daily_stats,
             'periodos_disponiveis': gerar_opcoes_periodo(12)
-        })
+        }, 200, True
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500, False
 
 
 @app.route('/api/auditor/unidentified', methods=['GET'])
@@ -864,24 +1325,15 @@ def api_auditor_painel():
 def api_auditor_unidentified():
     """Retorna arquivos não identificados"""
     try:
-        from google.cloud import bigquery
-        import pandas as pd
-        creds = get_bq_credentials()
-        client = bigquery.Client(credentials=creds)
+        client = get_bq_client(project=None)
 
         query = f"""
             SELECT t.id_arquivo, t.nome_arquivo, t.link_arquivo, t.data_processamento
-            FROM `{BQ_TABLE_ID}` t
+            FROM `{BQ_TABLE_CURRENT}` t
             WHERE (t.status_auditoria = 'NAO_IDENTIFICADO' 
                 OR t.categoria IS NULL
                 OR t.categoria = 'NAO_IDENTIFICADO'
                 OR t.categoria = '')
-            AND NOT EXISTS (
-                SELECT 1 
-                FROM `{BQ_TABLE_DISCARDED}` d
-                WHERE d.id_arquivo = t.id_arquivo
-                AND TIMESTAMP_TRUNC(d.data_processamento, SECOND) = TIMESTAMP_TRUNC(t.data_processamento, SECOND)
-            )
             ORDER BY t.data_processamento DESC
             LIMIT 50
         """
@@ -908,7 +1360,7 @@ def api_auditor_allocate():
 
     try:
         from google.cloud import bigquery
-        client = bigquery.Client(credentials=get_bq_credentials())
+        client = get_bq_client(project=None)
         
         # Update apenas o registro específico usando id_arquivo + data_processamento
         query = f"""
@@ -929,8 +1381,9 @@ def api_auditor_allocate():
             ]
         )
         client.query(query, job_config=job_config).result()
+        aviso = _refletir_acao(client, [id_arquivo])
         
-        return jsonify({'message': 'Arquivo alocado com sucesso!'})
+        return jsonify({'message': 'Arquivo alocado com sucesso!', 'aviso': aviso})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -950,8 +1403,7 @@ def api_auditor_discard():
         if not id_arquivo:
             return jsonify({'error': 'id_arquivo é obrigatório'}), 400
 
-        creds = get_bq_credentials()
-        client = bigquery.Client(credentials=creds)
+        client = get_bq_client(project=None)
 
         # Apenas INSERT no controle (sem DELETE na tabela principal!)
         # Isso evita o erro de streaming buffer e não afeta outros registros
@@ -967,8 +1419,9 @@ def api_auditor_discard():
             ]
         )
         client.query(query_insert, job_config=job_config).result()
+        aviso = _refletir_acao(client, [id_arquivo])
 
-        return jsonify({'message': 'Arquivo descartado com sucesso!'})
+        return jsonify({'message': 'Arquivo descartado com sucesso!', 'aviso': aviso})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -978,13 +1431,11 @@ def api_auditor_discard():
 def api_auditor_toggle_ignore():
     """Ignora/reativa obrigação"""
     try:
-        from google.cloud import bigquery
         data = request.get_json()
         cnpj = data['cnpj']
         obrigacao = data['obrigacao']
 
-        creds = get_bq_credentials()
-        client = bigquery.Client(credentials=creds)
+        client = get_bq_client(project=None)
 
         # Verificar se já está ignorado
         check = f"""
@@ -1000,6 +1451,7 @@ def api_auditor_toggle_ignore():
                 WHERE cnpj = '{cnpj}' AND obrigacao = '{obrigacao}'
             """
             client.query(query).result()
+            invalidar_cache_painel()  # Ignorados valem para todas as competências
             return jsonify({'message': 'Obrigação reativada!', 'action': 'reactivated'})
         else:
             query = f"""
@@ -1007,12 +1459,235 @@ def api_auditor_toggle_ignore():
                 VALUES ('{cnpj}', '{obrigacao}')
             """
             client.query(query).result()
+            invalidar_cache_painel()  # Ignorados valem para todas as competências
             return jsonify({'message': 'Obrigação adormecida!', 'action': 'ignored'})
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+# ------------------------------------------------------------------------------
+# AÇÕES EM LOTE: um único job no BigQuery por tabela, com resultado por item
+# ------------------------------------------------------------------------------
+LIMITE_LOTE = 500
+
+
+def _ler_itens_lote():
+    """Lê {"itens": [...]} do corpo. Retorna (itens, None) ou (None, resposta_de_erro)."""
+    data = request.get_json(silent=True) or {}
+    itens = data.get('itens')
+    if not isinstance(itens, list) or not itens:
+        return None, (jsonify({'error': 'Envie a lista de operações em "itens"'}), 400)
+    if len(itens) > LIMITE_LOTE:
+        return None, (jsonify({'error': f'Máximo de {LIMITE_LOTE} itens por lote'}), 400)
+    return itens, None
+
+
+def _normalizar_timestamp(valor):
+    """data_processamento vindo do front (str do pandas/BigQuery) -> texto aceito pelo TIMESTAMP(), ou None."""
+    if not valor:
+        return None
+    texto = str(valor).strip().replace(' UTC', '+00:00').replace('Z', '+00:00')
+    try:
+        return datetime.fromisoformat(texto).isoformat(sep=' ')
+    except ValueError:
+        return None
+
+
+def _param_lote(nome, campos, linhas):
+    """ARRAY<STRUCT<campos STRING>> para usar com UNNEST(@nome) numa única query."""
+    from google.cloud import bigquery
+    return bigquery.ArrayQueryParameter(nome, "STRUCT", [
+        bigquery.StructQueryParameter(None, *[bigquery.ScalarQueryParameter(c, "STRING", linha[c]) for c in campos])
+        for linha in linhas
+    ])
+
+
+def _resposta_lote(resultados, aviso=None):
+    sucesso = sum(1 for r in resultados if r['ok'])
+    return jsonify({'resultados': resultados, 'sucesso': sucesso, 'falhas': len(resultados) - sucesso, 'aviso': aviso})
+
+
+def _validar_itens_arquivo(itens, campos_obrigatorios):
+    """Valida itens que apontam para um registro (id_arquivo + data_processamento)."""
+    resultados, validos, vistos = [], [], set()
+    for idx, item in enumerate(itens):
+        item = item if isinstance(item, dict) else {}
+        resultado = {'id_arquivo': item.get('id_arquivo'), 'ok': False, 'mensagem': ''}
+        resultados.append(resultado)
+
+        data_proc = _normalizar_timestamp(item.get('data_processamento'))
+        if not all(item.get(c) for c in campos_obrigatorios):
+            resultado['mensagem'] = 'Dados incompletos'
+        elif not data_proc:
+            resultado['mensagem'] = 'data_processamento inválido'
+        elif (item['id_arquivo'], data_proc) in vistos:
+            resultado['mensagem'] = 'Duplicado no lote'
+        else:
+            vistos.add((item['id_arquivo'], data_proc))
+            validos.append({**{c: str(item.get(c) or '') for c in campos_obrigatorios},
+                            'idx': str(idx), 'data_proc': data_proc})
+    return resultados, validos
+
+
+@app.route('/api/auditor/allocate/bulk', methods=['POST'])
+@admin_required
+def api_auditor_allocate_bulk():
+    """Aloca vários arquivos de uma vez: um único UPDATE ... FROM UNNEST(@itens)."""
+    itens, erro = _ler_itens_lote()
+    if erro:
+        return erro
+
+    resultados, validos = _validar_itens_arquivo(itens, ('id_arquivo', 'cnpj', 'obrigacao'))
+    if not validos:
+        return _resposta_lote(resultados)
+
+    aviso = None
+    try:
+        from google.cloud import bigquery
+        client = get_bq_client(project=None)
+
+        # Script de um job só: UPDATE em lote + conferência de quais registros foram alocados
+        script = f"""
+            UPDATE `{BQ_TABLE_ID}` t
+            SET
+                cnpj = i.cnpj,
+                categoria = i.obrigacao,
+                status_auditoria = 'ALOCADO_MANUAL'
+            FROM UNNEST(@itens) i
+            WHERE t.id_arquivo = i.id_arquivo
+            AND TIMESTAMP_TRUNC(t.data_processamento, SECOND) = TIMESTAMP_TRUNC(TIMESTAMP(i.data_proc), SECOND);
+
+            SELECT DISTINCT i.idx
+            FROM UNNEST(@itens) i
+            JOIN `{BQ_TABLE_ID}` t
+              ON t.id_arquivo = i.id_arquivo
+             AND TIMESTAMP_TRUNC(t.data_processamento, SECOND) = TIMESTAMP_TRUNC(TIMESTAMP(i.data_proc), SECOND)
+            WHERE t.status_auditoria = 'ALOCADO_MANUAL' AND t.cnpj = i.cnpj AND t.categoria = i.obrigacao;
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            _param_lote("itens", ('idx', 'id_arquivo', 'data_proc', 'cnpj', 'obrigacao'), validos)
+        ])
+        alocados = {row['idx'] for row in client.query(script, job_config=job_config).result()}
+
+        for item in validos:
+            resultado = resultados[int(item['idx'])]
+            resultado['ok'] = item['idx'] in alocados
+            resultado['mensagem'] = 'Alocado' if resultado['ok'] else 'Registro não encontrado'
+
+        aviso = _refletir_acao(client, [i['id_arquivo'] for i in validos if i['idx'] in alocados])
+    except Exception as e:
+        for item in validos:
+            resultados[int(item['idx'])]['mensagem'] = str(e)
+
+    return _resposta_lote(resultados, aviso)
+
+
+@app.route('/api/auditor/discard/bulk', methods=['POST'])
+@admin_required
+def api_auditor_discard_bulk():
+    """Descarta vários registros de uma vez: um único INSERT ... SELECT FROM UNNEST(@itens)."""
+    itens, erro = _ler_itens_lote()
+    if erro:
+        return erro
+
+    resultados, validos = _validar_itens_arquivo(itens, ('id_arquivo', 'nome_arquivo'))
+    if not validos:
+        return _resposta_lote(resultados)
+
+    aviso = None
+    try:
+        from google.cloud import bigquery
+        client = get_bq_client(project=None)
+
+        # Registros já descartados antes não são inseridos de novo
+        query = f"""
+            INSERT INTO `{BQ_TABLE_DISCARDED}` (id_arquivo, data_processamento, nome_arquivo)
+            SELECT i.id_arquivo, TIMESTAMP(i.data_proc), i.nome_arquivo
+            FROM UNNEST(@itens) i
+            WHERE NOT EXISTS (
+                SELECT 1 FROM `{BQ_TABLE_DISCARDED}` d
+                WHERE d.id_arquivo = i.id_arquivo
+                AND TIMESTAMP_TRUNC(d.data_processamento, SECOND) = TIMESTAMP_TRUNC(TIMESTAMP(i.data_proc), SECOND)
+            )
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            _param_lote("itens", ('id_arquivo', 'data_proc', 'nome_arquivo'), validos)
+        ])
+        client.query(query, job_config=job_config).result()
+
+        for item in validos:
+            resultados[int(item['idx'])].update(ok=True, mensagem='Descartado')
+
+        aviso = _refletir_acao(client, [i['id_arquivo'] for i in validos])
+    except Exception as e:
+        for item in validos:
+            resultados[int(item['idx'])]['mensagem'] = str(e)
+
+    return _resposta_lote(resultados, aviso)
+
+
+@app.route('/api/auditor/toggle-ignore/bulk', methods=['POST'])
+@admin_required
+def api_auditor_toggle_ignore_bulk():
+    """Ignora/reativa várias obrigações de uma vez: um único MERGE na tabela de ignorados."""
+    itens, erro = _ler_itens_lote()
+    if erro:
+        return erro
+
+    resultados, validos, vistos = [], [], set()
+    for idx, item in enumerate(itens):
+        item = item if isinstance(item, dict) else {}
+        cnpj, obrigacao = str(item.get('cnpj') or ''), str(item.get('obrigacao') or '')
+        resultado = {'cnpj': cnpj, 'obrigacao': obrigacao, 'ok': False, 'mensagem': ''}
+        resultados.append(resultado)
+        if not cnpj or not obrigacao:
+            resultado['mensagem'] = 'Dados incompletos'
+        elif (cnpj, obrigacao) in vistos:
+            resultado['mensagem'] = 'Duplicado no lote'
+        else:
+            vistos.add((cnpj, obrigacao))
+            validos.append({'idx': str(idx), 'cnpj': cnpj, 'obrigacao': obrigacao})
+
+    if not validos:
+        return _resposta_lote(resultados)
+
+    try:
+        from google.cloud import bigquery
+        client = get_bq_client(project=None)
+
+        # Guarda o estado anterior (para o resultado por item) e aplica o toggle num MERGE só
+        script = f"""
+            CREATE TEMP TABLE lote AS
+            SELECT i.idx, i.cnpj, i.obrigacao,
+                   EXISTS(SELECT 1 FROM `{BQ_TABLE_IGNORED}` g
+                          WHERE g.cnpj = i.cnpj AND g.obrigacao = i.obrigacao) AS estava_ignorado
+            FROM UNNEST(@itens) i;
+
+            MERGE `{BQ_TABLE_IGNORED}` g
+            USING lote l
+            ON g.cnpj = l.cnpj AND g.obrigacao = l.obrigacao
+            WHEN MATCHED THEN DELETE
+            WHEN NOT MATCHED THEN INSERT (cnpj, obrigacao) VALUES (l.cnpj, l.obrigacao);
+
+            SELECT idx, estava_ignorado FROM lote;
+        """
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            _param_lote("itens", ('idx', 'cnpj', 'obrigacao'), validos)
+        ])
+        for row in client.query(script, job_config=job_config).result():
+            action = 'reactivated' if row['estava_ignorado'] else 'ignored'
+            resultados[int(row['idx'])].update(
+                ok=True, action=action,
+                mensagem='Obrigação reativada!' if action == 'reactivated' else 'Obrigação adormecida!')
+        invalidar_cache_painel()  # Ignorados valem para todas as competências
+    except Exception as e:
+        for item in validos:
+            resultados[int(item['idx'])]['mensagem'] = str(e)
+
+    return _resposta_lote(resultados)
+
+
 # ==============================================================================
 # MAIN
 # ==============================================================================
@@ -152,18 +152,22 @@ function updateNavbar() {
 }
 
 // --- SYSTEMS ---
-async function loadSystems() {
+async function loadSystems(imediato = true) {
     const grid = document.getElementById('systems-grid');
-    grid.innerHTML = '<div class="loader"><div class="spinner"></div>Carregando sistemas...</div>';
+    if (imediato) grid.innerHTML = '<div class="loader"><div class="spinner"></div>Carregando sistemas...</div>';
 
     try {
-        const data = await api('/api/sistemas');
+        // 1ª carga não espera health check; se algum status ainda estiver "desconhecido", busca de novo
+        const data = await api(imediato ? '/api/sistemas?imediato=1' : '/api/sistemas');
         if (!data) return;
 
         allSystems = data;
         renderSystems(data);
+        if (imediato && data.some(s => s.status_class === 'desconhecido')) {
+            setTimeout(() => loadSystems(false), 1500);
+        }
     } catch (err) {
-        grid.innerHTML = '<div class="loader">❌ Erro ao carregar sistemas</div>';
+        if (imediato) grid.innerHTML = '<div class="loader">❌ Erro ao carregar sistemas</div>';
     }
 }
 
@@ -0,0 +1,43 @@
+"""
+Teste offline da invalidação do cache do painel do auditor (app.py).
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as hub
+
+
+def test_invalidacao_incrementa_geracao():
+    hub._painel_geracao.clear()
+    hub._historico_cache.clear()
+    antes = {c: hub._painel_geracao_atual(c) for c in ('03/2026', '04/2026', '05/2026')}
+
+    # Sem histórico em cache: cada competência ainda ganha uma geração nova
+    hub.invalidar_cache_painel(['03/2026', '04/2026'])
+    assert hub._painel_geracao == {'03/2026': 1, '04/2026': 1}, hub._painel_geracao
+    assert hub._painel_geracao_atual('03/2026') != antes['03/2026']
+    assert hub._painel_geracao_atual('05/2026') == antes['05/2026']
+
+    # Com faixa de histórico em cache: a faixa sai e todas as competências sobem
+    hub._historico_cache[('04/2026', '05/2026')] = (0, None, None, None)
+    hub.invalidar_cache_painel(['03/2026', '04/2026'])
+    assert hub._painel_geracao == {'03/2026': 2, '04/2026': 2}, hub._painel_geracao
+    assert not hub._historico_cache
+
+
+def test_competencia_normalizada():
+    assert hub.normalizar_competencia('1/2026') == hub.normalizar_competencia(' 01/2026') == '01/2026'
+
+    # Invalidação com a competência escrita de outro jeito acha a mesma chave
+    hub._painel_geracao.clear()
+    hub._painel_cache['01/2026'] = (0, None, None, None)
+    hub.invalidar_cache_painel(['1/2026'])
+    assert '01/2026' not in hub._painel_cache
+    assert hub._painel_geracao == {'01/2026': 1}, hub._painel_geracao
+
+
+if __name__ == "__main__":
+    for teste in (test_invalidacao_incrementa_geracao, test_competencia_normalizada):
+        teste()
+        print(f"✅ {teste.__name__}")
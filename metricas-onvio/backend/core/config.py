@@ -26,10 +26,18 @@ class Settings(BaseSettings):
     BQ_PROJECT: str = "taxbase-metricasmessenger"
     BQ_DATASET: str = "metricas"
 
+    # --- Cache do Mapeamento Contato → Cliente ---
+    MAPPING_CACHE_TTL: int = 300  # segundos (cadastros de outras instâncias)
+
+    # --- Cache dos Meses Carregados ---
+    MONTH_CACHE_TTL: int = 900  # segundos (meses alterados por outras instâncias)
+    MONTH_CACHE_MAX: int = 24   # meses em memória (LRU)
+
     # --- Caminhos de Dados ---
     # Todos relativos à raiz do projeto (um nível acima de backend/)
     DATA_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "data")
-    MAPPING_FILE: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "statusContatos.xlsx")
+    MAPPING_FILE: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "statusContatos.xlsx")  # Só importação inicial do store
+    MAPPING_STORE_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "mapping_store.sqlite")
     LABELS_JSON_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "month_labels.json")
     DEPARTMENTS_JSON_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "departments.json")
     SERVICE_ACCOUNT_PATH: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "service_account.json")
@@ -49,6 +49,47 @@ class RegisterClientResponse(BaseModel):
     message: str
 
 
+class RegisterClientBatchRequest(BaseModel):
+    itens: List[RegisterClientRequest]
+
+class RegisterClientRejected(BaseModel):
+    nome_contato: Optional[str] = None
+    nome_cliente: Optional[str] = None
+    motivo: str
+
+class RegisterClientBatchResponse(BaseModel):
+    success: bool
+    message: str
+    storage: str
+    cadastrados: int
+    inalterados: int
+    invalidos: List[RegisterClientRejected]
+
+
+class ClientSuggestion(BaseModel):
+    cliente: str
+    score: float
+    via: str
+
+class UnmappedContact(BaseModel):
+    contato: str
+    atendimentos: int
+    sugestoes: List[ClientSuggestion]
+
+class UnmappedSuggestionsResponse(BaseModel):
+    total_contatos: int
+    contatos: List[UnmappedContact]
+
+
+class UploadBaseResponse(BaseModel):
+    success: bool
+    message: str
+    adicionados: int
+    alterados: int
+    removidos: int
+    inalterados: int
+
+
 class UploadMonthResponse(BaseModel):
     success: bool
     message: str
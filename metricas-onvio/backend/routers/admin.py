@@ -1,25 +1,49 @@
 """
 Router de Administração.
 POST /api/admin/register_client → cadastra vínculo Contato → Cliente.
+POST /api/admin/register_clients → cadastra vários vínculos de uma vez (um LoadJob).
 POST /api/admin/upload_month → faz upload de um CSV para novo mês.
+GET /api/admin/unmapped_suggestions → contatos NÃO IDENTIFICADO com sugestões de cliente.
+POST /api/admin/compact_mapping → compacta a config_client_mapping (última versão por contato).
+POST /api/admin/upload_base → atualiza a base De/Para aplicando só a diferença (MERGE).
+GET /api/admin/export_base → exporta o mapeamento atual como statusContatos.xlsx.
 """
 
 import os
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, status
+from fastapi.responses import StreamingResponse
 
 from backend.core.auth import require_admin
 from backend.core.config import get_settings
-from backend.models.schemas import RegisterClientRequest, RegisterClientResponse, UploadMonthResponse
+from backend.models.schemas import (
+    RegisterClientBatchRequest,
+    RegisterClientBatchResponse,
+    RegisterClientRequest,
+    RegisterClientResponse,
+    UnmappedContact,
+    UnmappedSuggestionsResponse,
+    UploadBaseResponse,
+    UploadMonthResponse,
+)
 
-from backend.services.mapping_service import cadastrar_novo_cliente
+from backend.services.mapping_service import (
+    atualizar_base,
+    cadastrar_clientes_em_lote,
+    cadastrar_novo_cliente,
+    compactar_mapeamento,
+)
 from backend.services.bigquery_service import get_bq_client
+from backend.services.mapping_store import get_mapping_store
+from backend.services.data_service import contar_contatos_nao_identificados, invalidar_mes
+from backend.services.suggestion_service import obter_indice
 
 # Helper for normalized BQ uploads
 import io
 import pandas as pd
 from google.cloud import bigquery
-from datetime import datetime
 
 router = APIRouter(prefix="/api/admin", tags=["Administração"])
 
@@ -30,7 +54,7 @@ async def register_client(
     current_user: dict = Depends(require_admin),
 ):
     """
-    Cadastra um novo vínculo Contato → Cliente no statusContatos.xlsx.
+    Cadastra um novo vínculo Contato → Cliente (BigQuery + store local).
     Restrito a administradores.
     """
     print(f"[DEBUG] Rota register_client chamada: {request.nome_contato} -> {request.nome_cliente}")
@@ -48,6 +72,82 @@ async def register_client(
     return RegisterClientResponse(success=True, message=msg)
 
 
+LIMITE_LOTE_CADASTRO = 2000
+
+
+@router.post("/register_clients", response_model=RegisterClientBatchResponse)
+async def register_clients(
+    request: RegisterClientBatchRequest,
+    current_user: dict = Depends(require_admin),
+):
+    """
+    Cadastra vários vínculos Contato → Cliente numa chamada só
+    (um LoadJob no BigQuery e uma gravação no store local).
+    Restrito a administradores.
+    """
+    if not request.itens:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nenhum vínculo informado.")
+    if len(request.itens) > LIMITE_LOTE_CADASTRO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Máximo de {LIMITE_LOTE_CADASTRO} vínculos por lote.",
+        )
+
+    resultado = cadastrar_clientes_em_lote([(i.nome_contato, i.nome_cliente) for i in request.itens])
+    if not resultado["success"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=resultado["message"])
+
+    return RegisterClientBatchResponse(**resultado)
+
+
+@router.get("/unmapped_suggestions", response_model=UnmappedSuggestionsResponse)
+async def unmapped_suggestions(
+    months: List[str] = Query(..., description="Meses (ex: 2026_01), pode repetir"),
+    limite_contatos: int = Query(200, ge=1, le=2000),
+    limite_sugestoes: int = Query(3, ge=1, le=10),
+    current_user: dict = Depends(require_admin),
+):
+    """
+    Lista os contatos NÃO IDENTIFICADO dos meses (por volume de atendimentos)
+    com os clientes mais parecidos, via índice de trigramas do mapeamento.
+    Restrito a administradores.
+    """
+    try:
+        pendentes = contar_contatos_nao_identificados(months)
+        indice = obter_indice()
+        contatos = [
+            UnmappedContact(
+                contato=p["contato"],
+                atendimentos=p["atendimentos"],
+                sugestoes=indice.sugerir(p["contato"], limite=limite_sugestoes),
+            )
+            for p in pendentes[:limite_contatos]
+        ]
+        return UnmappedSuggestionsResponse(total_contatos=len(pendentes), contatos=contatos)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao gerar sugestões: {str(e)}",
+        )
+
+
+@router.post("/compact_mapping")
+async def compact_mapping(current_user: dict = Depends(require_admin)):
+    """
+    Compacta a tabela de mapeamento (uma linha por contato) e arquiva as
+    versões antigas no histórico. Também roda agendada via
+    backend/scripts/compact_mapping.py. Restrito a administradores.
+    """
+    try:
+        resultado = compactar_mapeamento()
+        return {"success": True, "message": "Mapeamento compactado.", **resultado}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao compactar mapeamento: {str(e)}",
+        )
+
+
 @router.post("/upload_month", response_model=UploadMonthResponse)
 async def upload_month(
     nome: str = Form(..., description="Nome do arquivo (ex: 2026_03)"),
@@ -152,6 +252,7 @@ async def upload_month(
         
         job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
         job.result()
+        invalidar_mes(filename.replace(".csv", ""))
 
         return UploadMonthResponse(
             success=True,
@@ -165,18 +266,16 @@ async def upload_month(
         )
 
 
-@router.post("/upload_base")
+@router.post("/upload_base", response_model=UploadBaseResponse)
 async def upload_base(
     file: UploadFile = File(..., description="Arquivo statusContatos.xlsx"),
     current_user: dict = Depends(require_admin),
 ):
     """
-    Substitui o arquivo statusContatos.xlsx (base De/Para global).
-    Restrito a administradores.
+    Substitui a base De/Para global pelo statusContatos.xlsx enviado.
+    Aplica só a diferença (novos, alterados, removidos) com um MERGE no
+    BigQuery e devolve o resumo. Restrito a administradores.
     """
-    settings = get_settings()
-    map_path = settings.MAPPING_FILE
-
     try:
         content = await file.read()
         
@@ -185,46 +284,52 @@ async def upload_base(
         
         # Normalize Columns
         # Look for "NOME DO CONTATO" and "NOME CLIENTE"
-        cols_map = {c.upper(): c for c in df_map.columns}
+        cols_map = {str(c).upper(): c for c in df_map.columns}
         
         if "NOME DO CONTATO" not in cols_map or "NOME CLIENTE" not in cols_map:
              raise HTTPException(status_code=400, detail="Colunas 'NOME DO CONTATO' e 'NOME CLIENTE' necessárias.")
              
-        df_clean = df_map[[cols_map["NOME DO CONTATO"], cols_map["NOME CLIENTE"]]].copy()
+        df_clean = df_map[[cols_map["NOME DO CONTATO"], cols_map["NOME CLIENTE"]]].dropna().copy()
         df_clean.columns = ["original_name", "normalized_name"]
         
         # Clean
         df_clean["original_name"] = df_clean["original_name"].astype(str).str.strip().str.upper()
         df_clean["normalized_name"] = df_clean["normalized_name"].astype(str).str.strip()
+        df_clean = df_clean[(df_clean["original_name"] != "") & (df_clean["normalized_name"] != "")]
         df_clean = df_clean.drop_duplicates(subset=["original_name"])
-        df_clean = df_clean[df_clean["original_name"] != "NAN"]
-        df_clean = df_clean[df_clean["original_name"] != ""]
-        
-        df_clean["updated_at"] = datetime.utcnow().isoformat()
-        
-        # Load to BQ
-        client = get_bq_client()
-        if not client:
-             raise HTTPException(status_code=500, detail="BigQuery Error")
-             
-        table_id = f"{settings.BQ_PROJECT}.{settings.BQ_DATASET}.config_client_mapping"
-        
-        job_config = bigquery.LoadJobConfig(
-            write_disposition="WRITE_TRUNCATE",
-            schema=[
-                bigquery.SchemaField("original_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("normalized_name", "STRING", mode="REQUIRED"),
-                bigquery.SchemaField("updated_at", "TIMESTAMP", mode="NULLABLE"),
-            ]
-        )
-        
-        job = client.load_table_from_dataframe(df_clean, table_id, job_config=job_config)
-        job.result()
 
-        return {"success": True, "message": "Base atualizada no BigQuery com sucesso!"}
+        if df_clean.empty:
+            # Base vazia apagaria todos os vínculos
+            raise HTTPException(status_code=400, detail="Nenhum vínculo válido no arquivo.")
+
+        return atualizar_base(dict(zip(df_clean["original_name"], df_clean["normalized_name"])))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao atualizar base: {str(e)}",
         )
 
+
+@router.get("/export_base")
+async def export_base(current_user: dict = Depends(require_admin)):
+    """
+    Exporta o mapeamento Contato → Cliente atual no formato do statusContatos.xlsx.
+    Restrito a administradores.
+    """
+    try:
+        stream = io.BytesIO()
+        get_mapping_store().exportar_excel(stream)
+        stream.seek(0)
+        response = StreamingResponse(
+            stream,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        response.headers["Content-Disposition"] = "attachment; filename=statusContatos.xlsx"
+        return response
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao exportar base: {str(e)}",
+        )
@@ -0,0 +1,21 @@
+"""
+Compactação agendada da config_client_mapping (ex.: Cloud Scheduler / cron diário).
+Mantém só a versão mais recente de cada contato e arquiva o resto no histórico.
+
+Uso: python backend/scripts/compact_mapping.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from backend.services.mapping_service import compactar_mapeamento
+
+if __name__ == "__main__":
+    try:
+        r = compactar_mapeamento()
+    except Exception as e:
+        print(f"❌ Erro na compactação: {e}")
+        sys.exit(1)
+    print(f"✅ {r['removidas']} versão(ões) antiga(s) removida(s), {r['arquivadas']} arquivada(s). "
+          f"Tabela com {r['linhas']} linhas / {r['contatos']} contatos.")
@@ -5,13 +5,102 @@ Portado de app_metricas.py (linhas 749-888), removendo dependência do Streamlit
 
 import glob
 import os
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
 from backend.core.config import get_settings
 from backend.services.bigquery_service import HAS_BQ, get_bq_client
-from backend.services.mapping_service import aplicar_depara
+from backend.services.mapping_service import NAO_IDENTIFICADO, aplicar_depara, obter_mapeamento, registrar_ouvinte
+
+COLUNAS_BQ = {
+    "Atendido_por": "Atendido por",
+    "Nome_Cliente": "Nome Cliente",  # If exists
+    "Data_Inicio": "Data Início",    # If exists
+}
+
+# --- CACHE DOS MESES CARREGADOS (identificador -> (expira, DataFrame processado)) ---
+# Contato_Clean fica categórico: uma mudança no mapeamento (cadastro, upload
+# da base, recarga do cache) reescreve o Cliente_Final só das linhas cujo
+# código de categoria é de um contato alterado, sem reconsultar o BigQuery.
+# Os frames em cache não são alterados no lugar: o remapeamento troca a
+# entrada por uma cópia rasa com a coluna nova (quem já recebeu o frame
+# antigo não é afetado).
+_meses: "OrderedDict[str, tuple]" = OrderedDict()
+_meses_lock = threading.Lock()
+_versao_mapeamento = 0  # Muda a cada alteração publicada (descarta cargas feitas no meio dela)
+
+
+def _mes_em_cache(identificador: str) -> Optional[pd.DataFrame]:
+    with _meses_lock:
+        item = _meses.get(identificador)
+        if item is None:
+            return None
+        if time.time() >= item[0]:
+            del _meses[identificador]
+            return None
+        _meses.move_to_end(identificador)
+        return item[1]
+
+
+def _guardar_mes(identificador: str, df: pd.DataFrame, versao: int) -> None:
+    settings = get_settings()
+    with _meses_lock:
+        if versao != _versao_mapeamento:
+            return  # Mapeamento mudou durante a carga: não guarda frame desatualizado
+        _meses[identificador] = (time.time() + settings.MONTH_CACHE_TTL, df)
+        _meses.move_to_end(identificador)
+        while len(_meses) > settings.MONTH_CACHE_MAX:
+            _meses.popitem(last=False)
+
+
+def invalidar_mes(mes: str) -> None:
+    """Descarta do cache o mês (ex: '2026_03'), seja do BigQuery ou CSV local."""
+    with _meses_lock:
+        for identificador in list(_meses):
+            nome = os.path.basename(identificador.replace("BQ:", "")).replace(".csv", "")
+            if nome == mes:
+                del _meses[identificador]
+
+
+def _remapear_meses(alteracoes: Dict[str, Optional[str]]) -> None:
+    """
+    Ouvinte do mapping_service: atualiza o Cliente_Final dos meses em cache
+    só nas linhas dos contatos alterados (None = vínculo removido).
+    """
+    global _versao_mapeamento
+    contatos = list(alteracoes)
+    with _meses_lock:
+        _versao_mapeamento += 1
+        for identificador, (expira, df) in list(_meses.items()):
+            categorias = df["Contato_Clean"].cat.categories
+            posicoes = categorias.get_indexer(contatos)
+            if not (posicoes >= 0).any():
+                continue
+
+            # Novo cliente por código de categoria alterado
+            novos = np.empty(len(categorias), dtype=object)
+            alterados = []
+            for contato, pos in zip(contatos, posicoes):
+                if pos >= 0:
+                    novos[pos] = alteracoes[contato] or NAO_IDENTIFICADO
+                    alterados.append(pos)
+
+            codigos = df["Contato_Clean"].cat.codes.to_numpy()
+            linhas = np.isin(codigos, alterados)
+            cliente_final = df["Cliente_Final"].to_numpy(dtype=object, copy=True)
+            cliente_final[linhas] = novos[codigos[linhas]]
+
+            remapeado = df.copy(deep=False)
+            remapeado["Cliente_Final"] = cliente_final
+            _meses[identificador] = (expira, remapeado)
+
+
+registrar_ouvinte(_remapear_meses)
 
 
 def listar_arquivos_por_ano() -> Dict[str, List[dict]]:
@@ -114,9 +203,14 @@ def carregar_dados_mes(identificador: str) -> Optional[pd.DataFrame]:
         identificador: 'BQ:2026_01' ou caminho de um CSV.
 
     Returns:
-        DataFrame processado ou None se falhar.
+        DataFrame processado ou None se falhar. Fica em cache: não altere no lugar.
     """
+    df = _mes_em_cache(identificador)
+    if df is not None:
+        return df
+
     settings = get_settings()
+    versao = _versao_mapeamento
     df = None
 
     # --- TENTATIVA 1: BIGQUERY (NUVEM) ---
@@ -132,11 +226,7 @@ def carregar_dados_mes(identificador: str) -> Optional[pd.DataFrame]:
                     df = client.query(query).to_dataframe()
                     
                     # Remap columns from BQ (No Spaces) to Frontend (Spaces)
-                    df.rename(columns={
-                        "Atendido_por": "Atendido por",
-                        "Nome_Cliente": "Nome Cliente",  # If exists
-                        "Data_Inicio": "Data Início"     # If exists
-                    }, inplace=True)
+                    df.rename(columns=COLUNAS_BQ, inplace=True)
         except Exception as e:
             print(f"DEBUG BQ EXCEPTION (carregar_dados_mes): {e}")
             pass
@@ -162,6 +252,13 @@ def carregar_dados_mes(identificador: str) -> Optional[pd.DataFrame]:
     if df is None:
         return None
 
+    df = _processar_mes(df)
+    _guardar_mes(identificador, df, versao)
+    return df
+
+
+def _processar_mes(df: pd.DataFrame) -> pd.DataFrame:
+    """Cruzamento De/Para e tratamento de datas de um mês bruto."""
     # --- CRUZAMENTO DE/PARA ---
     df = aplicar_depara(df)
 
@@ -212,7 +309,9 @@ def carregar_dados_mes(identificador: str) -> Optional[pd.DataFrame]:
 def carregar_periodo_meses(lista_meses: List[str]) -> Optional[pd.DataFrame]:
     """
     Carrega dados de múltiplos meses de uma vez.
-    Otimizado para BigQuery usando Wildcard Tables (_TABLE_SUFFIX).
+    Meses já em cache não são reconsultados; os que faltam vêm numa única
+    consulta ao BigQuery usando Wildcard Tables (_TABLE_SUFFIX) e entram no
+    cache mês a mês.
     
     Args:
         lista_meses: Lista de identificadores ex: ['2026_01', '2026_02'] (sem prefixo BQ: ou extensão)
@@ -224,81 +323,113 @@ def carregar_periodo_meses(lista_meses: List[str]) -> Optional[pd.DataFrame]:
         return None
         
     settings = get_settings()
-    df_final = None
+    frames: Dict[str, pd.DataFrame] = {}
+    for mes in lista_meses:
+        df = _mes_em_cache(f"BQ:{mes}")
+        if df is None:
+            df = _mes_em_cache(f"{mes}.csv")
+        if df is not None:
+            frames[mes] = df
+    faltando = [m for m in lista_meses if m not in frames]
 
     # Tenta Otimização BigQuery se todos forem formato YYYY_MM
-    if HAS_BQ:
-        # Verifica se todos parecem ser YYYY_MM
-        valid_formats = all(len(m) == 7 and "_" in m for m in lista_meses)
-        
-        if valid_formats:
-            try:
-                # Ordena para pegar min e max para o BETWEEN
-                sorted_meses = sorted(lista_meses)
-                start = sorted_meses[0]
-                end = sorted_meses[-1]
-                
-                # Se a lista não for contínua, o BETWEEN pode pegar coisa extra, 
-                # mas filtramos depois ou confiamos que a UI manda range.
-                # Melhor filtrar explicitamente com IN se forem poucos, ou BETWEEN se for range.
-                # Como a UI manda seleção, vamos usar IN para segurança exata, 
-                # ou _TABLE_SUFFIX in (...) se a lista for pequena, 
-                # ou _TABLE_SUFFIX BETWEEN ... se for grande.
-                
-                # Para simplificar e segurança: Construir string SQL
-                # _TABLE_SUFFIX IN ('2026_01', '2026_02')
-                suffixes = [f"'{m}'" for m in lista_meses]
-                in_clause = ", ".join(suffixes)
-                
-                client = get_bq_client()
-                if client:
-                    query = f"""
-                        SELECT * 
-                        FROM `{settings.BQ_PROJECT}.{settings.BQ_DATASET}.atendimentos_*`
-                        WHERE _TABLE_SUFFIX IN ({in_clause})
-                    """
-                    df = client.query(query).to_dataframe()
-                    
-                    if not df.empty:
-                        # Remap columns
-                        df.rename(columns={
-                            "Atendido_por": "Atendido por",
-                            "Nome_Cliente": "Nome Cliente",
-                            "Data_Inicio": "Data Início"
-                        }, inplace=True)
-                        
-                        # Processamento padrão
-                        df = aplicar_depara(df)
-                        if "Data" in df.columns:
-                            df["Data"] = pd.to_datetime(df["Data"], dayfirst=True, errors="coerce")
-                            if df["Data"].dt.tz is not None:
-                                df["Data"] = df["Data"].dt.tz_localize(None)
-                            df["Dia"] = df["Data"].dt.date
-                            df = df.sort_values(by="Data", ascending=False)
-                            
-                        return df
-            except Exception as e:
-                print(f"Erro no BQ Wildcard: {e}")
-                # Fallback para loop individual se der erro no BQ
-
-    # Fallback: Carrega um por um e concatena (Local ou erro no BQ)
-    dfs = []
-    for mes in lista_meses:
-        # Tenta carregar como BQ individual ou Local
-        # carregar_dados_mes aceita "BQ:2026_01" ou caminho
-        # Vamos tentar inferir. Se estamos aqui, ou não tem BQ ou deu erro.
-        # Tenta achar arquivo local correspondente
-        ident = f"BQ:{mes}" if HAS_BQ else f"{mes}.csv"
-        d = carregar_dados_mes(ident)
-        if d is None and HAS_BQ: 
-            # Se falhou como BQ, tenta local files mesmo com HAS_BQ true
-             d = carregar_dados_mes(f"{mes}.csv")
-             
-        if d is not None:
-            dfs.append(d)
+    carregado_bq = False
+    if faltando and HAS_BQ and all(len(m) == 7 and "_" in m for m in faltando):
+        try:
+            from google.cloud import bigquery
+
+            client = get_bq_client()
+            if client:
+                versao = _versao_mapeamento
+                query = f"""
+                    SELECT *, _TABLE_SUFFIX AS _Mes_Tabela
+                    FROM `{settings.BQ_PROJECT}.{settings.BQ_DATASET}.atendimentos_*`
+                    WHERE _TABLE_SUFFIX IN UNNEST(@meses)
+                """
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ArrayQueryParameter("meses", "STRING", faltando)
+                ])
+                df = client.query(query, job_config=job_config).to_dataframe()
+
+                if not df.empty:
+                    # Remap columns
+                    df.rename(columns=COLUNAS_BQ, inplace=True)
+
+                    # Processamento padrão, mês a mês (cada um vai para o cache)
+                    for mes, parte in df.groupby("_Mes_Tabela", sort=False):
+                        parte = _processar_mes(parte.drop(columns=["_Mes_Tabela"]).reset_index(drop=True))
+                        _guardar_mes(f"BQ:{mes}", parte, versao)
+                        frames[mes] = parte
+                    carregado_bq = True
+        except Exception as e:
+            print(f"Erro no BQ Wildcard: {e}")
+            # Fallback para loop individual se der erro no BQ
+
+    # Fallback: Carrega um por um (Local ou erro no BQ)
+    if not carregado_bq:
+        for mes in faltando:
+            # carregar_dados_mes aceita "BQ:2026_01" ou caminho (e guarda no cache)
+            ident = f"BQ:{mes}" if HAS_BQ else f"{mes}.csv"
+            d = carregar_dados_mes(ident)
+            if d is None and HAS_BQ: 
+                # Se falhou como BQ, tenta local files mesmo com HAS_BQ true
+                 d = carregar_dados_mes(f"{mes}.csv")
+                 
+            if d is not None:
+                frames[mes] = d
             
-    if dfs:
-        return pd.concat(dfs, ignore_index=True)
-        
-    return None
+    if not frames:
+        return None
+
+    df = pd.concat([frames[m] for m in lista_meses if m in frames], ignore_index=True)
+    if "Data" in df.columns:
+        df = df.sort_values(by="Data", ascending=False)
+    return df
+
+
+def contar_contatos_nao_identificados(lista_meses: List[str]) -> List[dict]:
+    """
+    Contatos sem vínculo nos meses informados, com o volume de atendimentos
+    (mais atendimentos primeiro). Agregado no BigQuery; fallback carrega os meses.
 
+    Returns:
+        list[{contato, atendimentos}]
+    """
+    settings = get_settings()
+    mapeamento = obter_mapeamento()
+    volumes: Dict[str, int] = {}
+
+    carregado = False
+    if HAS_BQ and lista_meses and all(len(m) == 7 and "_" in m for m in lista_meses):
+        try:
+            from google.cloud import bigquery
+
+            client = get_bq_client()
+            if client:
+                query = f"""
+                    SELECT UPPER(TRIM(CAST(Contato AS STRING))) AS contato, COUNT(*) AS atendimentos
+                    FROM `{settings.BQ_PROJECT}.{settings.BQ_DATASET}.atendimentos_*`
+                    WHERE _TABLE_SUFFIX IN UNNEST(@meses)
+                    GROUP BY contato
+                """
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ArrayQueryParameter("meses", "STRING", lista_meses)
+                ])
+                for row in client.query(query, job_config=job_config).result():
+                    contato = row["contato"] or ""
+                    volumes[contato] = volumes.get(contato, 0) + int(row["atendimentos"])
+                carregado = True
+        except Exception as e:
+            print(f"Erro ao contar contatos no BQ: {e}")
+
+    if not carregado:
+        df = carregar_periodo_meses(lista_meses)
+        if df is not None and not df.empty:
+            volumes = df["Contato_Clean"].value_counts().to_dict()
+
+    pendentes = [
+        {"contato": contato, "atendimentos": int(qtd)}
+        for contato, qtd in volumes.items()
+        if contato and contato not in mapeamento
+    ]
+    return sorted(pendentes, key=lambda c: (-c["atendimentos"], c["contato"]))
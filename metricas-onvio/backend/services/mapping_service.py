@@ -3,177 +3,495 @@ Serviço de mapeamento Contato → Cliente (De/Para).
 Portado de app_metricas.py (linhas 788-807 e 960-997).
 """
 
-import os
+import threading
+import time
 import pandas as pd
-from openpyxl import load_workbook
-from typing import Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 
 from backend.core.config import get_settings
 from backend.services.bigquery_service import get_bq_client
+from backend.services.mapping_store import get_mapping_store
 from google.cloud import bigquery
 
 TABLE_ID = "metricas.config_client_mapping"
+HISTORY_TABLE_ID = "metricas.config_client_mapping_history"  # Todas as versões (auditoria)
+NAO_IDENTIFICADO = "NÃO IDENTIFICADO"
+
+# --- CACHE DO MAPEAMENTO (original_name -> normalized_name, último updated_at vence) ---
+# Carregado uma vez e mantido em memória; cadastros deste processo atualizam o
+# cache na hora e avisam os ouvintes (índice de sugestões, meses em cache).
+# O TTL cobre cadastros feitos por outras instâncias.
+_mapeamento: Optional[Dict[str, str]] = None
+_mapeamento_expira = 0.0
+_mapeamento_lock = threading.Lock()
+_ouvintes = []
+
+
+def registrar_ouvinte(callback: Callable[[Dict[str, Optional[str]]], None]) -> None:
+    """
+    Registra uma função chamada a cada mudança no mapeamento com
+    {original_name: normalized_name} (None = vínculo removido).
+    """
+    _ouvintes.append(callback)
+
+
+def _publicar(alteracoes: Dict[str, Optional[str]]) -> None:
+    """
+    Aplica as alterações no cache e avisa os ouvintes. O dict em cache nunca
+    é alterado no lugar (quem recebeu de obter_mapeamento pode iterar sem
+    lock): monta uma cópia e troca.
+    """
+    global _mapeamento
+    if not alteracoes:
+        return
+    with _mapeamento_lock:
+        if _mapeamento is not None:
+            novo = dict(_mapeamento)
+            for original, normalizado in alteracoes.items():
+                if normalizado is None:
+                    novo.pop(original, None)
+                else:
+                    novo[original] = normalizado
+            _mapeamento = novo
+    for callback in list(_ouvintes):
+        try:
+            callback(alteracoes)
+        except Exception as e:
+            print(f"Erro ao notificar mudança de mapeamento: {e}")
+
+
+def _carregar_mapeamento_bq() -> Optional[Dict[str, str]]:
+    client = get_bq_client()
+    if not client:
+        return None
+    # Deduplicação no BigQuery (último updated_at de cada original_name)
+    query = f"""
+        SELECT original_name, normalized_name
+        FROM `{client.project}.{TABLE_ID}`
+        WHERE original_name IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY original_name ORDER BY updated_at DESC) = 1
+    """
+    return {
+        str(row["original_name"]).strip().upper(): row["normalized_name"]
+        for row in client.query(query).result()
+    }
+
+
+def _reenviar_pendentes(mapeamento_bq: Dict[str, str]) -> None:
+    """
+    Envia ao BigQuery os cadastros feitos só no store local (BigQuery fora do
+    ar) e os inclui no mapeamento recém-carregado.
+    """
+    try:
+        store = get_mapping_store()
+        pendentes = [(o, n) for o, n in store.pendentes().items() if mapeamento_bq.get(o) != n]
+        if pendentes:
+            _gravar_bq(pendentes)
+            print(f"[MAPPING] {len(pendentes)} cadastro(s) pendente(s) do store local enviados ao BigQuery.")
+            mapeamento_bq.update(pendentes)
+        store.confirmar(o for o, _ in pendentes)
+    except Exception as e:
+        print(f"Error replaying pending local mappings: {e}")
+
+
+def _carregar_mapeamento_local() -> Optional[Dict[str, str]]:
+    mapeamento = get_mapping_store().carregar()
+    return mapeamento or None
+
+
+def obter_mapeamento(forcar: bool = False) -> Dict[str, str]:
+    """
+    Mapeamento Contato (UPPER + STRIP) → Cliente em cache.
+    BigQuery primeiro; store local (mapping_store) se o BigQuery falhar.
+    Não altere o dict devolvido (é o próprio cache, trocado a cada mudança).
+    """
+    global _mapeamento, _mapeamento_expira
+
+    with _mapeamento_lock:
+        if not forcar and _mapeamento is not None and time.time() < _mapeamento_expira:
+            return _mapeamento
+
+    novo = None
+    try:
+        novo = _carregar_mapeamento_bq()
+        if novo is not None:
+            _reenviar_pendentes(novo)
+            # Mantém o fallback local em dia (grava só a diferença)
+            try:
+                get_mapping_store().sincronizar(novo)
+            except Exception as e:
+                print(f"Error syncing local mapping store: {e}")
+    except Exception as e:
+        print(f"Error loading mapping from BQ: {e}")
+    if novo is None:
+        try:
+            novo = _carregar_mapeamento_local()
+        except Exception as e:
+            print(f"Error loading local mapping store: {e}")
+
+    with _mapeamento_lock:
+        if novo is None:
+            # Mantém o que já tinha (se tiver) e tenta de novo no próximo TTL
+            _mapeamento_expira = time.time() + get_settings().MAPPING_CACHE_TTL
+            return _mapeamento if _mapeamento is not None else {}
+        anterior = _mapeamento
+        _mapeamento = novo
+        _mapeamento_expira = time.time() + get_settings().MAPPING_CACHE_TTL
+
+    # Recarga com mudanças de fora (outra instância): avisa só o que mudou
+    if anterior is not None:
+        alteracoes = {k: v for k, v in novo.items() if anterior.get(k) != v}
+        alteracoes.update({k: None for k in anterior if k not in novo})
+        if alteracoes:
+            for callback in list(_ouvintes):
+                try:
+                    callback(alteracoes)
+                except Exception as e:
+                    print(f"Erro ao notificar mudança de mapeamento: {e}")
+    return novo
 
 
 def aplicar_depara(df: pd.DataFrame) -> pd.DataFrame:
     """
     Aplica o cruzamento De/Para no DataFrame de atendimentos.
 
-    1. Normaliza a coluna 'Contato' → 'Contato_Clean' (UPPER + STRIP)
-    2. Lê o statusContatos.xlsx
-    3. Faz merge para preencher 'Cliente_Final'
+    1. Normaliza a coluna 'Contato' → 'Contato_Clean' (UPPER + STRIP, categórica)
+    2. Busca o mapeamento em cache (BigQuery, ou store local como fallback)
+    3. Preenche 'Cliente_Final'
     4. Fallback → "NÃO IDENTIFICADO"
     """
-    settings = get_settings()
-
-    # 1. Normalização do Contato
+    # 1. Normalização do Contato (categórica: um código por contato distinto)
     col_contato = "Contato" if "Contato" in df.columns else df.columns[1]
     df["Contato_Clean"] = df[col_contato].apply(
         lambda x: str(x).strip().upper() if pd.notnull(x) else ""
-    )
+    ).astype("category")
+
+    # 2/3. Cruzamento com o mapeamento em cache — uma busca por contato distinto
+    mapeamento = obter_mapeamento()
+    contatos = df["Contato_Clean"].cat
+    clientes = pd.Series(contatos.categories).map(mapeamento).fillna(NAO_IDENTIFICADO).to_numpy(dtype=object)
+    df["Cliente_Final"] = clientes[contatos.codes.to_numpy()] if len(clientes) else NAO_IDENTIFICADO
 
-    # 2. Cruzamento com Excel (Original) ou BigQuery (Novo)
-    # Tenta carregar do BigQuery
-    df_map = None
-    cols_map = {}
-    
+    return df
+
+
+def _gravar_local(linhas: List[Tuple[str, str]]) -> bool:
+    """
+    Grava os vínculos no store local (log + snapshot, uma transação), como
+    pendentes até o LoadJob no BigQuery confirmar (_confirmar_local).
+    """
+    if not linhas:
+        return False
     try:
-        client = get_bq_client()
-        if client:
-            # Pega também updated_at para deduplicar
-            query = f"SELECT original_name, normalized_name, updated_at FROM `{client.project}.{TABLE_ID}`"
-            df_bq = client.query(query).to_dataframe()
-            
-            # --- DEDUPLICAÇÃO POR TIMESTAMP (LATEST WINS) ---
-            if not df_bq.empty and "updated_at" in df_bq.columns:
-                # Converte para datetime se não for
-                df_bq["updated_at"] = pd.to_datetime(df_bq["updated_at"], errors="coerce")
-                # Ordena decrescente (mais recente primeiro)
-                df_bq = df_bq.sort_values(by="updated_at", ascending=False)
-                # Mantém apenas a primeira ocorrência (a maiscente) de cada original_name
-                df_bq = df_bq.drop_duplicates(subset=["original_name"], keep="first")
-            
-            # Rename to match expected logic below or standardise
-            df_bq = df_bq.rename(columns={"original_name": "Nome_Map_Clean", "normalized_name": "Cliente_Alvo"})
-            # Ensure upper/strip just in case (though migration did it)
-            df_map_clean = df_bq.copy()
+        get_mapping_store().gravar(linhas, pendente=True)
     except Exception as e:
-        print(f"Error loading mapping from BQ: {e}")
+        print(f"[DEBUG] Local store error: {e}")
+        return False
+    return True
 
-    # Fallback to Excel if BQ failed
-    if df_map_clean is None:
-        map_path = settings.MAPPING_FILE
-        if os.path.exists(map_path):
-            try:
-                df_map = pd.read_excel(map_path, engine="openpyxl")
-                cols_map = {c.upper(): c for c in df_map.columns}
-
-                if "NOME DO CONTATO" in cols_map and "NOME CLIENTE" in cols_map:
-                    df_map_clean = df_map[
-                        [cols_map["NOME DO CONTATO"], cols_map["NOME CLIENTE"]]
-                    ].copy()
-                    df_map_clean.columns = ["Nome_Map", "Cliente_Alvo"]
-                    df_map_clean["Nome_Map_Clean"] = df_map_clean["Nome_Map"].apply(
-                        lambda x: str(x).strip().upper() if pd.notnull(x) else ""
-                    )
-                    df_map_clean = df_map_clean.drop_duplicates(subset=["Nome_Map_Clean"])
-            except Exception:
-                pass
-    
-    if df_map_clean is not None:
-         # Perform Merge
-         try:
-            df = pd.merge(
-                df,
-                df_map_clean,
-                left_on="Contato_Clean",
-                right_on="Nome_Map_Clean",
-                how="left",
-            )
-            df["Cliente_Final"] = df["Cliente_Alvo"].fillna("NÃO IDENTIFICADO")
-         except Exception:
-            df["Cliente_Final"] = "NÃO IDENTIFICADO"
-    else:
-        df["Cliente_Final"] = "NÃO IDENTIFICADO"
 
-    return df
+def _confirmar_local(linhas: List[Tuple[str, str]]) -> None:
+    try:
+        get_mapping_store().confirmar(o for o, _ in linhas)
+    except Exception as e:
+        print(f"[DEBUG] Local store error: {e}")
+
+
+def _gravar_bq(linhas: List[Tuple[str, str]]) -> None:
+    """
+    Um único LoadJob (WRITE_APPEND) com todos os vínculos.
+    APPEND-ONLY: o leitor fica com o maior updated_at de cada original_name.
+    """
+    client = get_bq_client()
+    if not client:
+        raise RuntimeError("Client BQ nulo")
+
+    agora = datetime.utcnow()
+    df_insert = pd.DataFrame(
+        [{"original_name": o, "normalized_name": n, "updated_at": agora} for o, n in linhas]
+    )
+    df_insert["updated_at"] = pd.to_datetime(df_insert["updated_at"])
+
+    job_config = bigquery.LoadJobConfig(
+        write_disposition="WRITE_APPEND",
+    )
+    job = client.load_table_from_dataframe(df_insert, f"{client.project}.{TABLE_ID}", job_config=job_config)
+    job.result()
 
 
 def cadastrar_novo_cliente(nome_contato: str, nome_cliente: str) -> Tuple[bool, str]:
     """
-    Cadastra um novo vínculo Contato → Cliente no statusContatos.xlsx.
+    Cadastra um novo vínculo Contato → Cliente (BigQuery + store local).
     Usa o padrão APPEND-ONLY no BigQuery para evitar problemas de DML no Sandbox.
     """
-    settings = get_settings()
-    map_path = settings.MAPPING_FILE
-    
     original = nome_contato.strip().upper()
     normalized = nome_cliente.strip()
 
-    cadastrado = False
-    
-    # 1. Update Excel (Local Backup)
-    if os.path.exists(map_path):
-        try:
-            wb = load_workbook(map_path)
-            ws = wb.active
-            headers = [cell.value for cell in ws[1]]
-            headers_upper = [str(h).upper() if h else "" for h in headers]
-            try:
-                idx_nome = headers_upper.index("NOME DO CONTATO")
-                idx_cliente = headers_upper.index("NOME CLIENTE")
-                
-                nova_linha = [None] * len(headers)
-                nova_linha[idx_nome] = original
-                nova_linha[idx_cliente] = normalized
-
-                ws.append(nova_linha)
-                wb.save(map_path)
-                cadastrado = True
-            except ValueError:
-                pass
-        except Exception as e:
-            pass 
+    # 1. Store local (backup)
+    cadastrado = _gravar_local([(original, normalized)])
 
     # 2. Update BigQuery (APPEND ONLY)
     try:
-        client = get_bq_client()
-        if client:
-            print(f"[DEBUG] Tentando inserir no BQ: {original} -> {normalized}")
-            
-            # Não fazemos mais DELETE. Apenas INSERT da nova versão via LoadJob (Append).
-            # O aplicar_depara vai pegar o registro com maior updated_at.
-            
-            row = {
-                "original_name": original, 
-                "normalized_name": normalized,
-                "updated_at": datetime.utcnow().isoformat()
-            }
-            
-            # Create DataFrame and convert to datetime to avoid pyarrow error
-            df_insert = pd.DataFrame([row])
-            df_insert["updated_at"] = pd.to_datetime(df_insert["updated_at"])
-            
-            print(f"[DEBUG] DataFrame para insert: {df_insert}")
-            
-            job_config = bigquery.LoadJobConfig(
-                write_disposition="WRITE_APPEND",
-            )
-            job = client.load_table_from_dataframe(df_insert, f"{client.project}.{TABLE_ID}", job_config=job_config)
-            job.result()
-            
-            print("[DEBUG] Sucesso no LoadJob BQ")
-            return True, "Cadastrado no BigQuery (+ Excel Local) com sucesso!"
-        else:
-             print("[DEBUG] Client BQ nulo")
-
+        print(f"[DEBUG] Tentando inserir no BQ: {original} -> {normalized}")
+        _gravar_bq([(original, normalized)])
+        print("[DEBUG] Sucesso no LoadJob BQ")
+        _confirmar_local([(original, normalized)])
+        _publicar({original: normalized})
+        return True, "Cadastrado no BigQuery (+ Store Local) com sucesso!"
     except Exception as e:
         print(f"[DEBUG] BQ Insert Error: {e}")
         if not cadastrado:
             return False, f"Erro ao cadastrar: {e}"
-            
-    if cadastrado:
-        return True, "Cadastrado no Excel Local (BQ indisponível)."
-    
-    return False, "Falha ao cadastrar."
+
+    _publicar({original: normalized})
+    return True, "Cadastrado no Store Local (BQ indisponível)."
+
+
+def cadastrar_clientes_em_lote(pares: List[Tuple[str, str]]) -> dict:
+    """
+    Cadastra vários vínculos Contato → Cliente de uma vez:
+    valida, descarta o que já está igual no mapeamento, faz um único LoadJob
+    no BigQuery e uma única gravação no store local.
+
+    Returns:
+        dict com success, message, storage, cadastrados, inalterados e invalidos
+        ([{nome_contato, nome_cliente, motivo}]).
+    """
+    invalidos = []
+    lote: Dict[str, str] = {}
+    conflitos = set()
+
+    for nome_contato, nome_cliente in pares:
+        original = (nome_contato or "").strip().upper()
+        normalized = (nome_cliente or "").strip()
+        if not original or not normalized:
+            invalidos.append({"nome_contato": nome_contato, "nome_cliente": nome_cliente, "motivo": "Contato e cliente são obrigatórios"})
+        elif normalized.upper() == NAO_IDENTIFICADO:
+            invalidos.append({"nome_contato": nome_contato, "nome_cliente": nome_cliente, "motivo": f"Cliente não pode ser {NAO_IDENTIFICADO}"})
+        elif original in lote and lote[original] != normalized:
+            conflitos.add(original)
+        else:
+            lote[original] = normalized
+
+    for original in conflitos:
+        invalidos.append({"nome_contato": original, "nome_cliente": lote.pop(original), "motivo": "Contato repetido no lote com clientes diferentes"})
+
+    # Dedup contra o mapeamento atual (cache)
+    atual = obter_mapeamento()
+    novos = [(o, n) for o, n in lote.items() if atual.get(o) != n]
+    inalterados = len(lote) - len(novos)
+
+    resultado = {
+        "success": True,
+        "cadastrados": len(novos),
+        "inalterados": inalterados,
+        "invalidos": invalidos,
+        "storage": "nenhum",
+    }
+    if not novos:
+        resultado["message"] = "Nenhum vínculo novo para cadastrar."
+        return resultado
+
+    local_ok = _gravar_local(novos)
+    try:
+        _gravar_bq(novos)
+        _confirmar_local(novos)
+        resultado["storage"] = "bigquery+local" if local_ok else "bigquery"
+    except Exception as e:
+        print(f"[DEBUG] BQ Batch Insert Error: {e}")
+        if not local_ok:
+            resultado.update(success=False, cadastrados=0, message=f"Erro ao cadastrar: {e}")
+            return resultado
+        resultado["storage"] = "local"
+
+    _publicar(dict(novos))
+    resultado["message"] = f"{len(novos)} vínculo(s) cadastrado(s) ({resultado['storage']})."
+    return resultado
+
+
+def _nao_arquivada(historico: str) -> str:
+    """Predicado: a versão m da config_client_mapping ainda não está no histórico."""
+    return f"""
+        NOT EXISTS (
+            SELECT 1 FROM `{historico}` h
+            WHERE h.original_name = m.original_name
+            AND h.normalized_name IS NOT DISTINCT FROM m.normalized_name
+            AND h.updated_at IS NOT DISTINCT FROM m.updated_at
+        )
+    """
+
+
+def compactar_mapeamento(tentativas: int = 3) -> dict:
+    """
+    Compacta a config_client_mapping (append-only) para uma linha por
+    original_name — a de maior updated_at — e guarda todas as versões em
+    config_client_mapping_history.
+
+    Roda numa transação: quem lê vê a tabela antes ou depois da compactação,
+    e os dois estados dão o mesmo resultado (o leitor já fica com o mais
+    recente). LoadJobs de cadastro que chegarem durante a transação não são
+    apagados (só saem linhas com versão mais nova). Se a transação abortar
+    por concorrência, tenta de novo.
+
+    Returns:
+        dict com arquivadas, removidas, linhas e contatos (após a compactação).
+    """
+    client = get_bq_client()
+    if not client:
+        raise RuntimeError("BigQuery indisponível")
+
+    tabela = f"{client.project}.{TABLE_ID}"
+    historico = f"{client.project}.{HISTORY_TABLE_ID}"
+    versao_antiga = f"""
+        EXISTS (
+            SELECT 1 FROM `{tabela}` n
+            WHERE n.original_name = m.original_name
+            AND IFNULL(n.updated_at, TIMESTAMP '1970-01-01') > IFNULL(m.updated_at, TIMESTAMP '1970-01-01')
+        )
+    """
+    script = f"""
+        DECLARE arquivadas INT64 DEFAULT 0;
+        DECLARE removidas INT64 DEFAULT 0;
+
+        CREATE TABLE IF NOT EXISTS `{historico}` (
+            original_name STRING,
+            normalized_name STRING,
+            updated_at TIMESTAMP,
+            arquivado_em TIMESTAMP
+        )
+        CLUSTER BY original_name;
+
+        BEGIN TRANSACTION;
+
+        INSERT INTO `{historico}` (original_name, normalized_name, updated_at, arquivado_em)
+        SELECT m.original_name, m.normalized_name, m.updated_at, CURRENT_TIMESTAMP()
+        FROM `{tabela}` m
+        WHERE {_nao_arquivada(historico)};
+        SET arquivadas = @@row_count;
+
+        DELETE FROM `{tabela}` m WHERE {versao_antiga};
+        SET removidas = @@row_count;
+
+        COMMIT TRANSACTION;
+
+        SELECT arquivadas, removidas, COUNT(*) AS linhas, COUNT(DISTINCT original_name) AS contatos
+        FROM `{tabela}`;
+    """
+
+    for tentativa in range(1, tentativas + 1):
+        try:
+            row = list(client.query(script).result())[0]
+            resultado = {k: int(row[k] or 0) for k in ("arquivadas", "removidas", "linhas", "contatos")}
+            print(f"[MAPPING] Compactação: {resultado}")
+            return resultado
+        except Exception as e:
+            if tentativa == tentativas or "concurrent" not in str(e).lower():
+                raise
+            print(f"[MAPPING] Compactação abortada por concorrência (tentativa {tentativa}), repetindo...")
+            time.sleep(2 * tentativa)
+
+
+def diferenca_mapeamento(atual: Dict[str, str], novo: Dict[str, str]) -> Dict[str, Dict[str, Optional[str]]]:
+    """Separa o que muda de atual para novo: adicionados, alterados e removidos (None)."""
+    adicionados = {o: n for o, n in novo.items() if o not in atual}
+    alterados = {o: n for o, n in novo.items() if o in atual and atual[o] != n}
+    removidos = {o: None for o in atual if o not in novo}
+    return {"adicionados": adicionados, "alterados": alterados, "removidos": removidos}
+
+
+def _aplicar_diferenca_bq(alteracoes: Dict[str, Optional[str]]) -> None:
+    """
+    Aplica as alterações com um único MERGE (só as linhas que mudam viajam
+    como parâmetro). As versões substituídas/removidas vão antes para o
+    histórico, na mesma transação.
+    """
+    client = get_bq_client()
+    if not client:
+        raise RuntimeError("BigQuery indisponível")
+
+    tabela = f"{client.project}.{TABLE_ID}"
+    historico = f"{client.project}.{HISTORY_TABLE_ID}"
+    script = f"""
+        CREATE TABLE IF NOT EXISTS `{historico}` (
+            original_name STRING,
+            normalized_name STRING,
+            updated_at TIMESTAMP,
+            arquivado_em TIMESTAMP
+        )
+        CLUSTER BY original_name;
+
+        BEGIN TRANSACTION;
+
+        INSERT INTO `{historico}` (original_name, normalized_name, updated_at, arquivado_em)
+        SELECT m.original_name, m.normalized_name, m.updated_at, CURRENT_TIMESTAMP()
+        FROM `{tabela}` m
+        WHERE m.original_name IN (SELECT l.original_name FROM UNNEST(@linhas) l)
+        AND {_nao_arquivada(historico)};
+
+        MERGE `{tabela}` t
+        USING UNNEST(@linhas) s
+        ON t.original_name = s.original_name
+        WHEN MATCHED AND s.normalized_name IS NULL THEN
+            DELETE
+        WHEN MATCHED THEN
+            UPDATE SET normalized_name = s.normalized_name, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED AND s.normalized_name IS NOT NULL THEN
+            INSERT (original_name, normalized_name, updated_at)
+            VALUES (s.original_name, s.normalized_name, CURRENT_TIMESTAMP());
+
+        COMMIT TRANSACTION;
+    """
+    linhas = [
+        bigquery.StructQueryParameter(
+            None,
+            bigquery.ScalarQueryParameter("original_name", "STRING", o),
+            bigquery.ScalarQueryParameter("normalized_name", "STRING", n),
+        )
+        for o, n in alteracoes.items()
+    ]
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("linhas", "STRUCT", linhas)]
+    )
+    client.query(script, job_config=job_config).result()
+
+
+def atualizar_base(novo: Dict[str, str]) -> dict:
+    """
+    Substitui a base De/Para pelo mapeamento informado aplicando só a
+    diferença: um MERGE no BigQuery (histórico preservado), uma gravação no
+    store local e aviso aos caches apenas dos contatos afetados.
+
+    Returns:
+        dict com success, message, adicionados, alterados, removidos e inalterados.
+    """
+    # A diferença tem que ser contra o BigQuery: cache, store local ou {} no
+    # lugar dele gerariam um MERGE errado (remoções perdidas, tudo como novo)
+    atual = _carregar_mapeamento_bq()
+    if atual is None:
+        raise RuntimeError("BigQuery indisponível: não dá para calcular a diferença da base")
+    diferenca = diferenca_mapeamento(atual, novo)
+    alteracoes = {**diferenca["adicionados"], **diferenca["alterados"], **diferenca["removidos"]}
+
+    resultado = {k: len(v) for k, v in diferenca.items()}
+    resultado["inalterados"] = len(novo) - resultado["adicionados"] - resultado["alterados"]
+    resultado["success"] = True
+    if not alteracoes:
+        resultado["message"] = "Base sem alterações."
+        return resultado
+
+    _aplicar_diferenca_bq(alteracoes)
+
+    try:
+        # A base enviada substitui tudo, inclusive cadastros locais pendentes
+        get_mapping_store().sincronizar(novo, manter_pendentes=False)
+    except Exception as e:
+        print(f"[DEBUG] Local store error: {e}")
+
+    _publicar(alteracoes)
+    resultado["message"] = (
+        f"Base atualizada: {resultado['adicionados']} novo(s), {resultado['alterados']} alterado(s), "
+        f"{resultado['removidos']} removido(s)."
+    )
+    print(f"[MAPPING] Upload da base: {resultado['message']}")
+    return resultado
@@ -0,0 +1,178 @@
+"""
+Store local do mapeamento Contato → Cliente (fallback quando o BigQuery falha).
+Substitui a leitura/reescrita do statusContatos.xlsx a cada cadastro.
+
+SQLite (WAL) com duas tabelas:
+  - log: append-only, uma linha por alteração (normalized_name NULL = vínculo removido)
+  - snapshot: estado atual, uma linha por contato (pendente = 1 enquanto o
+    vínculo só existir aqui, gravado com o BigQuery fora do ar)
+
+Cada gravação acrescenta no log e atualiza o snapshot na mesma transação
+(atômica, segura entre threads e entre processos). A carga na subida lê só o
+snapshot. O Excel fica só como formato de importação/exportação.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from backend.core.config import get_settings
+
+COL_CONTATO = "NOME DO CONTATO"
+COL_CLIENTE = "NOME CLIENTE"
+
+
+class MappingStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        pasta = os.path.dirname(path)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS log ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " original_name TEXT NOT NULL,"
+            " normalized_name TEXT,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshot ("
+            " original_name TEXT PRIMARY KEY,"
+            " normalized_name TEXT NOT NULL,"
+            " updated_at TEXT NOT NULL,"
+            " pendente INTEGER NOT NULL DEFAULT 0)"
+        )
+        colunas = [c[1] for c in self._conn.execute("PRAGMA table_info(snapshot)")]
+        if "pendente" not in colunas:
+            self._conn.execute("ALTER TABLE snapshot ADD COLUMN pendente INTEGER NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM snapshot").fetchone()[0]
+
+    def carregar(self) -> Dict[str, str]:
+        """Estado atual {original_name: normalized_name}."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT original_name, normalized_name FROM snapshot"))
+
+    def gravar(self, alteracoes: Iterable[Tuple[str, Optional[str]]], pendente: bool = False) -> int:
+        """
+        Aplica (original_name, normalized_name) — None remove o vínculo.
+        Log + snapshot numa transação só. Retorna quantas alterações gravou.
+        pendente=True: ainda não está no BigQuery (ver pendentes/confirmar).
+        """
+        agora = datetime.utcnow().isoformat()
+        linhas = [(o, n, agora) for o, n in alteracoes]
+        if not linhas:
+            return 0
+        with self._lock:
+            with self._conn:  # BEGIN ... COMMIT (ROLLBACK se der erro)
+                self._conn.executemany(
+                    "INSERT INTO log (original_name, normalized_name, updated_at) VALUES (?, ?, ?)", linhas
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO snapshot VALUES (?, ?, ?, ?)",
+                    [l + (int(pendente),) for l in linhas if l[1] is not None],
+                )
+                self._conn.executemany(
+                    "DELETE FROM snapshot WHERE original_name = ?", [(l[0],) for l in linhas if l[1] is None]
+                )
+        return len(linhas)
+
+    def pendentes(self) -> Dict[str, str]:
+        """Vínculos gravados só aqui (BigQuery fora do ar na hora do cadastro)."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT original_name, normalized_name FROM snapshot WHERE pendente = 1"
+            ))
+
+    def confirmar(self, originais: Iterable[str]) -> None:
+        """Marca os vínculos como já gravados no BigQuery."""
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE snapshot SET pendente = 0 WHERE original_name = ?", [(o,) for o in originais]
+                )
+
+    def sincronizar(self, mapeamento: Dict[str, str], manter_pendentes: bool = True) -> int:
+        """
+        Deixa o snapshot igual ao mapeamento informado, gravando só a diferença.
+        Vínculos pendentes (ainda não enviados ao BigQuery) não são apagados
+        nem sobrescritos, a menos que manter_pendentes=False.
+        """
+        atual = self.carregar()
+        pendentes = self.pendentes() if manter_pendentes else {}
+        alteracoes = [(o, n) for o, n in mapeamento.items() if atual.get(o) != n and o not in pendentes]
+        alteracoes += [(o, None) for o in atual if o not in mapeamento and o not in pendentes]
+        gravadas = self.gravar(alteracoes)
+        # Pendente que o BigQuery já tem igual: não precisa mais reenviar
+        self.confirmar(o for o, n in pendentes.items() if mapeamento.get(o) == n)
+        if not manter_pendentes:
+            self.confirmar(list(atual))
+        return gravadas
+
+    # ------------------------------------------------------------------
+    # Excel (só importação / exportação)
+    # ------------------------------------------------------------------
+    def importar_excel(self, origem) -> int:
+        """Acrescenta/atualiza os vínculos de um statusContatos.xlsx (caminho ou buffer)."""
+        import pandas as pd
+
+        df_map = pd.read_excel(origem, engine="openpyxl")
+        cols_map = {str(c).upper(): c for c in df_map.columns}
+        if COL_CONTATO not in cols_map or COL_CLIENTE not in cols_map:
+            raise ValueError(f"Colunas '{COL_CONTATO}' e '{COL_CLIENTE}' necessárias.")
+
+        mapeamento = {}
+        for nome, cliente in zip(df_map[cols_map[COL_CONTATO]], df_map[cols_map[COL_CLIENTE]]):
+            if pd.notnull(nome) and pd.notnull(cliente) and str(nome).strip():
+                mapeamento.setdefault(str(nome).strip().upper(), str(cliente).strip())
+
+        atual = self.carregar()
+        return self.gravar((o, n) for o, n in mapeamento.items() if atual.get(o) != n)
+
+    def exportar_excel(self, destino) -> None:
+        """Gera um .xlsx (caminho ou buffer) com as colunas do statusContatos.xlsx."""
+        import pandas as pd
+
+        itens = sorted(self.carregar().items())
+        df = pd.DataFrame(itens, columns=[COL_CONTATO, COL_CLIENTE])
+        df.to_excel(destino, index=False, engine="openpyxl")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[MappingStore] = None
+_store_lock = threading.Lock()
+
+
+def get_mapping_store() -> MappingStore:
+    """
+    Store global. Na primeira vez (store vazio) importa o statusContatos.xlsx
+    antigo, se existir.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                settings = get_settings()
+                store = MappingStore(settings.MAPPING_STORE_PATH)
+                if len(store) == 0 and os.path.exists(settings.MAPPING_FILE):
+                    try:
+                        n = store.importar_excel(settings.MAPPING_FILE)
+                        print(f"[MAPPING] Store local criado a partir do Excel: {n} vínculos.")
+                    except Exception as e:
+                        print(f"[MAPPING] Falha ao importar o Excel para o store local: {e}")
+                _store = store
+    return _store
@@ -0,0 +1,188 @@
+"""
+Sugestões de cliente para contatos "NÃO IDENTIFICADO".
+
+Índice invertido de trigramas sobre o mapeamento (contatos já vinculados e
+nomes de cliente). Para cada contato, os trigramas levantam poucas dezenas de
+candidatos, que são pontuados com rapidfuzz (WRatio) — ou difflib se o
+rapidfuzz não estiver instalado. Nada de comparar cada contato com o
+mapeamento inteiro.
+
+O índice é montado uma vez e atualizado incrementalmente pelas mudanças
+publicadas pelo mapping_service (cadastros, upload da base).
+"""
+
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+try:
+    from rapidfuzz import fuzz
+
+    HAS_RAPIDFUZZ = True
+except ImportError:
+    HAS_RAPIDFUZZ = False
+
+# Palavras que não ajudam a distinguir empresas
+STOPWORDS = {"LTDA", "ME", "EPP", "EIRELI", "SA", "S", "A", "DE", "DA", "DO", "DAS", "DOS", "E", "EM", "MEI"}
+MAX_CANDIDATOS = 40  # Candidatos (por trigramas) que vão para a pontuação fina
+SCORE_MINIMO = 60.0
+
+_NAO_ALFANUM = re.compile(r"[^A-Z0-9]+")
+
+
+def normalizar(texto: str) -> str:
+    """UPPER, sem acento, só letras/números separados por espaço, sem stopwords."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").upper())
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    tokens = [t for t in _NAO_ALFANUM.split(texto) if t and t not in STOPWORDS]
+    return " ".join(tokens)
+
+
+def trigramas(texto: str) -> set:
+    grams = set()
+    for token in texto.split():
+        token = f" {token} "
+        grams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return grams
+
+
+def _pontuar(a: str, b: str) -> float:
+    if HAS_RAPIDFUZZ:
+        return float(fuzz.WRatio(a, b))
+    # Aproximação do token_set_ratio com difflib
+    ta, tb = set(a.split()), set(b.split())
+    comum = " ".join(sorted(ta & tb))
+    resto_a = " ".join(sorted(ta - tb))
+    resto_b = " ".join(sorted(tb - ta))
+    pares = [(comum, f"{comum} {resto_a}".strip()), (comum, f"{comum} {resto_b}".strip()),
+             (f"{comum} {resto_a}".strip(), f"{comum} {resto_b}".strip())]
+    return max(SequenceMatcher(None, x, y).ratio() * 100 for x, y in pares if x or y)
+
+
+class IndiceSugestoes:
+    """
+    Entradas: textos conhecidos (contato vinculado ou nome de cliente), cada
+    uma apontando para o cliente. Trigrama -> entradas, para achar candidatos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entradas: Dict[str, dict] = {}          # chave -> {texto, cliente, refs}
+        self._grams = defaultdict(set)                # trigrama -> chaves
+        self._contatos: Dict[str, str] = {}           # original_name -> cliente (estado atual)
+        self.montado = False
+
+    # ------------------------------------------------------------------
+    # Manutenção
+    # ------------------------------------------------------------------
+    def _incluir(self, chave: str, texto: str, cliente: str) -> None:
+        entrada = self._entradas.get(chave)
+        if entrada:
+            entrada["refs"] += 1
+            return
+        norm = normalizar(texto)
+        if not norm:
+            return
+        self._entradas[chave] = {"texto": norm, "cliente": cliente, "refs": 1, "grams": trigramas(norm)}
+        for g in self._entradas[chave]["grams"]:
+            self._grams[g].add(chave)
+
+    def _excluir(self, chave: str) -> None:
+        entrada = self._entradas.get(chave)
+        if not entrada:
+            return
+        entrada["refs"] -= 1
+        if entrada["refs"] > 0:
+            return
+        for g in entrada["grams"]:
+            self._grams[g].discard(chave)
+            if not self._grams[g]:
+                del self._grams[g]
+        del self._entradas[chave]
+
+    def _vincular(self, original: str, cliente: str) -> None:
+        self._contatos[original] = cliente
+        self._incluir(f"C:{original}", original, cliente)
+        self._incluir(f"N:{cliente}", cliente, cliente)
+
+    def _desvincular(self, original: str) -> None:
+        cliente = self._contatos.pop(original, None)
+        if cliente is None:
+            return
+        self._excluir(f"C:{original}")
+        self._excluir(f"N:{cliente}")
+
+    def montar(self, mapeamento: Dict[str, str]) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._grams.clear()
+            self._contatos.clear()
+            for original, cliente in mapeamento.items():
+                if cliente:
+                    self._vincular(original, cliente)
+            self.montado = True
+
+    def atualizar(self, alteracoes: Dict[str, Optional[str]]) -> None:
+        """Aplica só os vínculos alterados (cliente None = removido)."""
+        with self._lock:
+            if not self.montado:
+                return
+            for original, cliente in alteracoes.items():
+                self._desvincular(original)
+                if cliente:
+                    self._vincular(original, cliente)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def sugerir(self, contato: str, limite: int = 5, score_minimo: float = SCORE_MINIMO) -> List[dict]:
+        """Melhores clientes para o contato: [{cliente, score, via}], um por cliente."""
+        norm = normalizar(contato)
+        grams = trigramas(norm)
+        if not grams:
+            return []
+
+        with self._lock:
+            contagem = Counter()
+            for g in grams:
+                for chave in self._grams.get(g, ()):
+                    contagem[chave] += 1
+            # Dice dos trigramas para escolher quem vai para a pontuação fina
+            candidatos = sorted(
+                contagem,
+                key=lambda c: -2 * contagem[c] / (len(grams) + len(self._entradas[c]["grams"])),
+            )[:MAX_CANDIDATOS]
+            entradas = [self._entradas[c] for c in candidatos]
+
+        melhores: Dict[str, dict] = {}
+        for entrada in entradas:
+            score = round(_pontuar(norm, entrada["texto"]), 1)
+            if score < score_minimo:
+                continue
+            atual = melhores.get(entrada["cliente"])
+            if atual is None or score > atual["score"]:
+                melhores[entrada["cliente"]] = {"cliente": entrada["cliente"], "score": score, "via": entrada["texto"]}
+
+        return sorted(melhores.values(), key=lambda s: (-s["score"], s["cliente"]))[:limite]
+
+
+_indice = IndiceSugestoes()
+_indice_lock = threading.Lock()
+
+
+def obter_indice() -> IndiceSugestoes:
+    """Índice global, montado na primeira chamada a partir do mapeamento em cache."""
+    if not _indice.montado:
+        with _indice_lock:
+            if not _indice.montado:
+                from backend.services.mapping_service import obter_mapeamento, registrar_ouvinte
+
+                _indice.montar(obter_mapeamento())
+                registrar_ouvinte(_indice.atualizar)
+    return _indice